@@ -20,6 +20,9 @@ from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.f
     FiscalSignature,
 )
 
+from erpnext_fiscalisation.profiles import get_profiles, get_signature_filter
+from erpnext_fiscalisation.unit_of_work import unit_of_work
+
 SIGNATURE_SCHEMA = {
     "type": "array",
     "items": {
@@ -52,16 +55,17 @@ SIGNATURE_SCHEMA = {
 
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
+@unit_of_work()
 def capture_signatures() -> Response:
     """Endpoint for the Fiscal Harmony platform to post fiscal signatures to.
 
+    The signatures, their PDFs and the log are committed together, once. The PDFs are fetched\
+        after every signature is saved, and one that fails is logged and skipped, so it can't\
+        lose the signatures.
+
     Returns:
         Response: Custom response based on validation of received payload."""
 
-    fiscal_harmony_settings: FiscalHarmonySettings = frappe.get_single(
-        "Fiscal Harmony Settings"
-    )
-
     # Prepare the response.
     response = Response(
         mimetype="application/json",
@@ -75,8 +79,18 @@ def capture_signatures() -> Response:
     # Retrieve the signature from headers.
     received_signature = frappe.get_request_header("X-Api-Signature")
 
-    # Verify the signature.
-    if fiscal_harmony_settings.test_signature(received_signature, raw_data):
+    # Verify the signature, which also tells which account the transactions belong to.
+    fiscal_harmony_settings: FiscalHarmonySettings | None = next(
+        (
+            profile
+            for profile in get_profiles(cached=True)
+            if profile.api_key and profile.test_signature(received_signature, raw_data)
+        ),
+        None,
+    )
+    if fiscal_harmony_settings is not None:
+        profile_name = fiscal_harmony_settings.get_profile_name()
+
         # Parse the JSON data.
         try:
             payload = json.loads(raw_data)
@@ -90,33 +104,22 @@ def capture_signatures() -> Response:
             log_data["response_status_code"] = 200
             log_data["status"] = "Success"
 
+            signatures_with_pdfs: list[FiscalSignature] = []
             for signature_data in payload:
                 signature: FiscalSignature = frappe.get_last_doc(
                     "Fiscal Signature",
-                    filters={"fiscal_harmony_id": signature_data["RequestId"]},
-                )
-                signature.is_retry = (
-                    signature_data["IsActionable"] and not signature_data["Success"]
-                )
-                if signature_data["Error"]:
-                    signature.error = signature_data["Error"]
-                elif signature.error:
-                    signature.error = ""
-
-                if qr_data := signature_data["QrData"]:
-                    signature.fdms_url = qr_data["QrCodeUrl"]
-                    signature.verification_code = qr_data["VerificationCode"]
-                    signature.fiscal_day = qr_data["FiscalDay"]
-                    signature.device_id = qr_data["DeviceId"]
-                    signature.invoice_number = qr_data["InvoiceNumber"]
-
-                signature.fiscal_harmony_filename = signature_data.get(
-                    "FiscalInvoicePdf",
-                    None,
+                    filters={
+                        "fiscal_harmony_id": signature_data["RequestId"],
+                        "fiscal_profile": get_signature_filter(profile_name),
+                    },
                 )
+                signature.set_fiscal_data(signature_data)
                 signature.save(ignore_permissions=True)
                 if signature.fiscal_harmony_filename:
-                    signature.download_or_generate_pdf()
+                    signatures_with_pdfs.append(signature)
+
+            for signature in signatures_with_pdfs:
+                _attach_pdf(signature)
 
         except json.JSONDecodeError:
             log_data["response"] = json.dumps(
@@ -190,3 +193,21 @@ def capture_signatures() -> Response:
     fh_log(log_data)
 
     return response
+
+
+def _attach_pdf(signature: FiscalSignature):
+    """Download or generate the PDF of a signature, undoing and logging any failure.
+
+    Args:
+        signature (FiscalSignature): The signature, already saved."""
+
+    frappe.db.savepoint("fiscal_pdf")
+    try:
+        signature.download_or_generate_pdf()
+
+    except Exception as exc:
+        frappe.db.rollback(save_point="fiscal_pdf")
+        frappe.log_error(
+            "Fiscal Harmony: PDF Download",
+            f"Failed to get the PDF of signature {signature.name}. Error {exc}",
+        )
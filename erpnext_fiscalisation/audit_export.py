@@ -0,0 +1,366 @@
+"""This module exports the fiscal records of a tax period for auditors.
+
+The signatures of invoices posted in the period, and the Fiscal Harmony logs written during it, are
+read through a server-side cursor and written row by row to gzipped CSV or JSON lines files, so
+memory use stays flat however many rows there are. Each file is saved as a private File once it is
+complete. The logs don't link to signatures, so each log row is given the invoice or credit note
+named in its payload, where there is one."""
+
+import csv
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import Iterable
+
+import frappe
+from frappe.query_builder import DocType
+from frappe.query_builder.functions import Count
+from frappe.utils import add_days, getdate, now_datetime
+
+FILE_FORMATS = ("csv", "jsonl")
+
+INVOICE_FIELDS = (
+    "posting_date",
+    "company",
+    "customer",
+    "is_return",
+    "return_against",
+    "currency",
+    "grand_total",
+)
+"""Fields of each signature's row that are read from its invoice."""
+
+SIGNATURE_FIELDS = (
+    "name",
+    "sales_invoice",
+    "posting_date",
+    "company",
+    "customer",
+    "is_return",
+    "return_against",
+    "currency",
+    "grand_total",
+    "fiscal_profile",
+    "state",
+    "fiscal_harmony_id",
+    "fdms_url",
+    "verification_code",
+    "device_id",
+    "fiscal_day",
+    "invoice_number",
+    "error",
+    "retry_attempts",
+    "creation",
+    "modified",
+)
+LOG_FIELDS = (
+    "name",
+    "timestamp",
+    "sales_invoice",
+    "status",
+    "response_status_code",
+    "signature_valid",
+    "request_url",
+    "request_id",
+    "error_details",
+    "payload",
+    "response",
+)
+
+__PROGRESS_INTERVAL = 10000
+"""Rows written between progress updates."""
+
+
+@frappe.whitelist()
+def enqueue_audit_export(from_date: str, to_date: str, file_format: str = "csv"):
+    """Queue an export of the signatures and logs of a tax period.
+
+    Args:
+        from_date (str): The first day of the period.
+        to_date (str): The last day of the period.
+        file_format (str, optional): Either "csv" or "jsonl". Defaults to "csv"."""
+
+    frappe.only_for("System Manager")
+
+    if file_format not in FILE_FORMATS:
+        frappe.throw(f"The export format must be one of {', '.join(FILE_FORMATS)}.")
+
+    frappe.enqueue(
+        export_audit_records,
+        queue="long",
+        timeout=6 * 60 * 60,
+        job_id=f"fiscal_audit_export::{from_date}::{to_date}::{file_format}",
+        deduplicate=True,
+        from_date=from_date,
+        to_date=to_date,
+        file_format=file_format,
+        notify_user=frappe.session.user,
+    )
+
+    frappe.msgprint(
+        "The audit export has been queued. You will be notified once it completes.",
+        title="Fiscal Audit Export",
+    )
+
+
+def export_audit_records(
+    from_date: str,
+    to_date: str,
+    file_format: str = "csv",
+    notify_user: str | None = None,
+) -> dict:
+    """Export the signatures and logs of a tax period to private Files.
+
+    Args:
+        from_date (str): The first day of the period.
+        to_date (str): The last day of the period.
+        file_format (str, optional): Either "csv" or "jsonl". Defaults to "csv".
+        notify_user (str | None, optional): User to notify with the summary. Defaults to None.
+
+    Returns:
+        dict: The number of signatures and logs, the File URLs and the time taken."""
+
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    start = time.monotonic()
+    stamp = now_datetime().strftime("%Y%m%d%H%M%S")
+    summary = {"signatures": 0, "logs": 0, "files": [], "seconds": 0.0}
+
+    for name, query, fields, transform in (
+        (
+            "signatures",
+            _get_signature_query(from_date, to_date),
+            SIGNATURE_FIELDS,
+            None,
+        ),
+        ("logs", _get_log_query(from_date, to_date), LOG_FIELDS, _add_sales_invoice),
+    ):
+        total = _count(query)
+        file_name = f"fiscal-{name}-{from_date}-{to_date}-{stamp}.{file_format}.gz"
+
+        # The cursor is unbuffered, so nothing else may query the database until it is drained.
+        with frappe.db.unbuffered_cursor():
+            rows = query.run(as_dict=True, as_iterator=True)
+            if transform:
+                rows = map(transform, rows)
+
+            summary[name] = _write_rows(
+                rows,
+                frappe.get_site_path("private", "files", file_name),
+                fields,
+                file_format,
+                f"Exporting Fiscal {name.capitalize()}",
+                total,
+            )
+
+        summary["files"].append(_save_file(file_name))
+        frappe.db.commit()
+
+    summary["seconds"] = round(time.monotonic() - start, 2)
+
+    if notify_user:
+        frappe.publish_realtime(
+            "msgprint",
+            {"message": format_summary(summary), "title": "Fiscal Audit Export"},
+            user=notify_user,
+        )
+
+    return summary
+
+
+def format_summary(summary: dict, html: bool = True) -> str:
+    """Describe the result of an export, including the Files it wrote.
+
+    Args:
+        summary (dict): Summary of the export.
+        html (bool, optional): Whether to link the Files, or list them as plain text. Defaults\
+            to True.
+
+    Returns:
+        str: The human readable summary."""
+
+    if html:
+        return (
+            f"Exported {summary['signatures']} signatures and {summary['logs']} logs in "
+            f"{summary['seconds']}s to:<br/>"
+            + "<br/>".join(f'<a href="{url}">{url}</a>' for url in summary["files"])
+        )
+
+    return (
+        f"Exported {summary['signatures']} signatures and {summary['logs']} logs in "
+        f"{summary['seconds']}s to:\n" + "\n".join(summary["files"])
+    )
+
+
+def _get_signature_query(from_date, to_date):
+    """Build the query of the signatures of invoices posted in a period.
+
+    Args:
+        from_date (date): The first day of the period.
+        to_date (date): The last day of the period.
+
+    Returns:
+        QueryBuilder: The query, in order of posting."""
+
+    signatures = DocType("Fiscal Signature")
+    invoices = DocType("Sales Invoice")
+
+    return (
+        frappe.qb.from_(signatures)
+        .join(invoices)
+        .on(invoices.name == signatures.sales_invoice)
+        .select(
+            *(
+                invoices[field] if field in INVOICE_FIELDS else signatures[field]
+                for field in SIGNATURE_FIELDS
+            )
+        )
+        .where(invoices.posting_date[from_date:to_date])
+        .orderby(invoices.posting_date)
+        .orderby(signatures.name)
+    )
+
+
+def _get_log_query(from_date, to_date):
+    """Build the query of the logs written in a period.
+
+    Args:
+        from_date (date): The first day of the period.
+        to_date (date): The last day of the period.
+
+    Returns:
+        QueryBuilder: The query, in order of writing."""
+
+    logs = DocType("Fiscal Harmony Log")
+
+    return (
+        frappe.qb.from_(logs)
+        .select(*(logs[field] for field in LOG_FIELDS if field != "sales_invoice"))
+        .where(logs.timestamp >= from_date)
+        .where(logs.timestamp < add_days(to_date, 1))
+        .orderby(logs.timestamp)
+        .orderby(logs.name)
+    )
+
+
+def _count(query) -> int:
+    """Count the rows a query returns, for reporting progress.
+
+    Args:
+        query (QueryBuilder): The query.
+
+    Returns:
+        int: The number of rows."""
+
+    return frappe.qb.from_(query).select(Count("*")).run()[0][0]
+
+
+def _add_sales_invoice(log: dict) -> dict:
+    """Add the invoice or credit note named in a log's payload to the log.
+
+    Args:
+        log (dict): The log row.
+
+    Returns:
+        dict: The log row."""
+
+    log["sales_invoice"] = None
+    try:
+        payload = json.loads(log.payload) if log.payload else None
+    except json.JSONDecodeError:
+        payload = None
+
+    if isinstance(payload, dict):
+        log["sales_invoice"] = payload.get("InvoiceId") or payload.get("CreditNoteId")
+
+    return log
+
+
+def _write_rows(
+    rows: Iterable[dict],
+    path: str,
+    fields: tuple[str, ...],
+    file_format: str,
+    title: str,
+    total: int,
+) -> int:
+    """Write rows to a gzipped file as they are read, publishing the progress.
+
+    Args:
+        rows (Iterable[dict]): The rows.
+        path (str): The file to write.
+        fields (tuple[str, ...]): The fields of each row to write, in order.
+        file_format (str): Either "csv" or "jsonl".
+        title (str): The title of the progress bar.
+        total (int): The number of rows expected.
+
+    Returns:
+        int: The number of rows written."""
+
+    written = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f) if file_format == "csv" else None
+        if writer:
+            writer.writerow(fields)
+
+        for row in rows:
+            if writer:
+                writer.writerow([row.get(field) for field in fields])
+            else:
+                data = {field: row.get(field) for field in fields}
+                f.write(json.dumps(data, default=str) + "\n")
+
+            written += 1
+            if written % __PROGRESS_INTERVAL == 0:
+                _publish_progress(title, written, total)
+
+    _publish_progress(title, written, total)
+
+    return written
+
+
+def _publish_progress(title: str, written: int, total: int):
+    """Publish the progress of an export to the user who started it.
+
+    Args:
+        title (str): The title of the progress bar.
+        written (int): The number of rows written so far.
+        total (int): The number of rows expected."""
+
+    frappe.publish_progress(
+        min(written * 100 / total, 100) if total else 100,
+        title=title,
+        description=f"{written} of {total} rows written.",
+    )
+
+
+def _save_file(file_name: str) -> str:
+    """Save a written export as a private File.
+
+    Args:
+        file_name (str): The name of the file in the private files folder.
+
+    Returns:
+        str: The URL of the File."""
+
+    # Hash it in chunks, or the File would read all of it into memory to hash it.
+    path = frappe.get_site_path("private", "files", file_name)
+    content_hash = hashlib.md5(usedforsecurity=False)
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            content_hash.update(chunk)
+
+    file = frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "is_private": True,
+            "file_size": os.path.getsize(path),
+            "content_hash": content_hash.hexdigest(),
+        }
+    )
+    file.insert(ignore_permissions=True)
+
+    return file.file_url
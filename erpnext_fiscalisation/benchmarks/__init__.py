@@ -0,0 +1 @@
+"""Benchmarks for the Fiscal Harmony integration, run via `bench execute`."""
@@ -0,0 +1,543 @@
+"""Measure the throughput of the fiscalisation pipeline, stage by stage.
+
+Synthetic invoices are submitted against a local Fiscal Harmony stand-in, so each one goes through
+`FiscalSalesInvoice.on_submit`, `fiscalise_transaction`, the `capture_signatures` webhook and the
+PDF download, all in this process. Every stage is timed and its queries counted, and the results
+can be written as JSON to compare releases.
+
+Run on a disposable site in developer mode, as the invoices and their PDFs are committed:
+    bench --site <site> execute erpnext_fiscalisation.benchmarks.fiscalisation.run \
+        --kwargs "{'line_counts': [1, 10, 100, 1000], 'output': 'fiscalisation.json'}"
+
+Requests are still subject to the rate limits in Fiscal Harmony Settings, so raise the Fiscalise
+and Download limits to measure the app rather than the limits."""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import json
+import math
+import time
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+import frappe
+from frappe.utils import now
+
+import erpnext
+
+import erpnext_fiscalisation
+from erpnext_fiscalisation.api import capture_signatures
+from erpnext_fiscalisation.device_status import refresh_device_status
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+    FiscalHarmonySettings,
+)
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.fiscal_signature import (
+    FiscalSignature,
+)
+from erpnext_fiscalisation.preflight import get_tax_codes
+from erpnext_fiscalisation.testing.fiscal_harmony_server import (
+    FiscalHarmonyStandIn,
+    StandInConfig,
+    start_in_background,
+)
+
+STAGES = ("submit", "fiscalise", "webhook", "pdf")
+"""Stages of the pipeline. Each stage's figures exclude the stages nested in it."""
+
+WEBHOOK_PATH = "/api/method/erpnext_fiscalisation.api.capture_signatures"
+
+
+class _StageRecorder:
+    """Times stages and counts their queries, excluding the time and queries of nested stages."""
+
+    def __init__(self):
+        self.durations: dict[str, list[float]] = defaultdict(list)
+        self.queries: dict[str, list[int]] = defaultdict(list)
+        self.__stack: list[list] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """Record the code run within the context as a stage.
+
+        Args:
+            name (str): The stage name."""
+
+        # The time spent in nested stages, and the queries run outside of them.
+        frame = [0.0, 0]
+        self.__stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+
+        finally:
+            elapsed = time.perf_counter() - start
+            self.__stack.pop()
+            if self.__stack:
+                self.__stack[-1][0] += elapsed
+
+            self.durations[name].append(elapsed - frame[0])
+            self.queries[name].append(frame[1])
+
+    def wrap(self, name: str, function):
+        """Wrap a function so that each call is recorded as a stage.
+
+        Args:
+            name (str): The stage name.
+            function (Callable): The function to wrap.
+
+        Returns:
+            Callable: The wrapped function."""
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    def count_query(self):
+        """Count a query against the innermost stage."""
+
+        if self.__stack:
+            self.__stack[-1][1] += 1
+
+
+def run(
+    line_counts: list[int] | None = None,
+    invoices: int = 20,
+    customers: int = 10,
+    items: int = 50,
+    latency: float = 0.0,
+    output: str | None = None,
+) -> dict:
+    """Fiscalise synthetic invoices of each size and report the figures of every stage.
+
+    Args:
+        line_counts (list[int] | None, optional): The number of lines per invoice to test.\
+            Defaults to 1, 10, 100 and 1000.
+        invoices (int, optional): Number of invoices of each size. Defaults to 20.
+        customers (int, optional): Number of synthetic customers to spread them across.\
+            Defaults to 10.
+        items (int, optional): Number of synthetic items to spread the lines across.\
+            Defaults to 50.
+        latency (float, optional): Seconds the stand-in adds to every response. Defaults to 0.
+        output (str | None, optional): A file to write the results to as JSON. Defaults to None.
+
+    Returns:
+        dict: The results, by number of lines."""
+
+    if not frappe.conf.developer_mode:
+        frappe.throw("The benchmark needs developer mode to use the local stand-in.")
+
+    line_counts = line_counts or [1, 10, 100, 1000]
+    fiscal_settings: FiscalHarmonySettings = frappe.get_doc("Fiscal Harmony Settings")
+    if fiscal_settings.disabled or not fiscal_settings.api_key:
+        frappe.throw("Fiscal Harmony Settings must be enabled with API details.")
+
+    masters = _get_masters(fiscal_settings, customers, items)
+    frappe.db.commit()
+
+    stand_in, server = start_in_background(
+        StandInConfig(
+            api_key=fiscal_settings.api_key,
+            api_secret=fiscal_settings.get_password("api_secret"),
+            latency=latency,
+        )
+    )
+    endpoint = fiscal_settings.endpoint
+    _set_endpoint(f"http://localhost:{server.server_port}/api")
+    refresh_device_status()
+
+    patched = {
+        (FiscalHarmonySettings, "fiscalise_transaction"): "fiscalise",
+        (FiscalSignature, "download_or_generate_pdf"): "pdf",
+    }
+    originals = {target: getattr(*target) for target in patched}
+    original_sql = frappe.db.sql
+
+    groups = []
+    try:
+        for line_count in line_counts:
+            recorder = _StageRecorder()
+            for (cls, attribute), stage in patched.items():
+                setattr(cls, attribute, recorder.wrap(stage, originals[cls, attribute]))
+
+            @functools.wraps(original_sql)
+            def sql(*args, **kwargs):
+                recorder.count_query()
+                return original_sql(*args, **kwargs)
+
+            frappe.db.sql = sql
+
+            groups.append(_run_group(stand_in, recorder, masters, line_count, invoices))
+
+    finally:
+        for (cls, attribute), function in originals.items():
+            setattr(cls, attribute, function)
+        del frappe.db.sql
+        frappe.local.request = None
+
+        server.shutdown()
+        _set_endpoint(endpoint)
+        frappe.db.commit()
+
+    results = {
+        "app_version": erpnext_fiscalisation.__version__,
+        "frappe_version": frappe.__version__,
+        "timestamp": now(),
+        "site": frappe.local.site,
+        "config": {
+            "invoices": invoices,
+            "customers": customers,
+            "items": items,
+            "latency": latency,
+        },
+        "groups": groups,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    _print_results(groups)
+
+    return results
+
+
+def _run_group(
+    stand_in: FiscalHarmonyStandIn,
+    recorder: _StageRecorder,
+    masters: dict,
+    line_count: int,
+    invoices: int,
+) -> dict:
+    """Fiscalise synthetic invoices of one size.
+
+    Args:
+        stand_in (FiscalHarmonyStandIn): The running stand-in.
+        recorder (_StageRecorder): The recorder for this group.
+        masters (dict): The synthetic master data.
+        line_count (int): Number of lines per invoice.
+        invoices (int): Number of invoices.
+
+    Returns:
+        dict: The figures of the group."""
+
+    end_to_end = []
+    failures = 0
+    start = time.perf_counter()
+
+    for index in range(invoices):
+        invoice = _make_invoice(masters, line_count, index)
+        invoice.insert()
+
+        invoice_start = time.perf_counter()
+        with recorder.stage("submit"):
+            invoice.submit()
+
+        request_id = frappe.db.get_value(
+            "Fiscal Signature", {"sales_invoice": invoice.name}, "fiscal_harmony_id"
+        )
+        if not request_id:
+            failures += 1
+            frappe.db.commit()
+            continue
+
+        body, headers = stand_in.build_webhook(stand_in.get_results([request_id]))
+        frappe.local.request = Request(
+            EnvironBuilder(
+                path=WEBHOOK_PATH, method="POST", data=body, headers=headers
+            ).get_environ()
+        )
+        with recorder.stage("webhook"):
+            capture_signatures()
+
+        end_to_end.append(time.perf_counter() - invoice_start)
+        frappe.db.commit()
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "lines": line_count,
+        "invoices": invoices,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "invoices_per_minute": round(invoices * 60 / elapsed, 2),
+        "lines_per_minute": round(invoices * line_count * 60 / elapsed, 2),
+        "end_to_end": _summarise(end_to_end),
+        "stages": {
+            stage: {
+                **_summarise(recorder.durations[stage]),
+                "queries_mean": round(
+                    sum(recorder.queries[stage]) / len(recorder.queries[stage]), 1
+                ),
+                "queries_max": max(recorder.queries[stage]),
+            }
+            for stage in STAGES
+            if recorder.durations[stage]
+        },
+    }
+
+
+def _summarise(durations: list[float]) -> dict:
+    """Summarise a list of durations.
+
+    Args:
+        durations (list[float]): Durations in seconds.
+
+    Returns:
+        dict: The count, and the mean, percentiles and maximum in milliseconds."""
+
+    if not durations:
+        return {"count": 0}
+
+    durations = sorted(durations)
+
+    def percentile(pct: float) -> float:
+        index = max(math.ceil(pct / 100 * len(durations)) - 1, 0)
+        return round(durations[index] * 1000, 2)
+
+    return {
+        "count": len(durations),
+        "mean_ms": round(sum(durations) * 1000 / len(durations), 2),
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": round(durations[-1] * 1000, 2),
+    }
+
+
+def _get_masters(
+    fiscal_settings: FiscalHarmonySettings, customers: int, items: int
+) -> dict:
+    """Create the synthetic customers and items, reusing those of earlier runs.
+
+    Args:
+        fiscal_settings (FiscalHarmonySettings): The Fiscal Harmony settings.
+        customers (int): Number of customers.
+        items (int): Number of items.
+
+    Returns:
+        dict: The company, tax template and names of the customers and items."""
+
+    company = erpnext.get_default_company()
+    if not company:
+        frappe.throw("Set a default company before running the benchmark.")
+
+    tax_codes, default_tax_code = get_tax_codes(fiscal_settings)
+    if not tax_codes:
+        frappe.throw("Map at least one tax template before running the benchmark.")
+
+    item_tax_templates = frappe.get_all(
+        "Item Tax Template",
+        filters={"name": ["in", list(tax_codes)], "company": company},
+        pluck="name",
+    )
+    sales_tax_template = frappe.db.get_value(
+        "Sales Taxes and Charges Template",
+        {"name": ["in", list(tax_codes)], "company": company},
+    )
+
+    hs_codes = frappe.get_all("Fiscal HS Code", pluck="name", limit=20)
+    if not hs_codes:
+        for code in ("84713000", "85171300", "30049000", "22021000"):
+            frappe.get_doc(
+                {
+                    "doctype": "Fiscal HS Code",
+                    "hs_code": code,
+                    "description": f"Benchmark HS Code {code}",
+                }
+            ).insert()
+            hs_codes.append(code)
+
+    item_group = frappe.db.get_value("Item Group", {"is_group": 0})
+    item_codes = []
+    for index in range(items):
+        item_code = f"FH-BENCH-{index:04d}"
+        if not frappe.db.exists("Item", item_code):
+            frappe.get_doc(
+                {
+                    "doctype": "Item",
+                    "item_code": item_code,
+                    "item_name": f"Benchmark Item {index}",
+                    "item_group": item_group,
+                    "stock_uom": "Nos",
+                    "is_stock_item": 0,
+                    "fh_hs_code": hs_codes[index % len(hs_codes)],
+                    "taxes": (
+                        [
+                            {
+                                "item_tax_template": item_tax_templates[
+                                    index % len(item_tax_templates)
+                                ]
+                            }
+                        ]
+                        if item_tax_templates
+                        else []
+                    ),
+                }
+            ).insert()
+        item_codes.append(item_code)
+
+    buyers = []
+    for index in range(customers):
+        buyers.append(_get_customer(index))
+
+    return {
+        "company": company,
+        "sales_tax_template": sales_tax_template or default_tax_code,
+        "items": item_codes,
+        "buyers": buyers,
+    }
+
+
+def _get_customer(index: int) -> tuple[str, str, str]:
+    """Create a synthetic customer with a contact and address, unless it exists.
+
+    Companies are given a TIN, and individuals are sent as cash sales.
+
+    Args:
+        index (int): The number of the customer.
+
+    Returns:
+        tuple[str, str, str]: The customer, contact and address names."""
+
+    customer_name = f"FH Bench Customer {index}"
+    if not frappe.db.exists("Customer", customer_name):
+        is_company = index % 2 == 0
+        frappe.get_doc(
+            {
+                "doctype": "Customer",
+                "customer_name": customer_name,
+                "customer_type": "Company" if is_company else "Individual",
+                "tin_number": f"2000{index:06d}" if is_company else None,
+            }
+        ).insert()
+
+    links = [{"link_doctype": "Customer", "link_name": customer_name}]
+    contact = frappe.db.get_value(
+        "Dynamic Link",
+        {
+            "parenttype": "Contact",
+            "link_doctype": "Customer",
+            "link_name": customer_name,
+        },
+        "parent",
+    )
+    if not contact:
+        contact = (
+            frappe.get_doc(
+                {
+                    "doctype": "Contact",
+                    "first_name": customer_name,
+                    "email_ids": [
+                        {"email_id": f"bench{index}@example.com", "is_primary": 1}
+                    ],
+                    "phone_nos": [
+                        {"phone": f"+26377{index:07d}", "is_primary_phone": 1}
+                    ],
+                    "links": links,
+                }
+            )
+            .insert()
+            .name
+        )
+
+    address = frappe.db.get_value(
+        "Dynamic Link",
+        {
+            "parenttype": "Address",
+            "link_doctype": "Customer",
+            "link_name": customer_name,
+        },
+        "parent",
+    )
+    if not address:
+        address = (
+            frappe.get_doc(
+                {
+                    "doctype": "Address",
+                    "address_title": customer_name,
+                    "address_type": "Billing",
+                    "address_line1": f"{index + 1} Samora Machel Avenue",
+                    "city": "Harare",
+                    "country": "Zimbabwe",
+                    "links": links,
+                }
+            )
+            .insert()
+            .name
+        )
+
+    return customer_name, contact, address
+
+
+def _make_invoice(masters: dict, line_count: int, index: int):
+    """Build a synthetic invoice.
+
+    Args:
+        masters (dict): The synthetic master data.
+        line_count (int): Number of lines.
+        index (int): The number of the invoice, to vary the customer and items.
+
+    Returns:
+        SalesInvoice: The unsaved invoice."""
+
+    customer, contact, address = masters["buyers"][index % len(masters["buyers"])]
+    item_codes = masters["items"]
+
+    invoice = frappe.get_doc(
+        {
+            "doctype": "Sales Invoice",
+            "company": masters["company"],
+            "customer": customer,
+            "contact_person": contact,
+            "customer_address": address,
+            "taxes_and_charges": masters["sales_tax_template"],
+            "items": [
+                {
+                    "item_code": item_codes[(index + line) % len(item_codes)],
+                    "qty": 1 + line % 5,
+                    "rate": 10 + (line % 7) * 2.5,
+                }
+                for line in range(line_count)
+            ],
+        }
+    )
+    invoice.set_missing_values()
+
+    return invoice
+
+
+def _set_endpoint(endpoint: str):
+    """Point Fiscal Harmony Settings at an endpoint.
+
+    Args:
+        endpoint (str): The endpoint URL."""
+
+    frappe.db.set_single_value("Fiscal Harmony Settings", "endpoint", endpoint)
+    frappe.clear_document_cache("Fiscal Harmony Settings", "Fiscal Harmony Settings")
+
+
+def _print_results(groups: list[dict]):
+    """Print a table of the results.
+
+    Args:
+        groups (list[dict]): The figures of each invoice size."""
+
+    print(
+        f"{'Lines':>6}{'Stage':>11}{'Mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'Queries':>9}"
+    )
+    for group in groups:
+        for stage, figures in group["stages"].items():
+            print(
+                f"{group['lines']:>6}{stage:>11}{figures['mean_ms']:>10}"
+                f"{figures['p50_ms']:>10}{figures['p99_ms']:>10}"
+                f"{figures['queries_mean']:>9}"
+            )
+
+        print(
+            f"{group['lines']:>6}: {group['invoices_per_minute']} invoices per minute, "
+            f"{group['failures']} failed"
+        )
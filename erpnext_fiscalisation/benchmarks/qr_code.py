@@ -0,0 +1,116 @@
+"""Compare QR code output settings by render time and resulting PDF size.
+
+Run with:
+    bench --site <site> execute erpnext_fiscalisation.benchmarks.qr_code.run \
+        --kwargs "{'invoice': 'ACC-SINV-2025-00001'}"
+
+When no invoice is given, each QR code is printed on an otherwise empty page so that the PDF
+size reflects the QR code alone."""
+
+import itertools
+import time
+
+import frappe
+from frappe.utils.pdf import get_pdf
+
+from erpnext_fiscalisation.print_api import render_qr_code
+
+SAMPLE_URL = "https://fdms.zimra.co.zw/0000012345/01102025/0000000123/ABCD1234EFGH5678"
+"""Representative FDMS verification URL used when no invoice is given."""
+
+CONFIGURATIONS = [
+    {
+        "output_format": output_format,
+        "error_correction": error_correction,
+        "box_size": box_size,
+        "border": border,
+    }
+    for output_format, error_correction, (box_size, border) in itertools.product(
+        ("PNG", "SVG"),
+        ("L", "M"),
+        ((10, 4), (4, 1)),
+    )
+]
+
+
+def run(invoice: str | None = None, iterations: int = 50) -> list[dict]:
+    """Benchmark each QR code configuration.
+
+    Args:
+        invoice (str | None, optional): A fiscalised Sales Invoice to print with its default print\
+            format. Defaults to None.
+        iterations (int, optional): Number of renders to average over. Defaults to 50.
+
+    Returns:
+        list[dict]: One result per configuration."""
+
+    fdms_url = SAMPLE_URL
+    if invoice:
+        fdms_url = (
+            frappe.get_value("Fiscal Signature", {"sales_invoice": invoice}, "fdms_url")
+            or SAMPLE_URL
+        )
+
+    results = []
+    try:
+        for config in CONFIGURATIONS:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                data_uri = render_qr_code(fdms_url, **config)
+            render_ms = (time.perf_counter() - start) * 1000 / iterations
+
+            start = time.perf_counter()
+            if invoice:
+                _apply_settings(config)
+                pdf = frappe.get_print("Sales Invoice", invoice, as_pdf=True)
+            else:
+                pdf = get_pdf(f'<img src="{data_uri}" style="width: 30mm">')
+            pdf_ms = (time.perf_counter() - start) * 1000
+
+            results.append(
+                {
+                    **config,
+                    "render_ms": round(render_ms, 3),
+                    "data_uri_bytes": len(data_uri),
+                    "pdf_ms": round(pdf_ms, 1),
+                    "pdf_bytes": len(pdf),
+                }
+            )
+
+    finally:
+        # Settings are only changed to print the invoice, never persisted.
+        frappe.db.rollback()
+        frappe.clear_document_cache(
+            "Fiscal Harmony Settings", "Fiscal Harmony Settings"
+        )
+
+    print(
+        f"{'Format':<7}{'EC':<4}{'Box':>4}{'Border':>7}"
+        f"{'Render ms':>11}{'URI bytes':>11}{'PDF ms':>9}{'PDF bytes':>11}"
+    )
+    for result in results:
+        print(
+            f"{result['output_format']:<7}{result['error_correction']:<4}"
+            f"{result['box_size']:>4}{result['border']:>7}"
+            f"{result['render_ms']:>11}{result['data_uri_bytes']:>11}"
+            f"{result['pdf_ms']:>9}{result['pdf_bytes']:>11}"
+        )
+
+    return results
+
+
+def _apply_settings(config: dict):
+    """Temporarily apply a QR code configuration to Fiscal Harmony Settings.
+
+    Args:
+        config (dict): The configuration to apply."""
+
+    for key, value in {
+        "qr_code_format": config["output_format"],
+        "qr_error_correction": config["error_correction"],
+        "qr_box_size": config["box_size"],
+        "qr_border": config["border"],
+    }.items():
+        frappe.db.set_single_value("Fiscal Harmony Settings", key, value)
+
+    frappe.clear_document_cache("Fiscal Harmony Settings", "Fiscal Harmony Settings")
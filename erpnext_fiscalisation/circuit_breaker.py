@@ -0,0 +1,167 @@
+"""This module stops requests to Fiscal Harmony while it is known to be failing.
+
+The breaker state is kept in Redis, so it is shared by all workers. It is closed while requests
+succeed, and opens once enough requests fail within a minute. While open, requests fail straight
+away with `CircuitOpenError` instead of waiting out their timeout. After a cooldown the breaker is
+half-open, and a single probe request is let through. Its result closes the breaker again or
+restarts the cooldown."""
+
+from typing import TYPE_CHECKING
+
+import requests
+
+import frappe
+
+from erpnext_fiscalisation.profiles import get_profile_key
+
+if TYPE_CHECKING:
+    from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+        FiscalHarmonySettings,
+    )
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request while the circuit breaker is open.
+
+    It is a connection error, so callers treat it like Fiscal Harmony being unreachable, such as\
+        marking a signature for retry."""
+
+
+class CircuitBreaker:
+    """The circuit breaker shared by all requests to Fiscal Harmony from one account.
+
+    The Redis keys and client are resolved when it is created, so it must be created on a thread\
+        with a site context, but can then be used from worker threads."""
+
+    __STATE_KEY = "fiscal_harmony_circuit"
+    __FAILURES_KEY = "fiscal_harmony_circuit_failures"
+    __PROBE_KEY = "fiscal_harmony_circuit_probe"
+    __FAILURE_WINDOW = 60
+    """Seconds within which failures are counted towards opening the breaker."""
+    __PROBE_TIMEOUT = 60
+    """Seconds before another probe is allowed if a probe never reports back."""
+    __ALLOW_SCRIPT = """
+        local state = redis.call("HGET", KEYS[1], "state") or "closed"
+        if state == "closed" then
+            return state
+        end
+
+        local time = redis.call("TIME")
+        local opened_at = tonumber(redis.call("HGET", KEYS[1], "opened_at")) or 0
+        if tonumber(time[1]) - opened_at < tonumber(ARGV[1]) then
+            return "open"
+        end
+
+        -- Let a single probe through once the cooldown has passed.
+        if redis.call("SET", KEYS[2], "1", "NX", "EX", ARGV[2]) then
+            redis.call("HSET", KEYS[1], "state", "half-open")
+            return "half-open"
+        end
+
+        return "open"
+    """
+    __FAILURE_SCRIPT = """
+        local state = redis.call("HGET", KEYS[1], "state") or "closed"
+        local time = redis.call("TIME")
+
+        -- Failures of requests sent before the breaker opened don't extend the cooldown.
+        if state == "open" then
+            return state
+        end
+
+        if state == "closed" then
+            local failures = redis.call("INCR", KEYS[3])
+            if failures == 1 then
+                redis.call("EXPIRE", KEYS[3], ARGV[2])
+            end
+            if failures < tonumber(ARGV[1]) then
+                return state
+            end
+        end
+
+        redis.call("HSET", KEYS[1], "state", "open", "opened_at", time[1])
+        redis.call("DEL", KEYS[2], KEYS[3])
+
+        return "open"
+    """
+
+    def __init__(self, profile_name: str | None = None):
+        """Create a handle on the shared circuit breaker of an account.
+
+        Args:
+            profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+                default account. Defaults to None."""
+
+        fiscal_settings: FiscalHarmonySettings = frappe.get_cached_doc(
+            "Fiscal Harmony Settings"
+        )
+        self.failure_threshold = fiscal_settings.circuit_failure_threshold or 5
+        self.open_seconds = fiscal_settings.circuit_open_seconds or 60
+
+        self.__keys = [
+            frappe.cache.make_key(get_profile_key(key, profile_name))
+            for key in (
+                CircuitBreaker.__STATE_KEY,
+                CircuitBreaker.__PROBE_KEY,
+                CircuitBreaker.__FAILURES_KEY,
+            )
+        ]
+        self.__pipeline = frappe.cache.pipeline
+        self.__allow_script = frappe.cache.register_script(
+            CircuitBreaker.__ALLOW_SCRIPT
+        )
+        self.__failure_script = frappe.cache.register_script(
+            CircuitBreaker.__FAILURE_SCRIPT
+        )
+
+    def before_request(self) -> str:
+        """Check that a request may be sent.
+
+        Returns:
+            str: "closed", or "half-open" if the request is the probe.
+
+        Raises:
+            CircuitOpenError: If the breaker is open."""
+
+        state = self.__allow_script(
+            keys=self.__keys[:2],
+            args=[self.open_seconds, CircuitBreaker.__PROBE_TIMEOUT],
+        ).decode()
+        if state == "open":
+            raise CircuitOpenError(
+                "Fiscal Harmony is unavailable, so the request was not sent. It will be "
+                f"tried again within {self.open_seconds} seconds."
+            )
+
+        return state
+
+    def record_success(self, state: str):
+        """Record a request that reached Fiscal Harmony.
+
+        Args:
+            state (str): The state returned by `before_request`."""
+
+        if state == "half-open":
+            pipeline = self.__pipeline()
+            pipeline.delete(*self.__keys)
+            pipeline.execute()
+
+    def record_failure(self):
+        """Record a request that failed because Fiscal Harmony is unavailable."""
+
+        self.__failure_script(
+            keys=self.__keys,
+            args=[self.failure_threshold, CircuitBreaker.__FAILURE_WINDOW],
+        )
+
+    def is_open(self) -> bool:
+        """Check whether requests are currently being blocked, without taking the probe.
+
+        Returns:
+            bool: Whether the breaker is open or half-open."""
+
+        pipeline = self.__pipeline()
+        pipeline.hget(self.__keys[0], "state")
+        (state,) = pipeline.execute()
+
+        return state is not None and state.decode() != "closed"
@@ -0,0 +1,197 @@
+"""This module defines bench commands for the Fiscal Harmony integration."""
+
+import click
+
+from frappe.commands import get_site, pass_context
+
+
+@click.command("backfill-fiscal-pdfs")
+@click.option("--from-date", required=True, help="First posting date to include.")
+@click.option("--to-date", required=True, help="Last posting date to include.")
+@click.option("--batch-size", default=100, help="Signatures processed per batch.")
+@click.option("--workers", default=4, help="Number of concurrent downloads.")
+@click.option("--rate", default=5.0, help="Maximum downloads started per second.")
+@click.option("--restart", is_flag=True, help="Ignore any previous checkpoint.")
+@pass_context
+def backfill_fiscal_pdfs(
+    context,
+    from_date: str,
+    to_date: str,
+    batch_size: int,
+    workers: int,
+    rate: float,
+    restart: bool,
+):
+    """Download and archive fiscal PDFs missing from signatures in a date range."""
+
+    import frappe
+
+    from erpnext_fiscalisation.pdf_backfill import (
+        backfill_fiscal_pdfs as backfill,
+        format_summary,
+    )
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        summary = backfill(
+            from_date,
+            to_date,
+            batch_size=batch_size,
+            max_workers=workers,
+            requests_per_second=rate,
+            restart=restart,
+        )
+        click.echo(format_summary(summary))
+    finally:
+        frappe.destroy()
+
+
+@click.command("export-fiscal-audit")
+@click.option("--from-date", required=True, help="First day of the tax period.")
+@click.option("--to-date", required=True, help="Last day of the tax period.")
+@click.option(
+    "--format", "file_format", type=click.Choice(["csv", "jsonl"]), default="csv"
+)
+@pass_context
+def export_fiscal_audit(context, from_date: str, to_date: str, file_format: str):
+    """Export the signatures and logs of a tax period to private Files."""
+
+    import frappe
+
+    from erpnext_fiscalisation.audit_export import export_audit_records, format_summary
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        summary = export_audit_records(from_date, to_date, file_format=file_format)
+        click.echo(format_summary(summary, html=False))
+    finally:
+        frappe.destroy()
+
+
+@click.command("run-fiscal-harmony-stand-in")
+@click.option("--api-key", required=True, help="API key that requests must use.")
+@click.option("--api-secret", required=True, help="API secret to check signatures.")
+@click.option("--webhook-url", help="URL of capture_signatures to post results to.")
+@click.option("--host", default="localhost", help="Interface to listen on.")
+@click.option("--port", default=8010, help="Port to listen on.")
+@click.option("--latency", default=0.0, help="Seconds added to every response.")
+@click.option("--jitter", default=0.0, help="Random extra seconds, up to this much.")
+@click.option("--error-rate", default=0.0, help="Fraction of requests that fail.")
+@click.option("--error-status", default=503, help="Status code of injected errors.")
+@click.option("--fail-rate", default=0.0, help="Fraction of transactions rejected.")
+@click.option("--webhook-delay", default=0.5, help="Seconds before posting results.")
+@click.option(
+    "--webhook-drop-rate", default=0.0, help="Fraction of results not posted."
+)
+def run_fiscal_harmony_stand_in(
+    api_key: str,
+    api_secret: str,
+    webhook_url: str | None,
+    host: str,
+    port: int,
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    error_status: int,
+    fail_rate: float,
+    webhook_delay: float,
+    webhook_drop_rate: float,
+):
+    """Serve a local stand-in for the Fiscal Harmony API for testing."""
+
+    from erpnext_fiscalisation.testing.fiscal_harmony_server import (
+        StandInConfig,
+        serve,
+    )
+
+    config = StandInConfig(
+        api_key=api_key,
+        api_secret=api_secret,
+        webhook_url=webhook_url,
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        error_status=error_status,
+        fail_rate=fail_rate,
+        webhook_delay=webhook_delay,
+        webhook_drop_rate=webhook_drop_rate,
+    )
+    serve(config, host=host, port=port)
+
+
+@click.command("export-fiscal-harmony-trace")
+@click.option("--from", "from_datetime", required=True, help="Start of the window.")
+@click.option("--to", "to_datetime", required=True, help="End of the window.")
+@click.option("--output", required=True, help="Trace file to write.")
+@click.option("--keep-buyers", is_flag=True, help="Don't anonymise buyer details.")
+@pass_context
+def export_fiscal_harmony_trace(
+    context, from_datetime: str, to_datetime: str, output: str, keep_buyers: bool
+):
+    """Export logged Fiscal Harmony requests in a time window to a trace file."""
+
+    import frappe
+
+    from erpnext_fiscalisation.testing.replay import export_trace
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        count = export_trace(
+            from_datetime, to_datetime, output, anonymise=not keep_buyers
+        )
+        click.echo(f"Exported {count} requests to {output}.")
+    finally:
+        frappe.destroy()
+
+
+@click.command("replay-fiscal-harmony-trace")
+@click.argument("trace")
+@click.option("--rate", default=1.0, help="How many times faster than recorded.")
+@click.option("--workers", default=16, help="Maximum requests in flight.")
+@click.option("--endpoint", help="Stand-in to replay against, else one is started.")
+@click.option("--api-key", default="replay", help="API key of the stand-in.")
+@click.option("--api-secret", default="replay", help="API secret of the stand-in.")
+@click.option("--output", help="File to write the results to as JSON.")
+def replay_fiscal_harmony_trace(
+    trace: str,
+    rate: float,
+    workers: int,
+    endpoint: str | None,
+    api_key: str,
+    api_secret: str,
+    output: str | None,
+):
+    """Replay a trace against the local Fiscal Harmony stand-in."""
+
+    import json
+
+    from erpnext_fiscalisation.testing.replay import replay_trace
+
+    results = replay_trace(
+        trace,
+        rate=rate,
+        workers=workers,
+        endpoint=endpoint,
+        api_key=api_key,
+        api_secret=api_secret,
+        output=output,
+    )
+    click.echo(json.dumps(results, indent=2))
+
+
+commands = [
+    backfill_fiscal_pdfs,
+    export_fiscal_audit,
+    run_fiscal_harmony_stand_in,
+    export_fiscal_harmony_trace,
+    replay_fiscal_harmony_trace,
+]
@@ -0,0 +1,127 @@
+"""This module provides cached currency lookups for building and checking fiscal payloads.
+
+The currencies supported by each Fiscal Harmony account are cached in Redis, apart from other
+accounts, and refreshed by a scheduled job. The currency mappings are read from the cached settings
+or profile, so neither needs a request per transaction."""
+
+from typing import TYPE_CHECKING
+
+import requests
+
+import frappe
+
+from erpnext_fiscalisation.profiles import get_profile, get_profile_key, get_profiles
+
+if TYPE_CHECKING:
+    from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+        FiscalHarmonySettings,
+    )
+
+__SUPPORTED_KEY = "fiscal_harmony_supported_currencies"
+__SUPPORTED_TTL = 24 * 60 * 60
+"""Lifetime of the cached supported currencies, long enough to outlast an outage of the API."""
+
+_currency_maps: dict[tuple[str, str | None], tuple[str, dict[str, str]]] = {}
+"""Currency mappings by site and profile, along with the modified time they were built from."""
+
+
+def get_supported_currencies(profile_name: str | None = None) -> set[str] | None:
+    """Get the cached currencies supported by an account's Fiscal Harmony device.
+
+    This never makes a request, so an outage of the API can't slow down transactions.
+
+    Args:
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None.
+
+    Returns:
+        set[str] | None: The supported currency codes, or None if they are unknown."""
+
+    currencies = frappe.cache.get_value(get_profile_key(__SUPPORTED_KEY, profile_name))
+
+    return set(currencies) if currencies is not None else None
+
+
+def set_supported_currencies(currencies: list[str], profile_name: str | None = None):
+    """Cache the currencies supported by an account's Fiscal Harmony device.
+
+    Args:
+        currencies (list[str]): The supported currency codes.
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None."""
+
+    frappe.cache.set_value(
+        get_profile_key(__SUPPORTED_KEY, profile_name),
+        currencies,
+        expires_in_sec=__SUPPORTED_TTL,
+    )
+
+
+def refresh_supported_currencies():
+    """Fetch and cache the currencies supported by every account.
+
+    An account whose fetch fails keeps its cached currencies."""
+
+    fiscal_settings: FiscalHarmonySettings = frappe.get_cached_doc(
+        "Fiscal Harmony Settings"
+    )
+    if fiscal_settings.disabled:
+        return
+
+    for profile in get_profiles(cached=True):
+        if not profile.api_key:
+            continue
+
+        try:
+            currencies = profile.fetch_supported_currencies()
+        except (frappe.ValidationError, requests.exceptions.RequestException):
+            continue
+
+        set_supported_currencies(currencies, profile.get_profile_name())
+
+
+def get_fiscal_currency(currency: str, profile_name: str | None = None) -> str | None:
+    """Look up the Fiscal Harmony currency a system currency is mapped to.
+
+    If no currencies are mapped, every currency is sent as is.
+
+    Args:
+        currency (str): The system currency code.
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None.
+
+    Returns:
+        str | None: The Fiscal Harmony currency code, or None if it isn't mapped."""
+
+    currency_map = get_currency_map(profile_name)
+    if not currency_map:
+        return currency
+
+    return currency_map.get(currency)
+
+
+def get_currency_map(profile_name: str | None = None) -> dict[str, str]:
+    """Get the currency mappings of an account, rebuilding them only when they change.
+
+    Args:
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None.
+
+    Returns:
+        dict[str, str]: Fiscal Harmony currency codes by system currency."""
+
+    fiscal_settings: FiscalHarmonySettings = get_profile(profile_name, cached=True)
+    modified = str(fiscal_settings.modified)
+    key = (frappe.local.site, profile_name)
+
+    cached = _currency_maps.get(key)
+    if cached and cached[0] == modified:
+        return cached[1]
+
+    currency_map = {
+        mapping.system_currency: mapping.fiscal_harmony_currency
+        for mapping in fiscal_settings.currency_mappings
+    }
+    _currency_maps[key] = (modified, currency_map)
+
+    return currency_map
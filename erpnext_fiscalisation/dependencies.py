@@ -0,0 +1,141 @@
+"""This module schedules credit notes after the invoices they are made against.
+
+Fiscal Harmony rejects a credit note whose original invoice it hasn't fiscalised, so sending one
+early only wastes a request and a retry cycle. Instead, the credit note's signature records the
+signature it is waiting for, and sends nothing. Once that signature is fiscalised, each credit note
+waiting for it is released in a job of its own, so they run in parallel with each other and with
+every transaction that doesn't wait on anything. If the invoice stops in a state that won't be
+retried automatically, its credit notes record why, so they don't wait unnoticed."""
+
+from typing import TYPE_CHECKING
+
+import frappe
+from frappe.query_builder import DocType
+
+from erpnext_fiscalisation.unit_of_work import unit_of_work
+
+STUCK_STATES = ("Error", "Dead Letter")
+"""States of an invoice's signature that need someone to retry it before its credit notes can go."""
+
+if TYPE_CHECKING:
+    from erpnext.accounts.doctype.sales_invoice.sales_invoice import SalesInvoice
+
+    from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.fiscal_signature import (
+        FiscalSignature,
+    )
+
+
+def get_unfiscalised_original(transaction: "SalesInvoice") -> str | None:
+    """Find the signature a credit note must wait for before it is sent.
+
+    Invoices fiscalised before the integration was installed have no signature, and aren't waited\
+        for.
+
+    Args:
+        transaction (SalesInvoice): The invoice or credit note.
+
+    Returns:
+        str | None: The signature of the credit note's invoice, or None if it is an invoice, or\
+            its invoice has been fiscalised."""
+
+    if not transaction.is_return or not transaction.return_against:
+        return None
+
+    original = frappe.db.get_value(
+        "Fiscal Signature",
+        {"sales_invoice": transaction.return_against},
+        ["name", "fdms_url"],
+        as_dict=True,
+    )
+    if original is None or original.fdms_url:
+        return None
+
+    return original.name
+
+
+def get_waiting_error(original: str) -> str | None:
+    """Describe why a credit note can't be sent yet, if its invoice needs to be retried.
+
+    Args:
+        original (str): The signature of the invoice.
+
+    Returns:
+        str | None: The error to record on the credit note, or None if its invoice may still be\
+            fiscalised without anyone retrying it."""
+
+    sales_invoice, state = frappe.db.get_value(
+        "Fiscal Signature", original, ["sales_invoice", "state"]
+    )
+    if state not in STUCK_STATES:
+        return None
+
+    return f"Waiting for {sales_invoice}, which is in {state} and must be retried."
+
+
+def flag_dependents(signature: "FiscalSignature"):
+    """Record on the credit notes waiting for a signature that it needs to be retried.
+
+    Args:
+        signature (FiscalSignature): The signature of the invoice, which is stuck."""
+
+    signatures = DocType("Fiscal Signature")
+    (
+        frappe.qb.update(signatures)
+        .set(signatures.error, get_waiting_error(signature.name))
+        .where(signatures.awaiting_signature == signature.name)
+    ).run()
+
+
+def release_dependents(signature_name: str):
+    """Send the credit notes that were waiting for a signature to be fiscalised.
+
+    Args:
+        signature_name (str): The signature of the invoice."""
+
+    for name in frappe.get_all(
+        "Fiscal Signature",
+        filters={"awaiting_signature": signature_name},
+        pluck="name",
+    ):
+        frappe.enqueue(
+            send_dependent,
+            queue="short",
+            job_id=f"fiscal_harmony_dependent::{name}",
+            deduplicate=True,
+            enqueue_after_commit=True,
+            name=name,
+        )
+
+
+def release_ready_dependents():
+    """Release credit notes whose invoice has been fiscalised, in case their release was missed\
+        or its job was lost."""
+
+    signatures = DocType("Fiscal Signature")
+    originals = DocType("Fiscal Signature").as_("original")
+    names = (
+        frappe.qb.from_(signatures)
+        .join(originals)
+        .on(originals.name == signatures.awaiting_signature)
+        .select(signatures.awaiting_signature)
+        .distinct()
+        .where(originals.fdms_url.isnotnull() & (originals.fdms_url != ""))
+    ).run(pluck=True)
+
+    for name in names:
+        release_dependents(name)
+
+
+def send_dependent(name: str):
+    """Send a credit note that was waiting for its invoice.
+
+    Args:
+        name (str): Name of the credit note's Fiscal Signature."""
+
+    signature: FiscalSignature = frappe.get_doc("Fiscal Signature", name)
+    if not signature.awaiting_signature:
+        return
+
+    with unit_of_work():
+        signature.db_set({"awaiting_signature": None, "error": None})
+        signature.retry_automatically()
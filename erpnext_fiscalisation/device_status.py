@@ -0,0 +1,119 @@
+"""This module tracks whether the fiscal device is able to accept transactions.
+
+A scheduled job checks the device and caches the result with a lifetime, so fiscalisation can gate
+on it without a request of its own. An expired status is treated as unknown, and the device is
+assumed to be available until a check says otherwise."""
+
+import frappe
+from frappe.query_builder import DocType
+from frappe.utils import now_datetime
+
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+    FiscalHarmonySettings,
+)
+from erpnext_fiscalisation.profiles import get_profile_key, get_profiles
+from erpnext_fiscalisation.unit_of_work import commit
+
+__STATUS_KEY = "fiscal_harmony_device_status"
+
+
+def get_device_status(profile_name: str | None = None) -> dict | None:
+    """Get the cached status of an account's fiscal device.
+
+    Args:
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None.
+
+    Returns:
+        dict | None: Whether the device is available, the reason if not, the device data and when\
+            it was checked. None if the status is unknown or has expired."""
+
+    return frappe.cache.get_value(get_profile_key(__STATUS_KEY, profile_name))
+
+
+def is_device_available(profile_name: str | None = None) -> bool:
+    """Check whether transactions can be sent to an account's fiscal device.
+
+    Args:
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None.
+
+    Returns:
+        bool: False only if the device is known to be unavailable."""
+
+    status = get_device_status(profile_name)
+
+    return status is None or status["available"]
+
+
+def refresh_device_status():
+    """Check the fiscal device of every account and cache its status, releasing held\
+        transactions if it is available."""
+
+    fiscal_settings: FiscalHarmonySettings = frappe.get_doc("Fiscal Harmony Settings")
+    if fiscal_settings.disabled:
+        return
+
+    for profile in get_profiles():
+        if profile.api_key:
+            _refresh_device_status(profile, fiscal_settings.device_status_ttl or 300)
+
+
+def _refresh_device_status(profile: FiscalHarmonySettings, ttl: int):
+    """Check the fiscal device of an account and cache its status.
+
+    Args:
+        profile (FiscalHarmonySettings): The account.
+        ttl (int): Seconds the status is cached for."""
+
+    profile_name = profile.get_profile_name()
+    previous = get_device_status(profile_name)
+    status = profile.fetch_device_status()
+    status["checked_at"] = str(now_datetime())
+
+    frappe.cache.set_value(
+        get_profile_key(__STATUS_KEY, profile_name),
+        status,
+        expires_in_sec=ttl,
+    )
+
+    if status["available"]:
+        release_held_signatures(profile_name)
+
+    elif previous is None or previous["available"]:
+        frappe.log_error(
+            title="Fiscal Device Unavailable",
+            message=(
+                f"Transactions of {profile_name or 'the default account'} will be held "
+                f"until the device recovers.\n\n{status['reason']}"
+            ),
+        )
+
+
+def release_held_signatures(profile_name: str | None = None):
+    """Queue every held signature of an account for retry.
+
+    They are found through the (state, creation) index, so the rest of the table isn't scanned.
+
+    Args:
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None."""
+
+    signatures = DocType("Fiscal Signature")
+    account = (
+        signatures.fiscal_profile == profile_name
+        if profile_name
+        else signatures.fiscal_profile.isnull()
+    )
+    (
+        frappe.qb.update(signatures)
+        .set(signatures.on_hold, 0)
+        .set(signatures.is_retry, 1)
+        .set(signatures.next_retry_at, None)
+        .set(signatures.state, "Needs Retry")
+        .where(signatures.state == "On Hold")
+        .where(signatures.on_hold == 1)
+        .where(account)
+    ).run()
+
+    commit()
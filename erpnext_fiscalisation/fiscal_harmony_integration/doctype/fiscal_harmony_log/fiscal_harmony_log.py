@@ -6,6 +6,8 @@ from typing import TYPE_CHECKING, TypedDict, Optional
 import frappe
 from frappe.model.document import Document
 
+from erpnext_fiscalisation.unit_of_work import after_rollback, commit
+
 if TYPE_CHECKING:
     from frappe.types import DF
 
@@ -52,6 +54,9 @@ class FiscalHarmonyLogData(TypedDict):
 def fh_log(log_data: FiscalHarmonyLogData):
     """Create a log for Fiscal Harmony activities.
 
+    Inside a unit of work, the log is committed with the rest of it, or written again if it is\
+        rolled back.
+
     Args:
         log_data (FiscalHarmonyLogData): The data to be logged."""
 
@@ -67,7 +72,8 @@ def fh_log(log_data: FiscalHarmonyLogData):
         log.request_url = log_data.get("request_url", None)
 
         log.insert(ignore_permissions=True)
-        frappe.db.commit()
+        after_rollback(lambda: fh_log(log_data))
+        commit()
 
     except Exception as exc:
         message = (
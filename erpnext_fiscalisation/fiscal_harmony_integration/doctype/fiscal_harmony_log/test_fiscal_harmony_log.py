@@ -1,9 +1,139 @@
 # Copyright (c) 2024, Eskill Trading (Pvt) Ltd and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_log.fiscal_harmony_log import (
+    fh_log,
+)
+from erpnext_fiscalisation.unit_of_work import (
+    after_rollback,
+    before_commit,
+    commit,
+    unit_of_work,
+)
+
 
 class TestFiscalHarmonyLog(FrappeTestCase):
-	pass
+    def setUp(self):
+        self.request_url = f"https://test.invalid/{frappe.generate_hash()}"
+        self.addCleanup(self.__delete_records)
+
+    def test_unit_of_work_commits_on_success(self):
+        """Everything written in a unit of work is committed once, at its end."""
+
+        with unit_of_work():
+            self.__log()
+            self.__make_note()
+            commit()
+
+            # The commit above is left for the end, so this undoes the writes.
+            frappe.db.rollback()
+            self.assertEqual(self.__count_logs(), 0)
+
+            self.__log()
+            self.__make_note()
+
+        frappe.db.rollback()
+        self.assertEqual(self.__count_logs(), 1)
+        self.assertEqual(self.__count_notes(), 1)
+
+    def test_unit_of_work_keeps_logs_when_rolled_back(self):
+        """A failed unit of work is rolled back, except for the logs written during it."""
+
+        with self.assertRaises(ValueError):
+            with unit_of_work():
+                self.__log()
+                with unit_of_work():
+                    self.__make_note()
+                raise ValueError("Failed")
+
+        frappe.db.rollback()
+        self.assertEqual(self.__count_logs(), 1)
+        self.assertEqual(self.__count_notes(), 0)
+
+    def test_before_commit_runs_the_last_callback_once(self):
+        """Only the last callback registered with a key runs, just before the commit."""
+
+        calls = []
+
+        with unit_of_work():
+            before_commit("update", lambda: calls.append("first"))
+            before_commit("update", lambda: calls.append("second"))
+            before_commit("another update", lambda: calls.append("another"))
+            self.assertEqual(calls, [])
+
+        self.assertEqual(calls, ["second", "another"])
+
+        with self.assertRaises(ValueError):
+            with unit_of_work():
+                before_commit("update", lambda: calls.append("rolled back"))
+                raise ValueError("Failed")
+
+        self.assertNotIn("rolled back", calls)
+
+        # Outside a unit of work, the callback runs straight away.
+        before_commit("update", lambda: calls.append("now"))
+        self.assertEqual(calls[-1], "now")
+
+    def test_after_rollback_only_runs_when_rolled_back(self):
+        """Callbacks registered with after_rollback run once the unit of work is rolled back."""
+
+        calls = []
+
+        with unit_of_work():
+            after_rollback(lambda: calls.append("committed"))
+        self.assertEqual(calls, [])
+
+        with self.assertRaises(ValueError):
+            with unit_of_work():
+                after_rollback(lambda: calls.append("rolled back"))
+                raise ValueError("Failed")
+        self.assertEqual(calls, ["rolled back"])
+
+        # Outside a unit of work, the write has already been committed.
+        after_rollback(lambda: calls.append("outside"))
+        self.assertEqual(calls, ["rolled back"])
+
+    def __log(self):
+        """Log a request to the URL of this test."""
+
+        fh_log(
+            {
+                "status": "Success",
+                "response": "",
+                "response_status_code": 200,
+                "request_url": self.request_url,
+            }
+        )
+
+    def __make_note(self):
+        """Create a note titled with the URL of this test, without committing it."""
+
+        frappe.get_doc(
+            {"doctype": "Note", "title": self.request_url, "public": 1}
+        ).insert(ignore_permissions=True)
+
+    def __count_logs(self) -> int:
+        """Count the logs of requests to the URL of this test.
+
+        Returns:
+            int: The number of logs."""
+
+        return frappe.db.count("Fiscal Harmony Log", {"request_url": self.request_url})
+
+    def __count_notes(self) -> int:
+        """Count the notes titled with the URL of this test.
+
+        Returns:
+            int: The number of notes."""
+
+        return frappe.db.count("Note", {"title": self.request_url})
+
+    def __delete_records(self):
+        """Delete the logs and notes of this test, which the units of work committed."""
+
+        frappe.db.delete("Fiscal Harmony Log", {"request_url": self.request_url})
+        frappe.db.delete("Note", {"title": self.request_url})
+        frappe.db.commit()
@@ -0,0 +1,43 @@
+// Copyright (c) 2026, Eskill Trading (Pvt) Ltd and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Fiscal Harmony Profile", {
+  refresh(frm) {
+    if (frm.is_new()) return;
+
+    const account = erpnext_fiscalisation.fiscal_harmony_account;
+    frm.add_custom_button(__("Check User Profile"), () => {
+      account.callAccountMethod(frm, "check_user_profile");
+    });
+    frm.add_custom_button(__("Get Device Info"), () => {
+      account.callAccountMethod(frm, "get_device_info");
+    });
+    frm.add_custom_button(__("Update API Token"), () => {
+      account.updateApiToken(frm);
+    });
+    frm.add_custom_button(__("Rate Limit Metrics"), () => {
+      account.showRateLimitMetrics(frm);
+    });
+  },
+
+  check_supported_currencies(frm) {
+    erpnext_fiscalisation.fiscal_harmony_account.callAccountMethod(
+      frm,
+      "check_supported_currencies"
+    );
+  },
+
+  validate_currency_mappings(frm) {
+    erpnext_fiscalisation.fiscal_harmony_account.callAccountMethod(
+      frm,
+      "validate_currency_mappings"
+    );
+  },
+
+  validate_tax_mappings(frm) {
+    erpnext_fiscalisation.fiscal_harmony_account.callAccountMethod(
+      frm,
+      "validate_tax_mappings"
+    );
+  },
+});
@@ -0,0 +1,30 @@
+# Copyright (c) 2026, Eskill Trading (Pvt) Ltd and contributors
+# For license information, please see license.txt
+
+from typing import TYPE_CHECKING
+
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+    FiscalHarmonySettings,
+)
+
+if TYPE_CHECKING:
+    from frappe.types import DF
+
+
+class FiscalHarmonyProfile(FiscalHarmonySettings):
+    """This doctype holds a company's own Fiscal Harmony account.
+
+    It has the account details, mappings and rate limits of Fiscal Harmony Settings, and the same\
+        API methods. Every other setting is shared, and read from Fiscal Harmony Settings."""
+
+    if TYPE_CHECKING:
+        company: DF.Link
+        disabled: DF.Check
+
+    def get_profile_name(self) -> str | None:
+        """Get the name of the profile, which keeps its state apart from other accounts.
+
+        Returns:
+            str | None: The name of the profile."""
+
+        return self.name
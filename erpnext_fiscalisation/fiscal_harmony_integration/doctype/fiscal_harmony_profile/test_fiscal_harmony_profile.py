@@ -0,0 +1,127 @@
+# Copyright (c) 2026, Eskill Trading (Pvt) Ltd and Contributors
+# See license.txt
+
+import frappe
+
+from erpnext_fiscalisation.circuit_breaker import CircuitBreaker
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_profile.fiscal_harmony_profile import (
+    FiscalHarmonyProfile,
+)
+from erpnext_fiscalisation.outbox import should_queue
+from erpnext_fiscalisation.testing.fiscal_harmony_server import (
+    FiscalHarmonyStandIn,
+    StandInConfig,
+    start_in_background,
+)
+from erpnext_fiscalisation.testing.utils import StandInTestCase
+
+PROFILE_API_KEY = "FEDCBA9876543210FEDCBA9876543210"
+PROFILE_API_SECRET = "cHJvZmlsZQ=="
+
+
+class TestFiscalHarmonyProfile(StandInTestCase):
+    """Tests with a profile for the company of the test invoices, on a stand-in of its own."""
+
+    profile_stand_in: FiscalHarmonyStandIn
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.profile_stand_in, cls.__profile_server = start_in_background(
+            StandInConfig(api_key=PROFILE_API_KEY, api_secret=PROFILE_API_SECRET)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.__profile_server.shutdown()
+
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+
+        self.profile: FiscalHarmonyProfile = frappe.get_doc(
+            {
+                "doctype": "Fiscal Harmony Profile",
+                "company": "_Test Company",
+                "endpoint": f"http://localhost:{self.__profile_server.server_port}/api",
+                "user_profile_id": "2",
+                "api_key": PROFILE_API_KEY,
+                "api_secret": PROFILE_API_SECRET,
+            }
+        ).insert(ignore_permissions=True)
+        self.addCleanup(self.__delete_profile)
+
+    def test_transactions_use_the_profile_account(self):
+        """The company's transactions are sent to its own account, with its credentials."""
+
+        signature = self.make_signature()
+        self.assertEqual(signature.fiscal_profile, self.profile.name)
+
+        sent = self.__count_sent()
+        self.assertEqual(
+            signature.get_fiscal_profile().fiscalise_transaction(signature), 200
+        )
+
+        self.assertTrue(signature.fiscal_harmony_id)
+        self.assertEqual(self.__count_sent(), (sent[0], sent[1] + 1))
+
+    def test_profile_has_its_own_circuit_breaker(self):
+        """An open breaker on the default account doesn't stop the profile's requests."""
+
+        breaker = CircuitBreaker()
+        breaker.failure_threshold = 1
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+
+        signature = self.make_signature()
+
+        self.assertFalse(CircuitBreaker(self.profile.name).is_open())
+        self.assertEqual(
+            signature.get_fiscal_profile().fiscalise_transaction(signature), 200
+        )
+
+    def test_profile_has_its_own_outbox(self):
+        """Transactions queued for the default account don't hold up the profile's."""
+
+        self.update_settings(use_outbox=1)
+        default_signature = self.make_signature(queued=1)
+        default_signature.db_set("fiscal_profile", None)
+        self.assertEqual(default_signature.state, "Queued")
+
+        signature = self.make_signature(is_retry=1)
+        self.assertFalse(should_queue(signature))
+
+        sent = self.__count_sent()
+        signature.retry_automatically()
+
+        self.assertEqual(signature.state, "Pending FH Response")
+        self.assertEqual(self.__count_sent(), (sent[0], sent[1] + 1))
+
+        # Whereas the default account's next transaction joins the back of its outbox.
+        another_default_signature = self.make_signature()
+        another_default_signature.db_set("fiscal_profile", None)
+        self.assertTrue(should_queue(another_default_signature))
+
+    def __count_sent(self) -> tuple[int, int]:
+        """Count the transactions each stand-in has received.
+
+        Returns:
+            tuple[int, int]: Those sent to the default account, then to the profile."""
+
+        return tuple(
+            stand_in.get_stats().get("requests.invoice", 0)
+            for stand_in in (self.stand_in, self.profile_stand_in)
+        )
+
+    def __delete_profile(self):
+        """Delete the profile, which the code under test may have committed."""
+
+        frappe.delete_doc(
+            "Fiscal Harmony Profile",
+            self.profile.name,
+            force=True,
+            ignore_permissions=True,
+        )
+        frappe.db.commit()
@@ -3,14 +3,24 @@
 
 frappe.ui.form.on("Fiscal Harmony Settings", {
   refresh(frm) {
+    const account = erpnext_fiscalisation.fiscal_harmony_account;
     frm.add_custom_button(__("Check User Profile"), () => {
-      checkUserProfile(frm);
+      account.callAccountMethod(frm, "check_user_profile");
     });
     frm.add_custom_button(__("Get Device Info"), () => {
-      getDeviceInfo(frm);
+      account.callAccountMethod(frm, "get_device_info");
     });
     frm.add_custom_button(__("Update API Token"), () => {
-      updateApiToken(frm);
+      account.updateApiToken(frm);
+    });
+    frm.add_custom_button(__("Backfill Fiscal PDFs"), () => {
+      backfillFiscalPdfs();
+    });
+    frm.add_custom_button(__("Export for Audit"), () => {
+      exportForAudit();
+    });
+    frm.add_custom_button(__("Rate Limit Metrics"), () => {
+      account.showRateLimitMetrics(frm);
     });
     frm.add_custom_button(__("Get Webhook URL"), () => {
       const webhook = `https://${window.location.hostname}/api/method/capture_signatures`;
@@ -23,108 +33,93 @@ frappe.ui.form.on("Fiscal Harmony Settings", {
   },
 
   check_supported_currencies(frm) {
-    frappe.call({
-      doc: frm.doc,
-      method: "check_supported_currencies",
-      callback: (_) => frm.reload_doc(),
-    });
+    erpnext_fiscalisation.fiscal_harmony_account.callAccountMethod(
+      frm,
+      "check_supported_currencies"
+    );
   },
 
   validate_currency_mappings(frm) {
-    if (!(frm.doc.api_key && frm.doc.api_secret) || frm.is_dirty()) return;
-
-    frappe.call({
-      doc: frm.doc,
-      method: "validate_currency_mappings",
-      callback: (_) => frm.reload_doc(),
-    });
+    erpnext_fiscalisation.fiscal_harmony_account.callAccountMethod(
+      frm,
+      "validate_currency_mappings"
+    );
   },
 
   validate_tax_mappings(frm) {
-    if (!(frm.doc.api_key && frm.doc.api_secret) || frm.is_dirty()) return;
-
-    frappe.call({
-      doc: frm.doc,
-      method: "validate_tax_mappings",
-      callback: (_) => frm.reload_doc(),
-    });
+    erpnext_fiscalisation.fiscal_harmony_account.callAccountMethod(
+      frm,
+      "validate_tax_mappings"
+    );
   },
 });
 
 /**
- * Prompt the user for API authentication details, and update them if they are valid.
- * @param frm A reference to the form body.
+ * Prompts for a date range and queues the download of fiscal PDFs missing from it.
  */
-const updateApiToken = (frm) => {
-  if (frm.is_dirty()) frm.save();
+const backfillFiscalPdfs = () => {
   frappe.prompt(
     [
       {
-        label: "API Key",
-        fieldname: "api_key",
-        fieldtype: "Data",
+        label: "From Date",
+        fieldname: "from_date",
+        fieldtype: "Date",
         reqd: true,
-        default: frm.doc.api_key,
       },
       {
-        label: "API Secret",
-        fieldname: "api_secret",
-        fieldtype: "Password",
+        label: "To Date",
+        fieldname: "to_date",
+        fieldtype: "Date",
         reqd: true,
+        default: frappe.datetime.get_today(),
       },
     ],
     (values) => {
-      const apiKey = values.api_key;
-      const apiSecret = values.api_secret;
-
-      const keyRegex = /^[A-Z\d]{32}$/gm;
-      if (keyRegex.exec(apiKey) == null) {
-        frappe.throw("Please provide a valid API key.");
-      }
-      const secretRegex = /^[a-zA-Z\d\/\+]{86}==$/gm;
-      if (secretRegex.exec(apiSecret) == null) {
-        frappe.throw("Please provide a valid API secret.");
-      }
-
       frappe.call({
-        doc: frm.doc,
-        method: "validate_api_details",
-        args: {
-          api_key: apiKey,
-          api_secret: apiSecret,
-        },
-        callback: (_) => frm.reload_doc(),
+        method: "erpnext_fiscalisation.pdf_backfill.enqueue_fiscal_pdf_backfill",
+        args: values,
       });
     },
-    "Update API Key & Secret",
-    "Submit"
+    "Backfill Fiscal PDFs",
+    "Queue"
   );
 };
 
 /**
- * Checks the Fiscal Harmony user profile ID.
- * @param frm A referemce to the form body.
- */
-const checkUserProfile = (frm) => {
-  if (!(frm.doc.api_key && frm.doc.api_secret) || frm.is_dirty()) return;
-
-  frappe.call({
-    doc: frm.doc,
-    method: "check_user_profile",
-    callback: (_) => frm.reload_doc(),
-  });
-};
-
-/**
- * Fetches the Fiscal Harmony device details.
- * @param frm A referemce to the form body.
+ * Prompts for a tax period and queues an export of its signatures and logs.
  */
-const getDeviceInfo = (frm) => {
-  if (!(frm.doc.api_key && frm.doc.api_secret) || frm.is_dirty()) return;
-
-  frappe.call({
-    doc: frm.doc,
-    method: "get_device_info",
-    callback: (_) => frm.reload_doc(),
-  });
+const exportForAudit = () => {
+  frappe.prompt(
+    [
+      {
+        label: "From Date",
+        fieldname: "from_date",
+        fieldtype: "Date",
+        reqd: true,
+      },
+      {
+        label: "To Date",
+        fieldname: "to_date",
+        fieldtype: "Date",
+        reqd: true,
+        default: frappe.datetime.get_today(),
+      },
+      {
+        label: "Format",
+        fieldname: "file_format",
+        fieldtype: "Select",
+        options: "csv\njsonl",
+        default: "csv",
+        reqd: true,
+      },
+    ],
+    (values) => {
+      frappe.call({
+        method: "erpnext_fiscalisation.audit_export.enqueue_audit_export",
+        args: values,
+      });
+    },
+    "Export for Audit",
+    "Queue"
+  );
 };
@@ -4,18 +4,25 @@
 # pylint: disable=not-an-iterable
 
 import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import hashlib
 import hmac
 import json
 import re
-from typing import TYPE_CHECKING
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator
 
 import requests
 
 import frappe
 from frappe.model.document import Document
 
+from erpnext_fiscalisation.circuit_breaker import CircuitBreaker
+from erpnext_fiscalisation.currencies import set_supported_currencies
+from erpnext_fiscalisation.rate_limiter import RateLimiter
+from erpnext_fiscalisation.unit_of_work import before_commit
 from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_log.fiscal_harmony_log import (
     fh_log,
     FiscalHarmonyLogData,
@@ -34,6 +41,15 @@ class FiscalHarmonySettings(Document):
     __ERROR_TITLE = "Fiscal Harmony Error"
     __TIMEOUT = 30
     """Default timeout for requests."""
+    __SYNC_WORKERS = 4
+    """Maximum number of concurrent requests when syncing mappings."""
+    __UNAVAILABLE_STATUS_CODES = (502, 503, 504)
+    """Status codes that count as Fiscal Harmony being unavailable for the circuit breaker."""
+    __POOL_SIZE = 10
+    """Maximum number of connections kept open to Fiscal Harmony by each account."""
+    __SESSIONS: dict[tuple[str, str], requests.Session] = {}
+    """Connection pools of each account, shared by the workers of a process."""
+    __SESSIONS_LOCK = threading.Lock()
 
     if TYPE_CHECKING:
         endpoint: DF.Data
@@ -43,26 +59,55 @@ class FiscalHarmonySettings(Document):
         last_successful_request: DF.Datetime
         currency_mappings: DF.Table
         tax_mappings: DF.Table
+        qr_code_format: DF.Literal["PNG", "SVG"]
+        qr_error_correction: DF.Literal["L", "M", "Q", "H"]
+        qr_box_size: DF.Int
+        qr_border: DF.Int
+        reconcile_pending_after: DF.Int
+        reconcile_batch_size: DF.Int
+        hold_when_device_down: DF.Check
+        device_status_ttl: DF.Int
+        auto_retry: DF.Check
+        max_retry_attempts: DF.Int
+        retry_concurrency: DF.Int
+        retry_base_delay: DF.Int
+        retry_max_delay: DF.Int
+        rate_limits: DF.Table
+        circuit_failure_threshold: DF.Int
+        circuit_open_seconds: DF.Int
+        use_outbox: DF.Check
+        outbox_batch_size: DF.Int
 
     def validate(self):
         """Validate the Fiscal Harmony Settings form data."""
 
         url_regex = r"^https://[a-z]+\.([a-z]+\.)*(co\.zw|com)/[a-z]+$"
+        # Allows a local stand-in for Fiscal Harmony to be used when testing.
+        local_url_regex = r"^http://(localhost|127\.0\.0\.1)(:\d+)?/[a-z]+$"
 
-        if not re.match(url_regex, self.endpoint):
+        if not re.match(url_regex, self.endpoint) and not (
+            frappe.conf.developer_mode and re.match(local_url_regex, self.endpoint)
+        ):
             frappe.throw("Please enter a valid URL for the endpoint, then try again.")
 
+    def get_profile_name(self) -> str | None:
+        """Get the name of the Fiscal Harmony Profile of this account, which keeps its state, such\
+            as rate limits and the circuit breaker, apart from other accounts.
+
+        Returns:
+            str | None: None for the default account in Fiscal Harmony Settings."""
+
+        return None
+
     @frappe.whitelist()
     def check_supported_currencies(self):
         """Display a list of currency codes supported by Fiscal Harmony."""
 
-        response = self.__make_request("/currencymapping/supported-currencies")
-        if not response.ok:
-            frappe.throw(f"{response.status_code}: {response.reason}")
+        currencies = self.fetch_supported_currencies()
+        set_supported_currencies(currencies, self.get_profile_name())
 
         message = "Supported currencies are:<br/><ul>"
-        currency_list = response.text.strip(r"[]").replace('"', "").split(r",")
-        for currency in currency_list:
+        for currency in currencies:
             message += f"<li>{currency}</li>"
         message += "</ul>"
 
@@ -93,11 +138,15 @@ class FiscalHarmonySettings(Document):
     def download_fiscal_pdf(self, signature: "FiscalSignature") -> bytes | None:
         """Download the fiscal PDF listed on the signature and attach to the invoice.
 
+        Failures, including Fiscal Harmony being unreachable, are logged rather than raised, so\
+            the caller can carry on without the PDF.
+
         Args:
             signature (FiscalSignature): The document that stores the fiscal result.
 
         Returns:
-            bytes|None: Returns the content of the downloaded PDF."""
+            bytes|None: Returns the content of the downloaded PDF, or None if it wasn't\
+                downloaded."""
 
         if not signature.fiscal_harmony_filename:
             frappe.log_error(
@@ -114,25 +163,28 @@ class FiscalHarmonySettings(Document):
             "request_url": request_url,
         }
 
+        content = None
+
         try:
-            response = requests.get(
-                request_url,
-                headers=headers,
-                timeout=FiscalHarmonySettings.__TIMEOUT,
-            )
+            response = self.__send("Download", "GET", request_url, headers=headers)
             log_data["response_status_code"] = response.status_code
-            log_data["response"] = str(response.content)
+            log_data["response"] = f"{len(response.content)} bytes received."
             response.raise_for_status()
 
             log_data["status"] = "Success"
+            content = response.content
             self.__update_last_successful_request()
 
-        except TimeoutError:
+        except (
+            TimeoutError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ConnectionError,
+        ) as exc:
+            # This includes CircuitOpenError, raised without sending while the breaker is open.
             log_data["status"] = "Failure"
-            log_data["error_details"] = ""
+            log_data["response"] = ""
+            log_data["error_details"] = str(exc)
             log_data["response_status_code"] = 500
-            fh_log(log_data)
-            frappe.throw("The connection timed out.")
 
         except requests.exceptions.HTTPError:
             log_data["error_details"] = response.reason
@@ -143,7 +195,91 @@ class FiscalHarmonySettings(Document):
 
         fh_log(log_data)
 
-        return response.content
+        return content
+
+    def download_fiscal_pdfs(
+        self,
+        signatures: Iterable["FiscalSignature"],
+        max_workers: int = 4,
+        requests_per_second: float = 5.0,
+    ) -> Iterator[tuple["FiscalSignature", bytes | None]]:
+        """Download the fiscal PDFs of several signatures concurrently.
+
+        Requests are started no faster than `requests_per_second`, and only the downloads run in\
+            worker threads. Logging happens on the calling thread as results come in.
+
+        Args:
+            signatures (Iterable[FiscalSignature]): Signatures with a Fiscal Harmony filename.
+            max_workers (int, optional): Number of concurrent downloads. Defaults to 4.
+            requests_per_second (float, optional): Maximum rate at which downloads are started.\
+                Defaults to 5.0.
+
+        Yields:
+            tuple[FiscalSignature, bytes | None]: Each signature with its PDF content, or None if\
+                the download failed, in order of completion."""
+
+        headers = self.__get_headers()
+        interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        any_success = False
+        limiter = RateLimiter("Download", self.get_profile_name())
+        breaker = CircuitBreaker(self.get_profile_name())
+
+        def download(url: str) -> requests.Response:
+            return self.__send(limiter, "GET", url, breaker, headers=headers)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            next_start = time.monotonic()
+            for signature in signatures:
+                if (delay := next_start - time.monotonic()) > 0:
+                    time.sleep(delay)
+                next_start = max(next_start, time.monotonic()) + interval
+
+                url = self.__get_request_url(
+                    f"/download/{signature.fiscal_harmony_filename}"
+                )
+                futures[executor.submit(download, url)] = (signature, url)
+
+            for future in as_completed(futures):
+                signature, url = futures[future]
+                log_data: FiscalHarmonyLogData = {
+                    "request_url": url,
+                }
+                content = None
+
+                try:
+                    response = future.result()
+                    log_data["response_status_code"] = response.status_code
+                    log_data["response"] = f"{len(response.content)} bytes received."
+                    response.raise_for_status()
+
+                    log_data["status"] = "Success"
+                    content = response.content
+                    any_success = True
+
+                except (
+                    TimeoutError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError,
+                ) as exc:
+                    log_data["status"] = "Failure"
+                    log_data["response"] = ""
+                    log_data["error_details"] = str(exc)
+                    log_data["response_status_code"] = 500
+
+                except requests.exceptions.HTTPError:
+                    log_data["error_details"] = response.reason
+                    if response.status_code == 401:
+                        log_data["status"] = "Unauthorised"
+                    else:
+                        log_data["status"] = "Failure"
+
+                fh_log(log_data)
+
+                yield signature, content
+
+        if any_success:
+            self.__update_last_successful_request()
 
     def fetch_signature_data(self, signature: "FiscalSignature"):
         """Fetches the data of an already fiscalised signature that did not have its data returned\
@@ -152,11 +288,26 @@ class FiscalHarmonySettings(Document):
         Args:
             signature (FiscalSignature): The document that stores the fiscal result."""
 
-        if not signature.fiscal_harmony_id or signature.fdms_url:
+        self.fetch_signatures_data([signature])
+
+    def fetch_signatures_data(self, signatures: list["FiscalSignature"]):
+        """Fetches the data of several already fiscalised signatures that did not have their data\
+            returned via webhook, using a single status request.
+
+        Args:
+            signatures (list[FiscalSignature]): The documents that store the fiscal results."""
+
+        signatures = [
+            signature
+            for signature in signatures
+            if signature.fiscal_harmony_id and not signature.fdms_url
+        ]
+        if not signatures:
             return
 
+        invoices = ", ".join(signature.sales_invoice for signature in signatures)
         url = self.__get_request_url("status")
-        data = [str(signature.fiscal_harmony_id)]
+        data = [str(signature.fiscal_harmony_id) for signature in signatures]
         log_data: FiscalHarmonyLogData = {
             "request_url": url,
             "payload": json.dumps(data, indent=2),
@@ -165,54 +316,41 @@ class FiscalHarmonySettings(Document):
         headers = self.__get_signed_headers(payload)
 
         try:
-            response = requests.post(
-                url,
-                data=payload,
-                headers=headers,
-                timeout=FiscalHarmonySettings.__TIMEOUT,
-            )
+            response = self.__send("Status", "POST", url, data=payload, headers=headers)
             log_data["response_status_code"] = response.status_code
             log_data["response"] = json.dumps(response.json(), indent=2)
 
             response.raise_for_status()
 
-            response_data = response.json()[0]
-            signature.is_retry = (
-                not response_data["Success"] and response_data["IsActionable"]
-            )
-            if response_data["Error"]:
-                signature.error = response_data["Error"]
-            elif signature.error:
-                signature.error = ""
-
-            if qr_data := response_data["QrData"]:
-                signature.fdms_url = qr_data["QrCodeUrl"]
-                signature.verification_code = qr_data["VerificationCode"]
-                signature.fiscal_day = qr_data["FiscalDay"]
-                signature.device_id = qr_data["DeviceId"]
-                signature.invoice_number = qr_data["InvoiceNumber"]
-
-            signature.fiscal_harmony_filename = response_data.get(
-                "FiscalInvoicePdf",
-                None,
-            )
+            # Signatures without a result are left pending for the next status check.
+            results_by_id = match_status_results(data, response.json())
+            for signature in signatures:
+                if response_data := results_by_id.get(str(signature.fiscal_harmony_id)):
+                    signature.set_fiscal_data(response_data)
 
             log_data["status"] = "Success"
             self.__update_last_successful_request()
 
-        except TimeoutError:
-            signature.is_retry = True
+        except (TimeoutError, requests.exceptions.Timeout):
+            for signature in signatures:
+                signature.is_retry = True
+            log_data["status"] = "Failure"
+            log_data["error_details"] = f"Timed out whilst signing {invoices}."
+            log_data["response_status_code"] = 500
+
+        except requests.exceptions.ConnectionError as exc:
+            for signature in signatures:
+                signature.is_retry = True
             log_data["status"] = "Failure"
             log_data["error_details"] = (
-                f"Timed out whilst signing {signature.sales_invoice}."
+                f"Connection failed whilst signing {invoices}: {exc}"
             )
             log_data["response_status_code"] = 500
 
         except requests.exceptions.HTTPError:
-            signature.is_retry = True
-            log_data["error_details"] = (
-                f"{response.reason} whilst signing {signature.sales_invoice}."
-            )
+            for signature in signatures:
+                signature.is_retry = True
+            log_data["error_details"] = f"{response.reason} whilst signing {invoices}."
             match response.status_code:
                 case 400:
                     log_data["status"] = "Invalid JSON"
@@ -223,17 +361,23 @@ class FiscalHarmonySettings(Document):
                     log_data["status"] = "Failure"
 
         finally:
-            signature.save(ignore_permissions=True)
+            for signature in signatures:
+                signature.save(ignore_permissions=True)
             fh_log(log_data)
 
-            if signature.fiscal_harmony_filename:
-                signature.download_or_generate_pdf()
+            for signature in signatures:
+                if signature.fiscal_harmony_filename:
+                    signature.download_or_generate_pdf()
 
-    def fiscalise_transaction(self, signature: "FiscalSignature"):
+    def fiscalise_transaction(self, signature: "FiscalSignature") -> int | None:
         """Fiscalises the invoice/credit note attached to the given signature.
 
         Args:
-            signature (FiscalSignature): The document that stores the fiscal result."""
+            signature (FiscalSignature): The document that stores the fiscal result.
+
+        Returns:
+            int | None: The HTTP status code returned by Fiscal Harmony, or None if no response\
+                was received."""
 
         data = signature.get_payload_data()
         payload = self.__encode_data(data)
@@ -247,14 +391,13 @@ class FiscalHarmonySettings(Document):
         }
         if signature.is_retry:
             signature.is_retry = False
+        status_code = None
 
         try:
-            response = requests.post(
-                url,
-                data=payload,
-                headers=headers,
-                timeout=FiscalHarmonySettings.__TIMEOUT,
+            response = self.__send(
+                "Fiscalise", "POST", url, data=payload, headers=headers
             )
+            status_code = response.status_code
             log_data["response_status_code"] = response.status_code
             try:
                 log_data["response"] = json.dumps(response.json(), indent=2)
@@ -267,7 +410,7 @@ class FiscalHarmonySettings(Document):
             log_data["status"] = "Success"
             self.__update_last_successful_request()
 
-        except TimeoutError:
+        except (TimeoutError, requests.exceptions.Timeout):
             signature.is_retry = True
             log_data["status"] = "Failure"
             log_data["error_details"] = (
@@ -275,6 +418,14 @@ class FiscalHarmonySettings(Document):
             )
             log_data["response_status_code"] = 500
 
+        except requests.exceptions.ConnectionError as exc:
+            signature.is_retry = True
+            log_data["status"] = "Failure"
+            log_data["error_details"] = (
+                f"Connection failed whilst signing {signature.sales_invoice}: {exc}"
+            )
+            log_data["response_status_code"] = 500
+
         except requests.exceptions.HTTPError:
             signature.is_retry = True
             log_data["error_details"] = (
@@ -293,11 +444,86 @@ class FiscalHarmonySettings(Document):
             signature.save(ignore_permissions=True)
             fh_log(log_data)
 
+        return status_code
+
+    def fetch_supported_currencies(self) -> list[str]:
+        """Fetch the currency codes supported by Fiscal Harmony.
+
+        Returns:
+            list[str]: The supported currency codes."""
+
+        response = self.__make_request("/currencymapping/supported-currencies")
+        if not response.ok:
+            frappe.throw(f"{response.status_code}: {response.reason}")
+
+        return [currency.strip() for currency in response.json()]
+
+    def fetch_device_status(self) -> dict:
+        """Check whether the fiscal device is able to accept transactions.
+
+        The device is unavailable if Fiscal Harmony can't be reached, the request is rejected, or\
+            closing the previous fiscal day failed.
+
+        Returns:
+            dict: Whether the device is available, the reason if not, and the device data."""
+
+        try:
+            response = self.__send(
+                "Device",
+                "GET",
+                self.__get_request_url("/fiscaldevice"),
+                headers=self.__get_headers(),
+            )
+
+        except (TimeoutError, requests.exceptions.RequestException) as exc:
+            return {
+                "available": False,
+                "reason": f"Fiscal Harmony could not be reached: {exc}",
+                "data": None,
+            }
+
+        if not response.ok:
+            return {
+                "available": False,
+                "reason": f"{response.status_code}: {response.reason}",
+                "data": None,
+            }
+
+        def find_value(data, key: str):
+            if isinstance(data, str) and data.startswith(r"{") and data.endswith(r"}"):
+                data = json.loads(data)
+
+            if isinstance(data, dict):
+                for inner_key, inner_value in data.items():
+                    if inner_key.lower() == key:
+                        return inner_value
+
+                    value = find_value(inner_value, key)
+                    if value is not None:
+                        return value
+
+            return None
+
+        try:
+            data = response.json()
+        except json.JSONDecodeError:
+            data = None
+
+        day_status = find_value(data, "fiscaldaystatus")
+        if day_status == "FiscalDayCloseFailed":
+            return {
+                "available": False,
+                "reason": "Closing the previous fiscal day failed.",
+                "data": data,
+            }
+
+        return {"available": True, "reason": "", "data": data}
+
     @frappe.whitelist()
     def get_device_info(self):
         """Displays the Fiscal Harmony fiscal device config to the user."""
 
-        response = self.__make_request("/fiscaldevice")
+        response = self.__make_request("/fiscaldevice", "Device")
         if not response.ok:
             frappe.throw(
                 "Failed to fetch the device status.",
@@ -360,10 +586,11 @@ class FiscalHarmonySettings(Document):
         headers = self.__get_headers(api_key)
 
         try:
-            response = requests.get(
+            response = self.__send(
+                "Other",
+                "GET",
                 self.__get_request_url("/fiscaldevice"),
                 headers=headers,
-                timeout=FiscalHarmonySettings.__TIMEOUT,
             )
         except TimeoutError:
             frappe.throw(
@@ -433,12 +660,16 @@ class FiscalHarmonySettings(Document):
 
         return json.dumps(data, separators=(",", ":"), sort_keys=True)
 
-    def __make_request(self, route: str) -> requests.Response:
+    def __make_request(
+        self, route: str, route_class: str = "Other"
+    ) -> requests.Response:
         """Generates and processes a standard GET request to the Fiscal Harmony API based on the\
             given route.
 
         Args:
             route (str): The route to request against.
+            route_class (str, optional): The rate limit budget the request uses.\
+                Defaults to "Other".
 
         Returns:
             requests.Response: The response from the Fiscal Harmony platform."""
@@ -450,11 +681,7 @@ class FiscalHarmonySettings(Document):
         }
 
         try:
-            response = requests.get(
-                request_url,
-                headers=headers,
-                timeout=FiscalHarmonySettings.__TIMEOUT,
-            )
+            response = self.__send(route_class, "GET", request_url, headers=headers)
             log_data["response_status_code"] = response.status_code
             log_data["response"] = json.dumps(response.json(), indent=2)
             response.raise_for_status()
@@ -480,6 +707,78 @@ class FiscalHarmonySettings(Document):
 
         return response
 
+    def __send(
+        self,
+        limiter: "RateLimiter | str",
+        method: str,
+        url: str,
+        breaker: CircuitBreaker | None = None,
+        **kwargs,
+    ) -> requests.Response:
+        """Sends a request to Fiscal Harmony once the circuit breaker and the rate limit of its\
+            route class allow it.
+
+        Args:
+            limiter (RateLimiter | str): The route class, or a limiter for it. Worker threads\
+                must pass a limiter created on the calling thread.
+            method (str): The HTTP method.
+            url (str): The request URL.
+            breaker (CircuitBreaker | None, optional): The circuit breaker. Worker threads must\
+                pass one created on the calling thread. Defaults to None.
+            **kwargs: Passed on to `requests.Session.request`.
+
+        Returns:
+            requests.Response: The response from the Fiscal Harmony platform.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open, without sending the request."""
+
+        if isinstance(limiter, str):
+            limiter = RateLimiter(limiter, self.get_profile_name())
+        breaker = breaker or CircuitBreaker(self.get_profile_name())
+
+        state = breaker.before_request()
+        limiter.acquire()
+
+        kwargs.setdefault("timeout", FiscalHarmonySettings.__TIMEOUT)
+        try:
+            response = self.__get_session().request(method, url, **kwargs)
+
+        except (
+            TimeoutError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ConnectionError,
+        ):
+            breaker.record_failure()
+            raise
+
+        if response.status_code in FiscalHarmonySettings.__UNAVAILABLE_STATUS_CODES:
+            breaker.record_failure()
+        else:
+            breaker.record_success(state)
+
+        return response
+
+    def __get_session(self) -> requests.Session:
+        """Get the connection pool of this account, creating it on first use.
+
+        Returns:
+            requests.Session: The session to send requests with."""
+
+        key = (self.endpoint, self.api_key or "")
+        with FiscalHarmonySettings.__SESSIONS_LOCK:
+            session = FiscalHarmonySettings.__SESSIONS.get(key)
+            if session is None:
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_maxsize=FiscalHarmonySettings.__POOL_SIZE
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                FiscalHarmonySettings.__SESSIONS[key] = session
+
+        return session
+
     def __get_request_url(self, route: str) -> str:
         """Constructs and returns the route for the API request.
 
@@ -533,7 +832,11 @@ class FiscalHarmonySettings(Document):
         return headers
 
     def __process_mappings(self, route_name: str, mapping_dict: dict[str, str]):
-        """Processes changes made to the mappaing tables.
+        """Synchronises the mapping table with Fiscal Harmony.
+
+        The remote mappings are fetched once and compared with the table by a hash of their\
+            fields, so only new, changed and removed mappings are sent. Those requests run\
+            concurrently, while signing, logging and saving stay on the calling thread.
 
         Args:
             route_name (str): The path for the mapping in Fiscal Harmony.\
@@ -544,147 +847,143 @@ class FiscalHarmonySettings(Document):
         if not self.user_profile_id:
             return
 
-        def get_data(mapping) -> str:
-            data = {"UserId": int(self.user_profile_id)}
-
-            for fh_field, erp_field in mapping_dict.items():
-                data[fh_field] = mapping.get(erp_field)
+        id_field = f"{route_name}_id"
+        title = f"Validate {route_name.capitalize()} Mappings"
 
-            if mapping.get(f"{route_name}_id"):
-                data["Id"] = mapping.get(f"{route_name}_id")
+        def get_hash(mapping: dict) -> str:
+            data = {fh_field: str(mapping.get(fh_field)) for fh_field in mapping_dict}
+            return hashlib.sha256(self.__encode_data(data).encode("utf-8")).hexdigest()
 
-            return self.__encode_data(data)
+        response = self.__make_request(f"/{route_name}mapping", "Mapping")
+        if not response.ok:
+            frappe.throw(
+                f"Failed to fetch {route_name} mappings.<br/>{response.reason}",
+                title=FiscalHarmonySettings.__ERROR_TITLE,
+            )
+        remote_hashes = {
+            int(mapping["Id"]): get_hash(mapping) for mapping in response.json()
+        }
 
-        mappings: set[int] = set()
-        posting_url = self.__get_request_url(f"/{route_name}mapping")
+        # Work out the requests needed to bring Fiscal Harmony in line with the table.
+        operations = []
+        kept_ids: set[int] = set()
         for mapping in self.get(f"{route_name}_mappings"):
-            data = get_data(mapping)
-            log_data: FiscalHarmonyLogData = {
-                "request_url": posting_url,
-                "payload": json.dumps(json.loads(data), indent=2),
-            }
-            headers = self.__get_signed_headers(data)
-            try:
-                if mapping.get(f"{route_name}_id"):
-                    url = self.__get_request_url(
-                        f"/{route_name}mapping/{mapping.get(route_name+'_id')}"
-                    )
-                    log_data["request_url"] = url
-                    response = requests.put(
-                        url,
-                        headers=headers,
-                        data=data,
-                        timeout=FiscalHarmonySettings.__TIMEOUT,
-                    )
-                    mappings.add(int(mapping.get(f"{route_name}_id")))
-
-                else:
-                    response = requests.post(
-                        posting_url,
-                        headers=headers,
-                        data=data,
-                        timeout=FiscalHarmonySettings.__TIMEOUT,
-                    )
-
-                    if response.ok:
-                        mapping.set(f"{route_name}_id", response.json()["Id"])
-                        mappings.add(int(mapping.get(f"{route_name}_id")))
-
-                log_data["response_status_code"] = response.status_code
-                log_data["response"] = json.dumps(response.json(), indent=2)
-                response.raise_for_status()
-
-                log_data["status"] = "Success"
-                self.__update_last_successful_request()
-
-            except TimeoutError:
-                log_data["status"] = "Failure"
-                log_data["error_details"] = (
-                    f"Failed when uploading/updating {route_name} mappings."
-                )
-                log_data["response_status_code"] = 500
+            data = {"UserId": int(self.user_profile_id)}
+            for fh_field, erp_field in mapping_dict.items():
+                data[fh_field] = mapping.get(erp_field)
 
-            except requests.exceptions.HTTPError:
-                log_data["error_details"] = (
-                    f"{response.reason} whilst uploading/updating {route_name} mappings."
-                )
-                match response.status_code:
-                    case 400:
-                        log_data["status"] = "Invalid JSON"
-                    case 401:
-                        log_data["status"] = "Unauthorised"
-                        log_data["signature_valid"] = False
-                    case _:
-                        log_data["status"] = "Failure"
+            mapping_id = int(mapping.get(id_field) or 0)
+            if mapping_id in remote_hashes:
+                kept_ids.add(mapping_id)
+                if get_hash(data) == remote_hashes[mapping_id]:
+                    continue
 
-            finally:
-                fh_log(log_data)
+                data["Id"] = mapping_id
+                url = self.__get_request_url(f"/{route_name}mapping/{mapping_id}")
+                operations.append(("PUT", url, self.__encode_data(data), mapping))
 
-            if not response.ok:
-                frappe.throw(
-                    f"Failed to validate {route_name} mappings.<br/>{response.reason}",
-                    title=FiscalHarmonySettings.__ERROR_TITLE,
-                )
+            else:
+                url = self.__get_request_url(f"/{route_name}mapping")
+                operations.append(("POST", url, self.__encode_data(data), mapping))
 
-        self.save()
+        for mapping_id in remote_hashes.keys() - kept_ids:
+            url = self.__get_request_url(f"/{route_name}mapping/{mapping_id}")
+            operations.append(("DELETE", url, None, None))
 
-        response = self.__make_request(f"/{route_name}mapping")
-        if not response.ok:
+        if not operations:
+            frappe.msgprint(
+                f"{route_name.capitalize()} mappings are already up to date.", title
+            )
             return
 
-        for mapping in response.json():
-            if mapping["Id"] in mappings:
-                continue
+        limiter = RateLimiter("Mapping", self.get_profile_name())
+        breaker = CircuitBreaker(self.get_profile_name())
 
-            url = self.__get_request_url(f"/{route_name}mapping/{mapping['Id']}")
-            log_data: FiscalHarmonyLogData = {
-                "request_url": posting_url,
-            }
-
-            try:
-                requests.delete(
-                    url,
-                    headers=self.__get_headers(),
-                    timeout=FiscalHarmonySettings.__TIMEOUT,
-                )
-
-                log_data["response_status_code"] = response.status_code
-                log_data["response"] = json.dumps(response.json(), indent=2)
-                response.raise_for_status()
-
-                log_data["status"] = "Success"
-                self.__update_last_successful_request()
+        def send(method: str, url: str, data: str | None, headers: dict):
+            return self.__send(
+                limiter, method, url, breaker, data=data, headers=headers
+            )
 
-            except TimeoutError:
-                log_data["status"] = "Failure"
-                log_data["error_details"] = (
-                    f"Timed out whilst deleting {route_name} mappings."
+        failures = []
+        with ThreadPoolExecutor(
+            max_workers=FiscalHarmonySettings.__SYNC_WORKERS
+        ) as executor:
+            futures = {}
+            for operation in operations:
+                method, url, data, _ = operation
+                headers = (
+                    self.__get_signed_headers(data) if data else self.__get_headers()
                 )
-                log_data["response_status_code"] = 500
+                futures[executor.submit(send, method, url, data, headers)] = operation
+
+            for future in as_completed(futures):
+                method, url, data, mapping = futures[future]
+                log_data: FiscalHarmonyLogData = {
+                    "request_url": url,
+                }
+                if data:
+                    log_data["payload"] = json.dumps(json.loads(data), indent=2)
+
+                try:
+                    response = future.result()
+                    log_data["response_status_code"] = response.status_code
+                    try:
+                        log_data["response"] = json.dumps(response.json(), indent=2)
+                    except json.JSONDecodeError:
+                        log_data["response"] = response.text
+                    response.raise_for_status()
+
+                    log_data["status"] = "Success"
+                    if method == "POST":
+                        mapping.set(id_field, response.json()["Id"])
+
+                except (
+                    TimeoutError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError,
+                ) as exc:
+                    log_data["status"] = "Failure"
+                    log_data["error_details"] = (
+                        f"{exc} whilst syncing {route_name} mappings."
+                    )
+                    log_data["response_status_code"] = 500
+                    failures.append(f"{method} {url}: {exc}")
 
-            except requests.exceptions.HTTPError:
-                log_data["error_details"] = (
-                    f"{response.reason} whilst deleting {route_name} mappings."
-                )
-                match response.status_code:
-                    case 400:
-                        log_data["status"] = "Invalid JSON"
-                    case 401:
-                        log_data["status"] = "Unauthorised"
-                        log_data["signature_valid"] = False
-                    case _:
-                        log_data["status"] = "Failure"
+                except requests.exceptions.HTTPError:
+                    log_data["error_details"] = (
+                        f"{response.reason} whilst syncing {route_name} mappings."
+                    )
+                    match response.status_code:
+                        case 400:
+                            log_data["status"] = "Invalid JSON"
+                        case 401:
+                            log_data["status"] = "Unauthorised"
+                            log_data["signature_valid"] = False
+                        case _:
+                            log_data["status"] = "Failure"
+                    failures.append(f"{method} {url}: {response.reason}")
+
+                finally:
+                    fh_log(log_data)
+
+        if len(failures) < len(operations):
+            self.__update_last_successful_request()
+            # Save the IDs of newly created mappings.
+            self.save(ignore_permissions=True)
 
-            finally:
-                fh_log(log_data)
+        if failures:
+            # Keep the IDs of the mappings that were created before reporting the rest.
+            frappe.db.commit()
+            frappe.throw(
+                f"Failed to validate {route_name} mappings.<br/>"
+                + "<br/>".join(failures),
+                title=FiscalHarmonySettings.__ERROR_TITLE,
+            )
 
         frappe.msgprint(
-            f"{route_name.capitalize()} mappings successfully validated.",
-            f"Validate {route_name.capitalize()} Mappings",
+            f"{route_name.capitalize()} mappings successfully validated.", title
         )
 
-        self.__update_last_successful_request()
-
     def __sign_payload(self, payload: str) -> str:
         """Generate the signature for the given `payload`.
 
@@ -704,7 +1003,49 @@ class FiscalHarmonySettings(Document):
         return signature
 
     def __update_last_successful_request(self):
-        """Updates the last_successful_request field."""
+        """Updates the last_successful_request field.
+
+        Only the field is written, without saving the document or changing its modified time,\
+            which would invalidate its cache. Inside a unit of work, it is written once, just\
+            before the unit commits."""
+
+        last_successful_request = self.last_successful_request = datetime.now()
+        before_commit(
+            f"last_successful_request::{self.doctype}::{self.name}",
+            lambda: frappe.db.set_value(
+                self.doctype,
+                self.name,
+                "last_successful_request",
+                last_successful_request,
+                update_modified=False,
+            ),
+        )
+
+
+def match_status_results(
+    request_ids: list[str], results: list[dict]
+) -> dict[str, dict]:
+    """Match the results of a status request to the request IDs that were sent.
+
+    Fiscal Harmony leaves out IDs it doesn't know, so results are matched by their RequestId.\
+        Only when no result has one, and there is a result for every ID, are they matched by\
+        position.
+
+    Args:
+        request_ids (list[str]): The request IDs, in the order they were sent.
+        results (list[dict]): The results returned by the status route.
+
+    Returns:
+        dict[str, dict]: The result of each request ID that has one."""
+
+    if results and not any(result.get("RequestId") for result in results):
+        if len(results) != len(request_ids):
+            return {}
+
+        return dict(zip(request_ids, results))
 
-        self.last_successful_request = datetime.now()
-        self.save(ignore_permissions=True)
+    return {
+        str(result["RequestId"]): result
+        for result in results
+        if result.get("RequestId") and str(result["RequestId"]) in request_ids
+    }
@@ -1,9 +1,282 @@
 # Copyright (c) 2024, Eskill Trading (Pvt) Ltd and Contributors
 # See license.txt
 
-# import frappe
-from frappe.tests.utils import FrappeTestCase
+import time
+from unittest.mock import patch
 
+import frappe
 
-class TestFiscalHarmonySettings(FrappeTestCase):
-	pass
+from erpnext_fiscalisation.circuit_breaker import CircuitBreaker, CircuitOpenError
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+    FiscalHarmonySettings,
+    match_status_results,
+)
+from erpnext_fiscalisation.rate_limiter import (
+    RateLimiter,
+    get_rate_limit_metrics,
+    reset_rate_limit_metrics,
+)
+from erpnext_fiscalisation.testing.utils import StandInTestCase
+
+
+class TestFiscalHarmonySettings(StandInTestCase):
+    def test_transactions_are_signed(self):
+        """Signed transactions are accepted, and those signed with another secret rejected."""
+
+        fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
+            "Fiscal Harmony Settings"
+        )
+        signature = self.make_signature()
+
+        self.assertEqual(fiscal_settings.fiscalise_transaction(signature), 200)
+        self.assertTrue(signature.fiscal_harmony_id)
+
+        rejected = self.stand_in.get_stats().get("errors.signature", 0)
+        fiscal_settings.api_secret = "another secret"
+        self.assertEqual(fiscal_settings.fiscalise_transaction(signature), 401)
+        self.assertTrue(signature.is_retry)
+        self.assertEqual(self.stand_in.get_stats()["errors.signature"], rejected + 1)
+
+    def test_status_results_are_matched_by_request_id(self):
+        """Results are applied to the signature with their RequestId, whatever their order."""
+
+        fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
+            "Fiscal Harmony Settings"
+        )
+        first, second = self.make_signature(), self.make_signature()
+        for signature in (first, second):
+            fiscal_settings.fiscalise_transaction(signature)
+
+        # The stand-in skips IDs it doesn't know, so the results no longer line up with the IDs.
+        unknown = self.make_signature(fiscal_harmony_id="999999")
+        fiscal_settings.fetch_signatures_data([unknown, second, first])
+
+        for signature in (first, second):
+            signature.reload()
+            (result,) = self.stand_in.get_results([signature.fiscal_harmony_id])
+            self.assertEqual(signature.fdms_url, result["QrData"]["QrCodeUrl"])
+            self.assertEqual(signature.state, "Fiscalised")
+
+        unknown.reload()
+        self.assertFalse(unknown.fdms_url)
+        self.assertEqual(unknown.state, "Pending FH Response")
+
+    def test_status_results_without_request_ids(self):
+        """Results without a RequestId are only matched by position if none are missing."""
+
+        results = [{"Success": True}, {"Success": False}]
+
+        self.assertEqual(
+            match_status_results(["1", "2"], results),
+            {"1": results[0], "2": results[1]},
+        )
+        self.assertEqual(match_status_results(["1", "2", "3"], results), {})
+        self.assertEqual(
+            match_status_results(
+                ["1", "2"], [{"RequestId": 2}, {"RequestId": 3}, {"RequestId": None}]
+            ),
+            {"2": {"RequestId": 2}},
+        )
+
+    def test_mapping_sync_only_sends_changes(self):
+        """Only new, changed and removed mappings are sent to Fiscal Harmony."""
+
+        fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
+            "Fiscal Harmony Settings"
+        )
+        fiscal_settings.set(
+            "currency_mappings",
+            [
+                {"system_currency": "USD", "fiscal_harmony_currency": "USD"},
+                {"system_currency": "ZAR", "fiscal_harmony_currency": "ZAR"},
+            ],
+        )
+        fiscal_settings.save(ignore_permissions=True)
+
+        # Each sync fetches the remote mappings once, then sends only what differs.
+        self.assertEqual(self.__sync_currency_mappings(fiscal_settings), (3, 0))
+        self.assertTrue(
+            all(mapping.currency_id for mapping in fiscal_settings.currency_mappings)
+        )
+
+        self.assertEqual(self.__sync_currency_mappings(fiscal_settings), (1, 0))
+
+        fiscal_settings.currency_mappings[1].fiscal_harmony_currency = "ZWG"
+        self.assertEqual(self.__sync_currency_mappings(fiscal_settings), (1, 1))
+
+        fiscal_settings.currency_mappings.pop(0)
+        self.assertEqual(self.__sync_currency_mappings(fiscal_settings), (1, 1))
+
+        self.assertEqual(self.__sync_currency_mappings(fiscal_settings), (1, 0))
+
+    def test_circuit_breaker_opens_after_failures(self):
+        """The breaker opens once enough requests fail, and then blocks requests."""
+
+        breaker = CircuitBreaker()
+        breaker.failure_threshold = 3
+
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertFalse(breaker.is_open())
+        self.assertEqual(breaker.before_request(), "closed")
+
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+
+    def test_circuit_breaker_probe_closes_it(self):
+        """After the cooldown a single probe is let through, and its success closes the breaker."""
+
+        breaker = self.__open_breaker()
+
+        self.assertEqual(breaker.before_request(), "half-open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+
+        breaker.record_success("half-open")
+        self.assertFalse(breaker.is_open())
+        self.assertEqual(breaker.before_request(), "closed")
+
+    def test_circuit_breaker_failed_probe_reopens_it(self):
+        """A failed probe opens the breaker again for another cooldown."""
+
+        breaker = self.__open_breaker()
+
+        self.assertEqual(breaker.before_request(), "half-open")
+        breaker.record_failure()
+
+        self.assertTrue(breaker.is_open())
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+
+    def test_unavailable_responses_open_the_circuit(self):
+        """Once Fiscal Harmony keeps answering 503, transactions aren't sent at all."""
+
+        self.update_settings(circuit_failure_threshold=2)
+        self.stand_in.config.error_rate = 1.0
+        fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
+            "Fiscal Harmony Settings"
+        )
+        signature = self.make_signature()
+
+        for _ in range(2):
+            self.assertEqual(fiscal_settings.fiscalise_transaction(signature), 503)
+        self.assertTrue(CircuitBreaker().is_open())
+
+        sent = self.stand_in.get_stats()["requests.invoice"]
+        self.assertIsNone(fiscal_settings.fiscalise_transaction(signature))
+        self.assertEqual(self.stand_in.get_stats()["requests.invoice"], sent)
+        self.assertTrue(signature.is_retry)
+
+    def test_rate_limiter_allows_a_burst_then_waits(self):
+        """A full bucket lets a burst through, then each request waits its turn."""
+
+        limiter = self.__make_limiter(requests_per_second=10.0, burst=3)
+
+        with patch("erpnext_fiscalisation.rate_limiter.time.sleep") as sleep:
+            waits = [limiter.acquire() for _ in range(5)]
+
+        self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+        # Waiting requests reserve the next token, so each waits a token longer than the last.
+        self.assertAlmostEqual(waits[3], 0.1, delta=0.02)
+        self.assertAlmostEqual(waits[4], 0.2, delta=0.02)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], waits[3:])
+
+        metrics = get_rate_limit_metrics()["Device"]
+        self.assertEqual(metrics["requests"], 5)
+        self.assertEqual(metrics["throttled"], 2)
+        self.assertAlmostEqual(metrics["max_wait"], waits[4], places=3)
+
+    def test_rate_limiter_refills_over_time(self):
+        """Tokens come back at the configured rate, up to the burst size."""
+
+        limiter = self.__make_limiter(requests_per_second=20.0, burst=2)
+
+        for _ in range(2):
+            self.assertEqual(limiter.acquire(), 0.0)
+        self.assertGreater(limiter.acquire(), 0)
+
+        # Long enough to refill more than the burst, which is all the bucket holds.
+        time.sleep(0.5)
+        with patch("erpnext_fiscalisation.rate_limiter.time.sleep"):
+            waits = [limiter.acquire() for _ in range(3)]
+
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertGreater(waits[2], 0)
+
+    def test_requests_are_rate_limited(self):
+        """Requests to Fiscal Harmony take a token from the bucket of their route class."""
+
+        fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
+            "Fiscal Harmony Settings"
+        )
+        reset_rate_limit_metrics()
+
+        fiscal_settings.fiscalise_transaction(self.make_signature())
+
+        self.assertEqual(get_rate_limit_metrics()["Fiscalise"]["requests"], 1)
+
+    def __open_breaker(self) -> CircuitBreaker:
+        """Open the default account's breaker, and wait out a one second cooldown.
+
+        Returns:
+            CircuitBreaker: The breaker."""
+
+        breaker = CircuitBreaker()
+        breaker.failure_threshold = 1
+        breaker.open_seconds = 1
+
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+
+        # Redis reports the time in whole seconds, so wait until the cooldown has surely passed.
+        time.sleep(2)
+
+        return breaker
+
+    def __make_limiter(self, requests_per_second: float, burst: int) -> RateLimiter:
+        """Create a limiter for device requests with a full bucket, no metrics and the given limit.
+
+        Args:
+            requests_per_second (float): The rate tokens are added at.
+            burst (int): The number of tokens the bucket holds.
+
+        Returns:
+            RateLimiter: The limiter."""
+
+        for clear in (self.__clear_device_bucket, reset_rate_limit_metrics):
+            clear()
+            self.addCleanup(clear)
+
+        limiter = RateLimiter("Device")
+        limiter.requests_per_second = requests_per_second
+        limiter.burst = burst
+
+        return limiter
+
+    def __clear_device_bucket(self):
+        """Delete the default account's bucket for device requests, so it starts out full."""
+
+        frappe.cache.delete_keys("fiscal_harmony_rate_limit:Device")
+
+    def __sync_currency_mappings(
+        self, fiscal_settings: FiscalHarmonySettings
+    ) -> tuple[int, int]:
+        """Sync the currency mappings and count the requests the stand-in received.
+
+        Args:
+            fiscal_settings (FiscalHarmonySettings): The settings to sync.
+
+        Returns:
+            tuple[int, int]: Requests to the mapping list, to fetch or create mappings, and to\
+                single mappings, to update or delete them."""
+
+        before = self.stand_in.get_stats()
+        fiscal_settings.validate_currency_mappings()
+        after = self.stand_in.get_stats()
+
+        return tuple(
+            after.get(name, 0) - before.get(name, 0)
+            for name in ("requests.mappings", "requests.mapping")
+        )
@@ -7,9 +7,14 @@ from typing import TYPE_CHECKING
 import frappe
 from frappe.model.document import Document
 
+from erpnext_fiscalisation.hs_code_index import replace_hs_code
+
 if TYPE_CHECKING:
     from frappe.types import DF
 
+HS_CODE_PATTERN = re.compile(r"^\d{8,10}$")
+"""A valid HS Code, which is 8-10 digits."""
+
 
 class FiscalHSCode(Document):
     """This doctype represents an HS Code used to identify a product during fiscalisation."""
@@ -32,6 +37,16 @@ class FiscalHSCode(Document):
 
         return new
 
+    def after_rename(self, old: str, new: str, merge: bool = False):
+        """Point the HS Code index at the new name after renaming the document.
+
+        Args:
+            old (str): The original name of the document.
+            new (str): The new name of the document.
+            merge (bool, optional): Whether it was merged. Defaults to False."""
+
+        replace_hs_code(old, new)
+
     def validate(self):
         """Validate the document before saving."""
 
@@ -43,7 +58,7 @@ class FiscalHSCode(Document):
         Args:
             code (str): The code to be validated."""
 
-        if not re.fullmatch(r"^\d{8,10}$", code):
+        if not HS_CODE_PATTERN.fullmatch(code):
             frappe.throw(
                 "Invalid HS Code provided. Please ensure that it is 8-10 digits."
             )
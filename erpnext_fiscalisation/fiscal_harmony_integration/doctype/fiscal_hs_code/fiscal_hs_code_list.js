@@ -0,0 +1,45 @@
+// Copyright (c) 2025, Eskill Trading (Pvt) Ltd and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["Fiscal HS Code"] = {
+  onload: (listview) => {
+    if (!frappe.user.has_role(["System Manager", "Item Manager"])) return;
+
+    listview.page.add_inner_button(__("Import HS Codes"), () =>
+      importHsCodes()
+    );
+  },
+};
+
+/**
+ * Prompt the user for a CSV or XLSX file of HS Codes, and queue its import.
+ */
+const importHsCodes = () => {
+  frappe.prompt(
+    [
+      {
+        label: "File",
+        fieldname: "file_url",
+        fieldtype: "Attach",
+        reqd: true,
+        description: __(
+          'A CSV or XLSX file with "HS Code" and "Description" columns.'
+        ),
+      },
+      {
+        label: "Update Existing Descriptions",
+        fieldname: "update_existing",
+        fieldtype: "Check",
+        default: 1,
+      },
+    ],
+    (values) => {
+      frappe.call({
+        method: "erpnext_fiscalisation.hs_code_import.enqueue_hs_code_import",
+        args: values,
+      });
+    },
+    "Import HS Codes",
+    "Queue"
+  );
+};
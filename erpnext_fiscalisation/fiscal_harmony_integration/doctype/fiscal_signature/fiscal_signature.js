@@ -4,7 +4,7 @@
 frappe.ui.form.on("Fiscal Signature", {
   refresh(frm) {
     if (frappe.user.has_role("System Manager")) {
-      if (frm.doc.is_retry) {
+      if (frm.doc.is_retry || frm.doc.on_hold || frm.doc.dead_letter) {
         frm.add_custom_button(__("Retry Fiscalisation"), () => {
           frappe.call({
             method: "retry_fiscalisation",
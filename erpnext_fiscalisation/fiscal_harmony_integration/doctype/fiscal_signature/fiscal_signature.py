@@ -2,6 +2,7 @@
 # For license information, please see license.txt
 
 import datetime
+import random
 from typing import TYPE_CHECKING
 
 import pytz
@@ -13,24 +14,60 @@ from frappe.contacts.doctype.address.address import Address
 from frappe.contacts.doctype.contact.contact import Contact
 from frappe.model.document import Document
 from frappe.types import DF
+from frappe.utils import add_to_date, now_datetime
+
+from erpnext_fiscalisation.currencies import get_fiscal_currency
+from erpnext_fiscalisation.dependencies import (
+    STUCK_STATES,
+    flag_dependents,
+    get_unfiscalised_original,
+    get_waiting_error,
+    release_dependents,
+)
+from erpnext_fiscalisation.device_status import is_device_available
+from erpnext_fiscalisation.hs_code_index import get_effective_hs_code
+from erpnext_fiscalisation.outbox import enqueue_drain, should_queue
+from erpnext_fiscalisation.preflight import get_tax_codes, resolve_tax_code
+from erpnext_fiscalisation.profiles import get_profile, get_profile_name
+from erpnext_fiscalisation.unit_of_work import commit
 
 if TYPE_CHECKING:
     from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
         FiscalHarmonySettings,
     )
 
+_BULK_BATCH_SIZE = 20
+"""Signatures processed between commits. Also the number of IDs per status request."""
+
 
 class FiscalSignature(Document):
     """This document manages an individual transaction to be posted to Fiscal Harmony."""
 
     if TYPE_CHECKING:
         sales_invoice: DF.Link
+        fiscal_profile: DF.Link
         fdms_url: DF.Data
         is_retry: DF.Check
+        state: DF.Literal[
+            "Pending FH Response",
+            "On Hold",
+            "Queued",
+            "Awaiting Invoice",
+            "Fiscalised",
+            "Needs Retry",
+            "Error",
+            "Dead Letter",
+        ]
         error: DF.Data
         fiscal_harmony_id: DF.Data
         fiscal_harmony_filename: DF.Data
         bypass_tin: DF.Check
+        retry_attempts: DF.Int
+        next_retry_at: DF.Datetime
+        dead_letter: DF.Check
+        on_hold: DF.Check
+        queued: DF.Check
+        awaiting_signature: DF.Link
 
     @frappe.whitelist()
     def fetch_signing_data(self):
@@ -58,16 +95,13 @@ class FiscalSignature(Document):
                 title="Authorisation Error",
             )
 
-        fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
-            "Fiscal Harmony Settings"
-        )
-        fiscal_settings.fetch_signature_data(self)
+        self.get_fiscal_profile().fetch_signature_data(self)
 
     @frappe.whitelist()
     def retry_fiscalisation(self):
         """Retry fiscalisation of the linked document."""
 
-        if not self.is_retry:
+        if not (self.is_retry or self.on_hold or self.dead_letter):
             frappe.throw(
                 (
                     "This signature can't be resubmitted, it has either been fiscalised or there "
@@ -85,8 +119,211 @@ class FiscalSignature(Document):
                 title="Authorisation Error",
             )
 
+        self.retry_attempts = 0
+        self.next_retry_at = None
+        self.dead_letter = False
         self.__fiscalise()
 
+    def retry_automatically(self):
+        """Retry fiscalisation as part of the automatic retry schedule.
+
+        Failed attempts are rescheduled with exponential backoff and jitter. The signature is moved\
+            to the dead letter state once retrying can't help: the payload can't be generated,\
+            Fiscal Harmony rejects the request outright, or the retry limit is reached."""
+
+        fiscal_settings: FiscalHarmonySettings = frappe.get_cached_doc(
+            "Fiscal Harmony Settings"
+        )
+
+        try:
+            status_code = self.__fiscalise()
+
+        except frappe.ValidationError as exc:
+            self.reload()
+            self.retry_attempts += 1
+            self.dead_letter = True
+            self.next_retry_at = None
+            self.error = str(exc)[:140]
+            self.save(ignore_permissions=True)
+            return
+
+        # The outbox, or the release of its invoice, sends it later, so it isn't rescheduled.
+        if self.queued or self.awaiting_signature:
+            return
+
+        if not self.is_retry:
+            self.next_retry_at = None
+            self.save(ignore_permissions=True)
+            return
+
+        self.retry_attempts += 1
+        is_rejected = status_code is not None and 400 <= status_code < 500
+        if is_rejected and status_code not in (408, 429):
+            self.dead_letter = True
+        elif self.retry_attempts >= (fiscal_settings.max_retry_attempts or 8):
+            self.dead_letter = True
+
+        if self.dead_letter:
+            self.next_retry_at = None
+        else:
+            delay = min(
+                fiscal_settings.retry_max_delay or 3600,
+                (fiscal_settings.retry_base_delay or 60)
+                * 2 ** (self.retry_attempts - 1),
+            )
+            self.next_retry_at = add_to_date(
+                now_datetime(),
+                seconds=random.uniform(delay / 2, delay),
+            )
+
+        self.save(ignore_permissions=True)
+
+    def before_insert(self):
+        """Use the Fiscal Harmony Profile of the invoice's company, if it has one."""
+
+        self.fiscal_profile = get_profile_name(
+            frappe.db.get_value("Sales Invoice", self.sales_invoice, "company")
+        )
+
+    def validate(self):
+        """Keep the stored state in line with the fiscal result."""
+
+        self.state = self.get_state()
+
+    def on_update(self):
+        """Send the credit notes waiting for this invoice once it has been fiscalised, or tell\
+            them it needs to be retried first."""
+
+        if self.fdms_url and self.has_value_changed("fdms_url"):
+            release_dependents(self.name)
+        elif self.state in STUCK_STATES and self.has_value_changed("state"):
+            flag_dependents(self)
+
+    def get_state(self) -> str:
+        """Work out the state of the signature from its fiscal result.
+
+        Returns:
+            str: The state to store on the signature."""
+
+        if self.dead_letter:
+            return "Dead Letter"
+        if self.on_hold:
+            return "On Hold"
+        if self.queued:
+            return "Queued"
+        if self.awaiting_signature:
+            return "Awaiting Invoice"
+        if self.is_retry:
+            return "Needs Retry"
+        if self.fdms_url:
+            return "Fiscalised"
+        if self.error:
+            return "Error"
+
+        return "Pending FH Response"
+
+    def get_fiscal_profile(self, cached: bool = False) -> "FiscalHarmonySettings":
+        """Get the Fiscal Harmony account the transaction is fiscalised with.
+
+        Args:
+            cached (bool, optional): Whether to use the cached document. Defaults to False.
+
+        Returns:
+            FiscalHarmonySettings: The profile, or Fiscal Harmony Settings."""
+
+        return get_profile(self.fiscal_profile, cached)
+
+    def hold(self):
+        """Hold the transaction locally until the fiscal device is available again."""
+
+        self.on_hold = True
+        self.queued = False
+        self.is_retry = False
+        self.next_retry_at = None
+        self.save(ignore_permissions=True)
+
+        frappe.msgprint(
+            f"The fiscal device is unavailable, so {self.sales_invoice} will be fiscalised "
+            "once it recovers.",
+            indicator="orange",
+            alert=True,
+        )
+
+    def await_invoice(self, original: str):
+        """Hold a credit note until the signature of its invoice has been fiscalised.
+
+        Args:
+            original (str): The signature of the invoice."""
+
+        self.awaiting_signature = original
+        self.error = get_waiting_error(original)
+        self.queued = False
+        self.is_retry = False
+        self.next_retry_at = None
+        self.save(ignore_permissions=True)
+
+        frappe.msgprint(
+            f"{self.sales_invoice} will be fiscalised once its original invoice has been.",
+            indicator="blue",
+            alert=True,
+        )
+
+    def queue(self):
+        """Queue the transaction in the outbox, to be sent in order once Fiscal Harmony is\
+            reachable."""
+
+        self.queued = True
+        self.next_retry_at = None
+        self.save(ignore_permissions=True)
+
+        # Start draining straight away, rather than waiting for the scheduled run.
+        enqueue_drain(self.fiscal_profile)
+
+        frappe.msgprint(
+            f"{self.sales_invoice} has been queued, and will be fiscalised in order once "
+            "Fiscal Harmony can accept it.",
+            indicator="blue",
+            alert=True,
+        )
+
+    def send_from_outbox(self) -> bool:
+        """Send the transaction from the outbox. A credit note still waiting for its invoice\
+            leaves the outbox to wait for it instead.
+
+        Returns:
+            bool: False if Fiscal Harmony or the fiscal device is unavailable, in which case it\
+                stays queued and the rest of the outbox should wait."""
+
+        fiscal_settings: FiscalHarmonySettings = frappe.get_cached_doc(
+            "Fiscal Harmony Settings"
+        )
+        if fiscal_settings.hold_when_device_down and not is_device_available(
+            self.fiscal_profile
+        ):
+            return False
+
+        transaction = frappe.db.get_value(
+            "Sales Invoice",
+            self.sales_invoice,
+            ["is_return", "return_against"],
+            as_dict=True,
+        )
+        if original := get_unfiscalised_original(transaction):
+            self.await_invoice(original)
+            return True
+
+        try:
+            self.__fiscalise(from_outbox=True)
+
+        except frappe.ValidationError as exc:
+            self.reload()
+            self.queued = False
+            self.dead_letter = True
+            self.error = str(exc)[:140]
+            self.save(ignore_permissions=True)
+
+        return not self.queued
+
     def after_insert(self):
         """Processes the signature after insertion."""
 
@@ -97,7 +334,7 @@ class FiscalSignature(Document):
         """Download or generate the PDF using default print formats then attach it to the linked\
             invoice."""
 
-        fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
+        fiscal_settings: FiscalHarmonySettings = frappe.get_cached_doc(
             "Fiscal Harmony Settings"
         )
 
@@ -105,11 +342,22 @@ class FiscalSignature(Document):
         if fiscal_settings.attach_local_print:
             pdf = frappe.get_print("Sales Invoice", self.sales_invoice, as_pdf=True)
         else:
-            pdf = fiscal_settings.download_fiscal_pdf(self)
+            pdf = self.get_fiscal_profile().download_fiscal_pdf(self)
 
         if not pdf:
             return
 
+        self.attach_pdf(pdf)
+
+    def attach_pdf(self, pdf: bytes) -> bool:
+        """Archive the given PDF in the fiscal invoices folder and attach it to the linked invoice.
+
+        Args:
+            pdf (bytes): The content of the PDF.
+
+        Returns:
+            bool: Whether the PDF is archived, including when it already was."""
+
         try:
             posting_date = frappe.get_value(
                 "Sales Invoice",
@@ -139,13 +387,41 @@ class FiscalSignature(Document):
                     }
                 )
                 file_doc.insert(ignore_permissions=True)
-                frappe.db.commit()
+                commit()
 
         except Exception as exc:
             frappe.log_error(
                 "Fiscal Harmony: PDF Download",
                 f"Failed to attach the downloaded PDF to invoice {self.sales_invoice}. Error {exc}",
             )
+            return False
+
+        return True
+
+    def set_fiscal_data(self, data: dict):
+        """Update the signature from a fiscal result received from Fiscal Harmony.
+
+        Args:
+            data (dict): A single result, as posted to the webhook or returned by the status\
+                route."""
+
+        self.is_retry = data["IsActionable"] and not data["Success"]
+        if data["Error"]:
+            self.error = data["Error"]
+        elif self.error:
+            self.error = ""
+
+        if qr_data := data["QrData"]:
+            self.fdms_url = qr_data["QrCodeUrl"]
+            self.verification_code = qr_data["VerificationCode"]
+            self.fiscal_day = qr_data["FiscalDay"]
+            self.device_id = qr_data["DeviceId"]
+            self.invoice_number = qr_data["InvoiceNumber"]
+
+        self.fiscal_harmony_filename = data.get(
+            "FiscalInvoicePdf",
+            None,
+        )
 
     def get_payload_data(self) -> dict[str,]:
         """Generate the structured payload for posting the referenced invoice/credit note.
@@ -160,13 +436,56 @@ class FiscalSignature(Document):
 
         return self.__get_invoice_data(transaction)
 
-    def __fiscalise(self):
-        """Submit the signature details for fiscalisation."""
+    def __fiscalise(self, from_outbox: bool = False) -> int | None:
+        """Submit the signature details for fiscalisation.
+
+        Args:
+            from_outbox (bool, optional): Whether the outbox is sending it, so it shouldn't be\
+                held or queued again first. Defaults to False.
+
+        Returns:
+            int | None: The HTTP status code returned by Fiscal Harmony, or None if no response\
+                was received."""
 
         fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
             "Fiscal Harmony Settings"
         )
-        fiscal_settings.fiscalise_transaction(self)
+        if not from_outbox:
+            if fiscal_settings.hold_when_device_down and not is_device_available(
+                self.fiscal_profile
+            ):
+                self.hold()
+                return None
+
+            # A credit note sent before its invoice would only be rejected.
+            transaction = frappe.db.get_value(
+                "Sales Invoice",
+                self.sales_invoice,
+                ["is_return", "return_against"],
+                as_dict=True,
+            )
+            if original := get_unfiscalised_original(transaction):
+                self.await_invoice(original)
+                return None
+
+            if fiscal_settings.use_outbox and should_queue(self):
+                self.queue()
+                return None
+
+        self.on_hold = False
+        self.queued = False
+        self.awaiting_signature = None
+        status_code = self.get_fiscal_profile().fiscalise_transaction(self)
+
+        # Nothing was received, so keep it in order in the outbox rather than retrying it alone.
+        if fiscal_settings.use_outbox and status_code is None and self.is_retry:
+            if from_outbox:
+                self.queued = True
+                self.save(ignore_permissions=True)
+            else:
+                self.queue()
+
+        return status_code
 
     def __get_invoice_data(self, transaction: SalesInvoice) -> dict[str,]:
         """Generate the invoice data payload.
@@ -195,7 +514,7 @@ class FiscalSignature(Document):
             "SubTotal": round(transaction.net_total, 2),
             "TotalTax": round(transaction.total_taxes_and_charges, 2),
             "Total": round(transaction.grand_total, 2),
-            "CurrencyCode": transaction.currency,
+            "CurrencyCode": self.__get_currency_code(transaction),
             "IsRetry": bool(self.is_retry),
         }
 
@@ -228,12 +547,32 @@ class FiscalSignature(Document):
             "SubTotal": round(abs(transaction.net_total), 2),
             "TotalTax": round(abs(transaction.total_taxes_and_charges), 2),
             "Total": round(abs(transaction.grand_total), 2),
-            "CurrencyCode": transaction.currency,
+            "CurrencyCode": self.__get_currency_code(transaction),
             "IsRetry": bool(self.is_retry),
         }
 
         return data
 
+    def __get_currency_code(self, transaction: SalesInvoice) -> str:
+        """Returns the currency code of the transaction, checking that it has been mapped.
+
+        Args:
+            transaction (SalesInvoice): The Sales Invoice object being processed.
+
+        Returns:
+            str: The currency code of the transaction."""
+
+        if not get_fiscal_currency(transaction.currency, self.fiscal_profile):
+            frappe.throw(
+                "Failed to generate fiscal payload for invoice "
+                f"{transaction.name} due to the currency {transaction.currency} "
+                "not being mapped.",
+                title="Fiscalisation Error",
+            )
+
+        # Fiscal Harmony applies the mapping itself, so the system currency is sent.
+        return transaction.currency
+
     def __get_line_items(self, transaction: SalesInvoice) -> list[dict]:
         """Creates a list of line items for the given transaction.
 
@@ -246,12 +585,7 @@ class FiscalSignature(Document):
         fiscal_settings: FiscalHarmonySettings = frappe.get_doc(
             "Fiscal Harmony Settings"
         )
-        tax_codes = set()
-        default_tax_code = None
-        for tax_mapping in fiscal_settings.tax_mappings:
-            tax_codes.add(tax_mapping.tax_code)
-            if tax_mapping.is_default:
-                default_tax_code = tax_mapping.tax_code
+        tax_codes, default_tax_code = get_tax_codes(self.get_fiscal_profile(True))
 
         line_items: list[dict] = []
         for item in transaction.items:
@@ -264,16 +598,7 @@ class FiscalSignature(Document):
                 "Quantity": round(abs(item.qty), 3),
             }
 
-            # Work out the tax code, trying first for an item-specific tax code
-            # before moving on to the document tax code, and then the default
-            # if no valid tax code is set.
-            tax_code = None
-            if item.item_tax_template in tax_codes:
-                tax_code = item.item_tax_template
-            elif transaction.taxes_and_charges in tax_codes:
-                tax_code = transaction.taxes_and_charges
-            elif default_tax_code:
-                tax_code = default_tax_code
+            tax_code = resolve_tax_code(item, transaction, tax_codes, default_tax_code)
 
             # Throw out an error message if a tax code can't be found.
             if not tax_code:
@@ -287,20 +612,8 @@ class FiscalSignature(Document):
 
             # Include HS Codes if the setting is enabled.
             if fiscal_settings.include_hs_codes:
-                # Default to the HS Code based on the item.
-                hs_code = (
-                    frappe.get_value("Item", item.item_code, "fh_hs_code")
-                    if item.item_code
-                    else ""
-                )
-
-                # If HS Code not found, try fetching it from the item group.
-                if not hs_code and item.item_group:
-                    hs_code = frappe.get_value(
-                        "Item Group",
-                        item.item_group,
-                        "fh_hs_code",
-                    )
+                # Use the item's HS Code, else the one inherited by its item group.
+                hs_code = get_effective_hs_code(item.item_code, item.item_group)
 
                 # Throw an error message if no HS Code is found.
                 if not hs_code:
@@ -422,6 +735,207 @@ def _create_folder(folder_name: str, parent_folder: str = "Home") -> str:
         }
     )
     folder.insert(ignore_permissions=True)
-    frappe.db.commit()
+    commit()
 
     return folder.name
+
+
+def on_doctype_update():
+    """Add the composite indexes used for reconciling fiscal days and filtering on state."""
+
+    frappe.db.add_index(
+        "Fiscal Signature",
+        ["device_id", "fiscal_day", "invoice_number"],
+    )
+    frappe.db.add_index("Fiscal Signature", ["state", "creation"])
+    frappe.db.add_index("Fiscal Signature", ["state", "next_retry_at"])
+
+
+@frappe.whitelist()
+def bulk_retry_fiscalisation(
+    names: str | list[str] | None = None,
+    filters: str | list | dict | None = None,
+):
+    """Queue fiscalisation retries for the selected signatures, or all signatures matching the\
+        filters.
+
+    Args:
+        names (str | list[str] | None, optional): Names of the selected signatures.\
+            Defaults to None.
+        filters (str | list | dict | None, optional): List view filters, used when no names are\
+            given. Defaults to None."""
+
+    frappe.only_for("System Manager")
+
+    selected = _get_bulk_selection(
+        names,
+        filters,
+        {"state": ["in", ["Needs Retry", "Dead Letter", "On Hold"]]},
+    )
+    _enqueue_bulk_action("retry", selected)
+
+
+@frappe.whitelist()
+def bulk_fetch_signing_data(
+    names: str | list[str] | None = None,
+    filters: str | list | dict | None = None,
+):
+    """Queue fetching the fiscal data of the selected signatures, or all signatures matching the\
+        filters, using batched status requests.
+
+    Args:
+        names (str | list[str] | None, optional): Names of the selected signatures.\
+            Defaults to None.
+        filters (str | list | dict | None, optional): List view filters, used when no names are\
+            given. Defaults to None."""
+
+    frappe.only_for("System Manager")
+
+    selected = _get_bulk_selection(
+        names,
+        filters,
+        {"state": "Pending FH Response", "fiscal_harmony_id": ["is", "set"]},
+    )
+    _enqueue_bulk_action("fetch", selected)
+
+
+def process_bulk_action(action: str, names: list[str], user: str):
+    """Process a bulk action in batches, publishing progress to the requesting user.
+
+    Args:
+        action (str): Either "retry" or "fetch".
+        names (list[str]): Names of the signatures to process.
+        user (str): The user to publish progress to."""
+
+    title = "Retrying Fiscalisation" if action == "retry" else "Fetching Signing Data"
+    failed = 0
+
+    for start in range(0, len(names), _BULK_BATCH_SIZE):
+        batch: list[FiscalSignature] = [
+            frappe.get_doc("Fiscal Signature", name)
+            for name in names[start : start + _BULK_BATCH_SIZE]
+        ]
+
+        if action == "retry":
+            # Commit each one, so a failure doesn't discard those already accepted.
+            for signature in batch:
+                try:
+                    signature.retry_fiscalisation()
+                    frappe.db.commit()
+                except Exception:
+                    failed += 1
+                    frappe.db.rollback()
+        else:
+            # Each account can only check the status of its own transactions.
+            by_profile: dict[str | None, list[FiscalSignature]] = {}
+            for signature in batch:
+                by_profile.setdefault(signature.fiscal_profile, []).append(signature)
+            for profile_name, signatures in by_profile.items():
+                get_profile(profile_name).fetch_signatures_data(signatures)
+
+        frappe.db.commit()
+        _publish_bulk_progress(
+            user,
+            title,
+            min(start + _BULK_BATCH_SIZE, len(names)),
+            len(names),
+        )
+
+    _publish_bulk_progress(user, title, len(names), len(names), failed, done=True)
+
+
+def _get_bulk_selection(
+    names: str | list[str] | None,
+    filters: str | list | dict | None,
+    required_filters: dict,
+) -> list[str]:
+    """Resolve a bulk action selection to the signatures it applies to.
+
+    Args:
+        names (str | list[str] | None): Names of the selected signatures.
+        filters (str | list | dict | None): List view filters, used when no names are given.
+        required_filters (dict): Filters that every processed signature must match.
+
+    Returns:
+        list[str]: Names of the signatures to process, oldest first."""
+
+    names = frappe.parse_json(names) if names else None
+    filters = frappe.parse_json(filters) if filters else []
+
+    if names:
+        filters = [["name", "in", names]]
+    elif isinstance(filters, dict):
+        filters = [[key, "=", value] for key, value in filters.items()]
+
+    filters = list(filters) + [
+        [key, *value] if isinstance(value, list) else [key, "=", value]
+        for key, value in required_filters.items()
+    ]
+
+    return frappe.get_list(
+        "Fiscal Signature",
+        filters=filters,
+        pluck="name",
+        order_by="creation asc",
+        limit_page_length=0,
+    )
+
+
+def _enqueue_bulk_action(action: str, names: list[str]):
+    """Queue a bulk action and inform the user.
+
+    Args:
+        action (str): Either "retry" or "fetch".
+        names (list[str]): Names of the signatures to process."""
+
+    if not names:
+        frappe.msgprint(
+            "None of the selected signatures can be processed.",
+            title="Fiscal Harmony Signature Processing",
+        )
+        return
+
+    frappe.enqueue(
+        process_bulk_action,
+        queue="long",
+        timeout=60 * 60,
+        action=action,
+        names=names,
+        user=frappe.session.user,
+    )
+
+    frappe.msgprint(
+        f"Queued {len(names)} signatures for processing.",
+        title="Fiscal Harmony Signature Processing",
+    )
+
+
+def _publish_bulk_progress(
+    user: str,
+    title: str,
+    processed: int,
+    total: int,
+    failed: int = 0,
+    done: bool = False,
+):
+    """Publish the progress of a bulk action to the list view.
+
+    Args:
+        user (str): The user to publish progress to.
+        title (str): Title of the progress dialog.
+        processed (int): Number of signatures processed so far.
+        total (int): Total number of signatures.
+        failed (int, optional): Number of signatures that failed. Defaults to 0.
+        done (bool, optional): Whether the action has finished. Defaults to False."""
+
+    frappe.publish_realtime(
+        "fiscal_signature_bulk_progress",
+        {
+            "title": title,
+            "processed": processed,
+            "total": total,
+            "failed": failed,
+            "done": done,
+        },
+        user=user,
+    )
@@ -1,49 +1,94 @@
 // Copyright (c) 2024, Eskill Trading (Pvt) Ltd and contributors
 // For license information, please see license.txt
 
-/** Colour options for the signature status. */
+/** Colour options for the signature state. */
 const colours = {
-  Open: {
-    Urgent: "red",
-    High: "orange",
-    Normal: "blue",
-    Low: "green",
-  },
-  "On Hold": {
-    Urgent: "lightred",
-    High: "lightorange",
-    Normal: "lightblue",
-    Low: "lightgreen",
-  },
+  "Needs Retry": "red",
+  "Dead Letter": "darkgrey",
+  Fiscalised: "green",
+  Error: "gray",
+  "Pending FH Response": "orange",
+  "On Hold": "yellow",
+  Queued: "blue",
+  "Awaiting Invoice": "purple",
 };
 
 frappe.listview_settings["Fiscal Signature"] = {
-  add_fields: ["sales_invoice", "is_retry", "fdms_url", "error"],
+  add_fields: ["sales_invoice", "state", "error"],
   colwidths: {
     sales_invoice: 1,
   },
   get_indicator: (doc) => {
-    let doc_status, colour, filter;
-    if (doc.is_retry) {
-      doc_status = "Needs Retry";
-      colour = "red";
-      filter = "is_retry,=,1";
-    } else if (doc.fdms_url) {
-      doc_status = "Fiscalised";
-      colour = "green";
-      filter = "fdms_url,is,set";
-    } else if (doc.error) {
-      doc_status = `${doc.error}`;
-      colour = "gray";
-      filter = "error,is,set";
-    } else {
-      doc_status = "Pending FH Response";
-      colour = "orange";
-      filter = "fdms_url,is,not set";
-    }
+    const doc_status = doc.state === "Error" ? `${doc.error}` : doc.state;
 
-    return [doc_status, colour, filter];
+    return [doc_status, colours[doc.state], `state,=,${doc.state}`];
   },
   hide_name_column: true,
+  onload: (listview) => {
+    if (!frappe.user.has_role("System Manager")) return;
+
+    listview.page.add_actions_menu_item(__("Retry Fiscalisation"), () =>
+      runBulkAction(listview, "bulk_retry_fiscalisation", true)
+    );
+    listview.page.add_actions_menu_item(__("Fetch Signing Data"), () =>
+      runBulkAction(listview, "bulk_fetch_signing_data", true)
+    );
+    listview.page.add_menu_item(__("Retry All Matching Filters"), () =>
+      runBulkAction(listview, "bulk_retry_fiscalisation", false)
+    );
+    listview.page.add_menu_item(
+      __("Fetch Signing Data For All Matching Filters"),
+      () => runBulkAction(listview, "bulk_fetch_signing_data", false)
+    );
+
+    frappe.realtime.off("fiscal_signature_bulk_progress");
+    frappe.realtime.on("fiscal_signature_bulk_progress", (data) => {
+      let description = __("{0} of {1} signatures processed.", [
+        data.processed,
+        data.total,
+      ]);
+      if (data.failed) description += " " + __("{0} failed.", [data.failed]);
+
+      frappe.show_progress(
+        data.title,
+        data.processed,
+        data.total,
+        description
+      );
+      if (data.done) {
+        frappe.hide_progress();
+        frappe.show_alert({
+          message: description,
+          indicator: data.failed ? "orange" : "green",
+        });
+        listview.refresh();
+      }
+    });
+  },
   refresh: () => {},
 };
+
+/**
+ * Queues a bulk action for the checked signatures or all signatures matching the filters.
+ * @param listview A reference to the list view.
+ * @param method Name of the bulk action method in the Fiscal Signature controller module.
+ * @param selectedOnly Whether to only process the checked signatures.
+ */
+const runBulkAction = (listview, method, selectedOnly) => {
+  const args = selectedOnly
+    ? { names: listview.get_checked_items(true) }
+    : { filters: listview.get_filters_for_args() };
+
+  frappe.confirm(
+    selectedOnly
+      ? __("Process the {0} selected signatures?", [args.names.length])
+      : __("Process all signatures matching the current filters?"),
+    () => {
+      frappe.call({
+        method: `erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.fiscal_signature.${method}`,
+        args: args,
+        freeze: true,
+      });
+    }
+  );
+};
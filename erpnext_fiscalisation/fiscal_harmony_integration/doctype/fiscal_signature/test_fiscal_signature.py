@@ -1,9 +1,306 @@
 # Copyright (c) 2024, Eskill Trading (Pvt) Ltd and Contributors
 # See license.txt
 
-# import frappe
-from frappe.tests.utils import FrappeTestCase
+from unittest.mock import MagicMock, patch
 
+import frappe
+from frappe.query_builder import DocType
+from frappe.utils import add_to_date, get_datetime, now_datetime
 
-class TestFiscalSignature(FrappeTestCase):
-	pass
+from erpnext_fiscalisation.circuit_breaker import CircuitBreaker
+from erpnext_fiscalisation.dependencies import release_ready_dependents, send_dependent
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.fiscal_signature import (
+    FiscalSignature,
+)
+from erpnext_fiscalisation.outbox import drain_outbox
+from erpnext_fiscalisation.patches.utils import update_in_chunks
+from erpnext_fiscalisation.patches.v1_3_0 import backfill_signature_state
+from erpnext_fiscalisation.testing.utils import StandInTestCase
+
+
+class TestFiscalSignature(StandInTestCase):
+    def test_retry_backs_off_then_dead_letters(self):
+        """Each failed retry waits twice as long, until the retry limit is reached."""
+
+        self.stand_in.config.error_rate = 1.0
+        signature = self.make_signature(is_retry=1)
+
+        for attempt, delay in enumerate((60, 120), start=1):
+            start = now_datetime()
+            signature.retry_automatically()
+
+            self.assertEqual(signature.retry_attempts, attempt)
+            self.assertEqual(signature.state, "Needs Retry")
+            next_retry_at = get_datetime(signature.next_retry_at)
+            self.assertGreaterEqual(
+                next_retry_at, add_to_date(start, seconds=delay / 2)
+            )
+            self.assertLessEqual(
+                next_retry_at, add_to_date(now_datetime(), seconds=delay)
+            )
+
+        signature.retry_automatically()
+
+        self.assertEqual(signature.retry_attempts, 3)
+        self.assertTrue(signature.dead_letter)
+        self.assertIsNone(signature.next_retry_at)
+        self.assertEqual(signature.state, "Dead Letter")
+
+    def test_rejected_retry_is_dead_lettered(self):
+        """A request Fiscal Harmony rejects outright isn't retried again."""
+
+        self.stand_in.config.error_rate = 1.0
+        for status, dead_letter in ((400, True), (401, True), (429, False)):
+            with self.subTest(status=status):
+                self.stand_in.config.error_status = status
+                signature = self.make_signature(is_retry=1)
+
+                signature.retry_automatically()
+
+                self.assertEqual(bool(signature.dead_letter), dead_letter)
+                self.assertEqual(signature.retry_attempts, 1)
+
+    def test_invalid_payload_is_dead_lettered(self):
+        """A transaction whose payload can't be built is dead lettered with the error."""
+
+        signature = self.make_signature(is_retry=1)
+
+        with patch.object(
+            FiscalSignature,
+            "get_payload_data",
+            side_effect=frappe.ValidationError("No mapped tax template."),
+        ):
+            signature.retry_automatically()
+
+        signature.reload()
+        self.assertEqual(signature.state, "Dead Letter")
+        self.assertEqual(signature.error, "No mapped tax template.")
+
+    def test_outbox_sends_in_order_and_resumes(self):
+        """The outbox stops at the first transaction that can't be sent, then resumes from it."""
+
+        self.update_settings(use_outbox=1, outbox_batch_size=2)
+        signatures = [self.make_signature(queued=1) for _ in range(3)]
+        self.assertTrue(all(signature.state == "Queued" for signature in signatures))
+
+        send_from_outbox = FiscalSignature.send_from_outbox
+
+        def send_then_go_offline(signature: FiscalSignature) -> bool:
+            sent = send_from_outbox(signature)
+
+            breaker = CircuitBreaker()
+            breaker.failure_threshold = 1
+            breaker.record_failure()
+
+            return sent
+
+        with patch.object(
+            FiscalSignature,
+            "send_from_outbox",
+            autospec=True,
+            side_effect=send_then_go_offline,
+        ):
+            drain_outbox()
+
+        for signature in signatures:
+            signature.reload()
+        self.assertEqual(
+            [signature.state for signature in signatures],
+            ["Pending FH Response", "Queued", "Queued"],
+        )
+        self.assertTrue(signatures[0].fiscal_harmony_id)
+
+        frappe.cache.delete_keys("fiscal_harmony_circuit")
+        drain_outbox()
+
+        for signature in signatures:
+            signature.reload()
+        self.assertTrue(
+            all(signature.state == "Pending FH Response" for signature in signatures)
+        )
+        request_ids = [int(signature.fiscal_harmony_id) for signature in signatures]
+        self.assertEqual(request_ids, sorted(request_ids))
+
+    def test_state_backfill(self):
+        """The patch derives the state of every signature from its flags and result."""
+
+        expected = {
+            self.make_signature(dead_letter=1, is_retry=1).name: "Dead Letter",
+            self.make_signature(is_retry=1).name: "Needs Retry",
+            self.make_signature(
+                fdms_url="https://fdmstest.zimra.co.zw/1"
+            ).name: "Fiscalised",
+            self.make_signature(error="Rejected").name: "Error",
+            self.make_signature().name: "Pending FH Response",
+        }
+        self.__clear_states(list(expected))
+
+        backfill_signature_state.execute()
+
+        self.assertEqual(self.__get_states(list(expected)), expected)
+
+    def test_update_in_chunks_resumes_and_skips_unchanged_rows(self):
+        """Chunked updates continue after their checkpoint, and only count rows they change."""
+
+        names = sorted(self.make_signature().name for _ in range(5))
+        self.__clear_states(names)
+
+        # Resume as if an earlier run had been interrupted after the second row.
+        checkpoint_key = "test_fiscal_signature_checkpoint"
+        frappe.db.set_global(checkpoint_key, names[1])
+        signatures = DocType("Fiscal Signature")
+
+        def update() -> int:
+            totals = update_in_chunks(
+                "Fiscal Signature",
+                {"state": "Pending FH Response"},
+                condition=signatures.name.isin(names),
+                chunk_size=2,
+                checkpoint_key=checkpoint_key,
+            )
+            self.assertGreaterEqual(totals["seconds"], 0)
+            return totals["rows"]
+
+        self.assertEqual(update(), 3)
+        self.assertEqual(
+            self.__get_states(names),
+            {
+                name: None if name in names[:2] else "Pending FH Response"
+                for name in names
+            },
+        )
+        self.assertIsNone(frappe.db.get_global(checkpoint_key))
+
+        self.assertEqual(update(), 2)
+        self.assertEqual(update(), 0)
+
+    def test_credit_note_waits_for_its_invoice(self):
+        """A credit note sent before its invoice waits, then is sent once the invoice is fiscalised."""
+
+        invoice = self.make_signature()
+        credit_note = self.__make_credit_note(invoice)
+        sent = self.stand_in.get_stats().get("requests.invoice", 0)
+
+        credit_note.retry_automatically()
+
+        self.assertEqual(credit_note.state, "Awaiting Invoice")
+        self.assertEqual(credit_note.awaiting_signature, invoice.name)
+        self.assertFalse(credit_note.error)
+        self.assertEqual(self.stand_in.get_stats().get("requests.invoice", 0), sent)
+
+        with patch("erpnext_fiscalisation.dependencies.frappe.enqueue") as enqueue:
+            invoice.fdms_url = "https://fdmstest.zimra.co.zw/1"
+            invoice.save(ignore_permissions=True)
+
+        self.assertEqual(self.__get_released(enqueue), [credit_note.name])
+
+        send_dependent(credit_note.name)
+
+        credit_note.reload()
+        self.assertFalse(credit_note.awaiting_signature)
+        self.assertEqual(credit_note.state, "Pending FH Response")
+        self.assertTrue(credit_note.fiscal_harmony_id)
+        self.assertEqual(self.stand_in.get_stats()["requests.invoice"], sent + 1)
+
+    def test_missed_releases_are_swept_up(self):
+        """Credit notes still waiting for a fiscalised invoice are released by the sweep."""
+
+        fiscalised = self.make_signature(fdms_url="https://fdmstest.zimra.co.zw/1")
+        pending = self.make_signature()
+
+        # Wait without going through await_invoice, as if the release had been missed.
+        released = self.__make_credit_note(fiscalised)
+        released.db_set("awaiting_signature", fiscalised.name)
+        waiting = self.__make_credit_note(pending)
+        waiting.db_set("awaiting_signature", pending.name)
+
+        with patch("erpnext_fiscalisation.dependencies.frappe.enqueue") as enqueue:
+            release_ready_dependents()
+
+        self.assertIn(released.name, self.__get_released(enqueue))
+        self.assertNotIn(waiting.name, self.__get_released(enqueue))
+
+    def test_credit_note_reports_an_invoice_that_needs_retrying(self):
+        """A credit note waiting for a dead lettered invoice records that it must be retried."""
+
+        invoice = self.make_signature(is_retry=1)
+        credit_note = self.__make_credit_note(invoice)
+        credit_note.retry_automatically()
+        self.assertFalse(credit_note.error)
+
+        invoice.dead_letter = 1
+        invoice.save(ignore_permissions=True)
+
+        credit_note.reload()
+        self.assertEqual(credit_note.state, "Awaiting Invoice")
+        self.assertIn(invoice.sales_invoice, credit_note.error)
+        self.assertIn("Dead Letter", credit_note.error)
+
+        # A credit note made against it later is told straight away.
+        another_credit_note = self.__make_credit_note(invoice)
+        another_credit_note.retry_automatically()
+        self.assertIn("Dead Letter", another_credit_note.error)
+
+    def __make_credit_note(self, invoice: FiscalSignature) -> FiscalSignature:
+        """Create a signature for a draft credit note against the invoice of another signature.
+
+        Args:
+            invoice (FiscalSignature): The signature of the invoice.
+
+        Returns:
+            FiscalSignature: The signature of the credit note."""
+
+        credit_note = self.make_signature()
+        frappe.db.set_value(
+            "Sales Invoice",
+            credit_note.sales_invoice,
+            {"is_return": 1, "return_against": invoice.sales_invoice},
+        )
+
+        return credit_note
+
+    def __get_released(self, enqueue: MagicMock) -> list[str]:
+        """Get the credit notes released through a mocked `frappe.enqueue`.
+
+        Args:
+            enqueue (MagicMock): The mock.
+
+        Returns:
+            list[str]: The names of the credit notes' signatures."""
+
+        return [
+            call.kwargs["name"]
+            for call in enqueue.call_args_list
+            if call.args == (send_dependent,)
+        ]
+
+    def __clear_states(self, names: list[str]):
+        """Clear the state of signatures, as before it was introduced.
+
+        Args:
+            names (list[str]): The signatures."""
+
+        signatures = DocType("Fiscal Signature")
+        (
+            frappe.qb.update(signatures)
+            .set(signatures.state, None)
+            .where(signatures.name.isin(names))
+        ).run()
+
+    def __get_states(self, names: list[str]) -> dict[str, str | None]:
+        """Get the stored state of signatures.
+
+        Args:
+            names (list[str]): The signatures.
+
+        Returns:
+            dict[str, str | None]: The states by signature name."""
+
+        return dict(
+            frappe.get_all(
+                "Fiscal Signature",
+                filters={"name": ["in", names]},
+                fields=["name", "state"],
+                as_list=True,
+            )
+        )
@@ -0,0 +1,51 @@
+// Copyright (c) 2026, Eskill Trading (Pvt) Ltd and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Fiscal Day Reconciliation"] = {
+  filters: [
+    {
+      fieldname: "from_date",
+      label: __("From Date"),
+      fieldtype: "Date",
+      default: frappe.datetime.add_days(frappe.datetime.get_today(), -6),
+      reqd: 1,
+    },
+    {
+      fieldname: "to_date",
+      label: __("To Date"),
+      fieldtype: "Date",
+      default: frappe.datetime.get_today(),
+      reqd: 1,
+    },
+    {
+      fieldname: "device_id",
+      label: __("Device ID"),
+      fieldtype: "Int",
+    },
+    {
+      fieldname: "from_fiscal_day",
+      label: __("From Fiscal Day"),
+      fieldtype: "Int",
+    },
+    {
+      fieldname: "to_fiscal_day",
+      label: __("To Fiscal Day"),
+      fieldtype: "Int",
+    },
+  ],
+  tree: true,
+  name_field: "row_id",
+  parent_field: "parent_row_id",
+  initial_depth: 1,
+  formatter: (value, row, column, data, default_formatter) => {
+    value = default_formatter(value, row, column, data);
+    if (
+      column.fieldname === "missing_numbers" &&
+      data &&
+      data.missing_numbers
+    ) {
+      value = `<span style="color: var(--red-500)">${value}</span>`;
+    }
+    return value;
+  },
+};
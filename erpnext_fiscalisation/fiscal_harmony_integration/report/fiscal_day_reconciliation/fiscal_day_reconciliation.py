@@ -0,0 +1,398 @@
+# Copyright (c) 2026, Eskill Trading (Pvt) Ltd and contributors
+# For license information, please see license.txt
+
+"""Per device and fiscal day totals for reconciling against FDMS Z-reports.
+
+The report covers the fiscal days with signatures fiscalised in the given period, found through
+the (state, creation) index of Fiscal Signature, and totals each of them in full. The day summary
+and sequence gaps are grouped on the (device_id, fiscal_day, invoice_number) index. Line totals
+are broken down by the Fiscal Harmony tax ID each line's tax template maps to, with the tax
+ERPNext calculated for the line."""
+
+import json
+from collections import defaultdict
+
+import frappe
+from frappe.utils import add_days, getdate
+
+_MAPPING_PARENT = "COALESCE(NULLIF(fs.fiscal_profile, ''), 'Fiscal Harmony Settings')"
+"""The document holding the tax mappings of the account that fiscalised a signature."""
+
+
+def execute(filters: dict | None = None) -> tuple[list[dict], list[dict]]:
+    """Run the report.
+
+    Args:
+        filters (dict | None, optional): The report filters. Defaults to None.
+
+    Returns:
+        tuple[list[dict], list[dict]]: The columns and rows of the report."""
+
+    filters = frappe._dict(filters or {})
+
+    return get_columns(), get_data(filters)
+
+
+def get_columns() -> list[dict]:
+    """Define the report columns.
+
+    Returns:
+        list[dict]: The column definitions."""
+
+    return [
+        {
+            "label": "Device ID",
+            "fieldname": "device_id",
+            "fieldtype": "Int",
+            "width": 110,
+        },
+        {
+            "label": "Fiscal Day",
+            "fieldname": "fiscal_day",
+            "fieldtype": "Int",
+            "width": 90,
+        },
+        {
+            "label": "Currency",
+            "fieldname": "currency",
+            "fieldtype": "Link",
+            "options": "Currency",
+            "width": 80,
+        },
+        {
+            "label": "Fiscal Harmony Tax ID",
+            "fieldname": "tax_id",
+            "fieldtype": "Data",
+            "width": 150,
+        },
+        {"label": "Invoices", "fieldname": "invoices", "fieldtype": "Int", "width": 80},
+        {
+            "label": "Credit Notes",
+            "fieldname": "credit_notes",
+            "fieldtype": "Int",
+            "width": 100,
+        },
+        {
+            "label": "First Number",
+            "fieldname": "first_number",
+            "fieldtype": "Int",
+            "width": 110,
+        },
+        {
+            "label": "Last Number",
+            "fieldname": "last_number",
+            "fieldtype": "Int",
+            "width": 110,
+        },
+        {
+            "label": "Missing Numbers",
+            "fieldname": "missing_numbers",
+            "fieldtype": "Int",
+            "width": 120,
+        },
+        {"label": "Gaps", "fieldname": "gaps", "fieldtype": "Data", "width": 180},
+        {
+            "label": "Net Total",
+            "fieldname": "net_total",
+            "fieldtype": "Currency",
+            "options": "currency",
+            "width": 130,
+        },
+        {
+            "label": "Total Tax",
+            "fieldname": "total_tax",
+            "fieldtype": "Currency",
+            "options": "currency",
+            "width": 130,
+        },
+        {
+            "label": "Grand Total",
+            "fieldname": "grand_total",
+            "fieldtype": "Currency",
+            "options": "currency",
+            "width": 130,
+        },
+    ]
+
+
+def get_data(filters: frappe._dict) -> list[dict]:
+    """Build the report rows as a tree of fiscal days, currencies and tax codes.
+
+    Args:
+        filters (frappe._dict): The report filters.
+
+    Returns:
+        list[dict]: The report rows."""
+
+    conditions = _get_conditions(filters)
+
+    days = frappe.db.sql(
+        f"""
+        SELECT
+            fs.device_id,
+            fs.fiscal_day,
+            COUNT(*) AS signatures,
+            MIN(fs.invoice_number) AS first_number,
+            MAX(fs.invoice_number) AS last_number,
+            COUNT(DISTINCT fs.invoice_number) AS distinct_numbers
+        FROM `tabFiscal Signature` fs
+        WHERE {conditions}
+        GROUP BY fs.device_id, fs.fiscal_day
+        ORDER BY fs.device_id, fs.fiscal_day
+        """,
+        filters,
+        as_dict=True,
+    )
+    if not days:
+        return []
+
+    gaps = defaultdict(list)
+    for gap in frappe.db.sql(
+        f"""
+        SELECT device_id, fiscal_day, previous_number + 1 AS gap_start,
+            invoice_number - 1 AS gap_end
+        FROM (
+            SELECT
+                fs.device_id,
+                fs.fiscal_day,
+                fs.invoice_number,
+                LAG(fs.invoice_number) OVER (
+                    PARTITION BY fs.device_id, fs.fiscal_day
+                    ORDER BY fs.invoice_number
+                ) AS previous_number
+            FROM `tabFiscal Signature` fs
+            WHERE {conditions}
+        ) numbers
+        WHERE invoice_number - previous_number > 1
+        ORDER BY device_id, fiscal_day, gap_start
+        """,
+        filters,
+        as_dict=True,
+    ):
+        gaps[(gap.device_id, gap.fiscal_day)].append(
+            str(gap.gap_start)
+            if gap.gap_start == gap.gap_end
+            else f"{gap.gap_start}-{gap.gap_end}"
+        )
+
+    currencies = defaultdict(list)
+    for row in frappe.db.sql(
+        f"""
+        SELECT
+            fs.device_id,
+            fs.fiscal_day,
+            si.currency,
+            SUM(si.is_return = 0) AS invoices,
+            SUM(si.is_return = 1) AS credit_notes,
+            SUM(si.net_total) AS net_total,
+            SUM(si.total_taxes_and_charges) AS total_tax,
+            SUM(si.grand_total) AS grand_total
+        FROM `tabFiscal Signature` fs
+        INNER JOIN `tabSales Invoice` si ON si.name = fs.sales_invoice
+        WHERE {conditions}
+        GROUP BY fs.device_id, fs.fiscal_day, si.currency
+        ORDER BY si.currency
+        """,
+        filters,
+        as_dict=True,
+    ):
+        currencies[(row.device_id, row.fiscal_day)].append(row)
+
+    tax_ids = _get_tax_id_totals(conditions, filters)
+
+    data = []
+    for day in days:
+        key = (day.device_id, day.fiscal_day)
+        day_id = f"{day.device_id}/{day.fiscal_day}"
+        day_currencies = currencies[key]
+
+        data.append(
+            {
+                "row_id": day_id,
+                "parent_row_id": None,
+                "indent": 0,
+                "device_id": day.device_id,
+                "fiscal_day": day.fiscal_day,
+                "invoices": sum(row.invoices for row in day_currencies),
+                "credit_notes": sum(row.credit_notes for row in day_currencies),
+                "first_number": day.first_number,
+                "last_number": day.last_number,
+                "missing_numbers": (
+                    day.last_number - day.first_number + 1 - day.distinct_numbers
+                ),
+                "gaps": ", ".join(gaps[key]),
+            }
+        )
+
+        for currency in day_currencies:
+            currency_id = f"{day_id}/{currency.currency}"
+            data.append(
+                {
+                    "row_id": currency_id,
+                    "parent_row_id": day_id,
+                    "indent": 1,
+                    "device_id": day.device_id,
+                    "fiscal_day": day.fiscal_day,
+                    "currency": currency.currency,
+                    "invoices": currency.invoices,
+                    "credit_notes": currency.credit_notes,
+                    "net_total": currency.net_total,
+                    "total_tax": currency.total_tax,
+                    "grand_total": currency.grand_total,
+                }
+            )
+
+            for tax_id, totals in sorted(
+                tax_ids[(*key, currency.currency)].items(), key=lambda t: str(t[0])
+            ):
+                data.append(
+                    {
+                        "row_id": f"{currency_id}/{tax_id}",
+                        "parent_row_id": currency_id,
+                        "indent": 2,
+                        "device_id": day.device_id,
+                        "fiscal_day": day.fiscal_day,
+                        "currency": currency.currency,
+                        "tax_id": "Unmapped" if tax_id is None else str(tax_id),
+                        "invoices": len(totals["invoices"]),
+                        "net_total": totals["net_total"],
+                        "total_tax": totals["total_tax"],
+                        "grand_total": totals["net_total"] + totals["total_tax"],
+                    }
+                )
+
+    return data
+
+
+def _get_tax_id_totals(conditions: str, filters: frappe._dict) -> defaultdict:
+    """Total the lines of each fiscal day and currency by the Fiscal Harmony tax ID they map to.
+
+    The tax template of a line is resolved like the fiscal payload does: the item's template, then\
+        the invoice's, then the default mapping of the account that fiscalised it. The tax of a\
+        line is its share of the tax ERPNext calculated for its item on the invoice.
+
+    Args:
+        conditions (str): The SQL conditions on Fiscal Signature.
+        filters (frappe._dict): The report filters.
+
+    Returns:
+        defaultdict: The invoices, net total and tax of each tax ID, by device ID, fiscal day\
+            and currency."""
+
+    lines = frappe.db.sql(
+        f"""
+        SELECT
+            fs.device_id,
+            fs.fiscal_day,
+            si.currency,
+            si.name AS invoice,
+            sii.item_code,
+            COALESCE(
+                item_mapping.destination_tax_id,
+                invoice_mapping.destination_tax_id,
+                default_mapping.destination_tax_id
+            ) AS tax_id,
+            SUM(sii.net_amount) AS net_total
+        FROM `tabFiscal Signature` fs
+        INNER JOIN `tabSales Invoice` si ON si.name = fs.sales_invoice
+        INNER JOIN `tabSales Invoice Item` sii
+            ON sii.parent = si.name AND sii.parenttype = 'Sales Invoice'
+        LEFT JOIN `tabFiscal Harmony Tax Mapping` item_mapping
+            ON item_mapping.parent = {_MAPPING_PARENT}
+            AND item_mapping.parentfield = 'tax_mappings'
+            AND item_mapping.tax_code = sii.item_tax_template
+        LEFT JOIN `tabFiscal Harmony Tax Mapping` invoice_mapping
+            ON invoice_mapping.parent = {_MAPPING_PARENT}
+            AND invoice_mapping.parentfield = 'tax_mappings'
+            AND invoice_mapping.tax_code = si.taxes_and_charges
+        LEFT JOIN `tabFiscal Harmony Tax Mapping` default_mapping
+            ON default_mapping.parent = {_MAPPING_PARENT}
+            AND default_mapping.parentfield = 'tax_mappings'
+            AND default_mapping.is_default = 1
+        WHERE {conditions}
+        GROUP BY fs.device_id, fs.fiscal_day, si.currency, si.name, sii.item_code, tax_id
+        """,
+        filters,
+        as_dict=True,
+    )
+
+    # The tax of each item on each invoice, as calculated by ERPNext.
+    item_taxes = defaultdict(float)
+    for tax in frappe.db.sql(
+        f"""
+        SELECT stc.parent AS invoice, stc.item_wise_tax_detail
+        FROM `tabFiscal Signature` fs
+        INNER JOIN `tabSales Taxes and Charges` stc
+            ON stc.parent = fs.sales_invoice AND stc.parenttype = 'Sales Invoice'
+        WHERE {conditions}
+        """,
+        filters,
+        as_dict=True,
+    ):
+        for item_code, detail in json.loads(tax.item_wise_tax_detail or "{}").items():
+            if isinstance(detail, list) and len(detail) > 1:
+                item_taxes[(tax.invoice, item_code)] += detail[1] or 0
+
+    # An item's tax is shared by its lines in proportion to their net amount.
+    item_net_totals = defaultdict(float)
+    for line in lines:
+        item_net_totals[(line.invoice, line.item_code)] += line.net_total or 0
+
+    totals = defaultdict(
+        lambda: defaultdict(
+            lambda: {"invoices": set(), "net_total": 0.0, "total_tax": 0.0}
+        )
+    )
+    for line in lines:
+        item_key = (line.invoice, line.item_code)
+        share = (
+            (line.net_total or 0) / item_net_totals[item_key]
+            if item_net_totals[item_key]
+            else 0
+        )
+
+        group = totals[(line.device_id, line.fiscal_day, line.currency)][line.tax_id]
+        group["invoices"].add(line.invoice)
+        group["net_total"] += line.net_total or 0
+        group["total_tax"] += item_taxes[item_key] * share
+
+    return totals
+
+
+def _get_conditions(filters: frappe._dict) -> str:
+    """Build the WHERE clause on Fiscal Signature (aliased `fs`) for the given filters.
+
+    Args:
+        filters (frappe._dict): The report filters.
+
+    Returns:
+        str: The SQL conditions."""
+
+    if not (filters.from_date and filters.to_date):
+        frappe.throw("Please set the period to reconcile.")
+
+    filters.from_date = getdate(filters.from_date)
+    filters.end_date = add_days(getdate(filters.to_date), 1)
+
+    # Unfiscalised signatures have a device ID of 0.
+    conditions = [
+        "fs.device_id > 0",
+        """(fs.device_id, fs.fiscal_day) IN (
+            SELECT device_id, fiscal_day
+            FROM `tabFiscal Signature`
+            WHERE state = 'Fiscalised'
+                AND creation >= %(from_date)s
+                AND creation < %(end_date)s
+        )""",
+    ]
+
+    if filters.device_id:
+        conditions.append("fs.device_id = %(device_id)s")
+
+    if filters.from_fiscal_day:
+        conditions.append("fs.fiscal_day >= %(from_fiscal_day)s")
+
+    if filters.to_fiscal_day:
+        conditions.append("fs.fiscal_day <= %(to_fiscal_day)s")
+
+    return " AND ".join(conditions)
@@ -26,9 +26,48 @@ override_doctype_class = {
 # Include js in doctype views.
 doctype_js = {
     "Customer": "public/js/doctype/customer.js",
+    "Fiscal Harmony Profile": "public/js/fiscal_harmony_account.js",
+    "Fiscal Harmony Settings": "public/js/fiscal_harmony_account.js",
     "Item Group": "public/js/doctype/item_group.js",
 }
 
+# Document Events
+# ---------------
+
+# Keep the HS Code index in step with items and item groups.
+doc_events = {
+    "Item": {
+        "on_update": "erpnext_fiscalisation.hs_code_index.on_item_update",
+        "on_trash": "erpnext_fiscalisation.hs_code_index.on_item_trash",
+        "after_rename": "erpnext_fiscalisation.hs_code_index.on_item_rename",
+    },
+    "Item Group": {
+        "on_update": "erpnext_fiscalisation.hs_code_index.on_item_group_update",
+        "on_trash": "erpnext_fiscalisation.hs_code_index.on_item_group_trash",
+        "after_rename": "erpnext_fiscalisation.hs_code_index.on_item_group_rename",
+    },
+}
+
+# Scheduled Tasks
+# ---------------
+
+scheduler_events = {
+    "hourly": [
+        "erpnext_fiscalisation.currencies.refresh_supported_currencies",
+    ],
+    "cron": {
+        "*/10 * * * *": [
+            "erpnext_fiscalisation.tasks.reconcile_pending_signatures",
+            "erpnext_fiscalisation.dependencies.release_ready_dependents",
+        ],
+        "* * * * *": [
+            "erpnext_fiscalisation.device_status.refresh_device_status",
+            "erpnext_fiscalisation.tasks.retry_failed_signatures",
+            "erpnext_fiscalisation.outbox.drain_outboxes",
+        ],
+    },
+}
+
 override_whitelisted_methods = {
     "capture_signatures": "erpnext_fiscalisation.api.capture_signatures"
 }
@@ -0,0 +1,389 @@
+"""This module imports HS Code catalogues, such as the national tariff, from CSV or XLSX files.
+
+The file is streamed twice. The first pass validates every row and collects all of the errors, so
+they can be reported together. The second pass, which only happens if there are no errors, writes
+new codes with multi-row inserts instead of saving a document per code, and updates only the codes
+whose description changed."""
+
+import csv
+import re
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import frappe
+from frappe.query_builder import DocType
+from frappe.utils import now_datetime
+
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_hs_code.fiscal_hs_code import (
+    HS_CODE_PATTERN,
+)
+
+__CHUNK_SIZE = 1000
+__INVALID_CODES = re.compile(
+    rf"^(?!{HS_CODE_PATTERN.pattern.strip('^$')}$).*$", re.MULTILINE
+)
+"""Matches each line that isn't a valid HS Code."""
+__MIN_CODE_LENGTH = 8
+__HEADERS = {
+    "hs_code": ("hs code", "hs_code"),
+    "description": ("description",),
+}
+__TITLE = "Import HS Codes"
+
+
+@frappe.whitelist()
+def enqueue_hs_code_import(file_url: str, update_existing: bool | int = 1):
+    """Queue an import of HS Codes from an uploaded file.
+
+    Args:
+        file_url (str): URL of the uploaded CSV or XLSX file.
+        update_existing (bool | int, optional): Whether to update the descriptions of existing HS\
+            Codes. Defaults to 1."""
+
+    frappe.only_for(["System Manager", "Item Manager"])
+
+    path = frappe.get_doc("File", {"file_url": file_url}).get_full_path()
+    if Path(path).suffix.lower() not in (".csv", ".xlsx"):
+        frappe.throw("Please upload a CSV or XLSX file.", title=__TITLE)
+
+    # Check the header now, so a file that can't be read is reported straight away.
+    rows = _read_hs_codes(path)
+    next(rows, None)
+    rows.close()
+
+    frappe.enqueue(
+        import_hs_codes,
+        queue="long",
+        job_id=f"import_hs_codes::{file_url}",
+        deduplicate=True,
+        path=path,
+        update_existing=bool(int(update_existing)),
+        notify_user=frappe.session.user,
+    )
+
+    frappe.msgprint(
+        "HS Code import queued. You will be notified once it completes.",
+        title=__TITLE,
+    )
+
+
+def import_hs_codes(
+    path: str, update_existing: bool = True, notify_user: str | None = None
+) -> dict:
+    """Validate and import the HS Codes in a CSV or XLSX file.
+
+    The file needs a header row with "HS Code" and "Description" columns. Nothing is imported if\
+        any row is invalid.
+
+    Args:
+        path (str): Path to the file.
+        update_existing (bool, optional): Whether to update the descriptions of existing HS\
+            Codes. Defaults to True.
+        notify_user (str | None, optional): User to notify with the result. Defaults to None.
+
+    Returns:
+        dict: The number of HS Codes created and updated, and any validation errors."""
+
+    start = time.monotonic()
+
+    errors = validate_hs_code_file(path)
+    if errors:
+        if notify_user:
+            frappe.publish_realtime(
+                "msgprint",
+                {
+                    "message": (
+                        f"No HS Codes were imported, as {len(errors)} rows are "
+                        f"invalid:<br><br>{'<br>'.join(errors)}"
+                    ),
+                    "title": __TITLE,
+                    "indicator": "red",
+                },
+                user=notify_user,
+            )
+
+        return {"created": 0, "updated": 0, "errors": errors}
+
+    created = updated = 0
+    chunk = []
+    for _, hs_code, description in _read_hs_codes(path):
+        chunk.append((hs_code, description))
+        if len(chunk) == __CHUNK_SIZE:
+            chunk_created, chunk_updated = _upsert_hs_codes(chunk, update_existing)
+            created += chunk_created
+            updated += chunk_updated
+            chunk = []
+
+    if chunk:
+        chunk_created, chunk_updated = _upsert_hs_codes(chunk, update_existing)
+        created += chunk_created
+        updated += chunk_updated
+
+    frappe.db.commit()
+
+    elapsed = time.monotonic() - start
+    message = (
+        f"{created} HS Codes created and {updated} updated in {elapsed:.1f} seconds."
+    )
+
+    if notify_user:
+        frappe.publish_realtime(
+            "msgprint",
+            {"message": message, "title": __TITLE, "indicator": "green"},
+            user=notify_user,
+        )
+
+    return {"created": created, "updated": updated, "errors": []}
+
+
+def validate_hs_code_file(path: str) -> list[str]:
+    """Check every row of an HS Code file in a single pass.
+
+    The codes are collected as they are read, then checked together: the invalid ones with a\
+        single scan of all distinct codes, and the duplicates by their rows.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        list[str]: A message for each invalid row, empty if the file is valid."""
+
+    row_numbers: dict[str, list[int]] = {}
+    errors: list[tuple[int, str]] = []
+
+    for row_number, hs_code, description in _read_hs_codes(path):
+        row_numbers.setdefault(hs_code, []).append(row_number)
+        if not description:
+            errors.append((row_number, f"Row {row_number}: Description is missing."))
+
+    if not row_numbers:
+        return []
+
+    invalid = set(__INVALID_CODES.findall("\n".join(row_numbers)))
+    for hs_code in invalid:
+        message = f'"{hs_code}" is not a valid HS Code. HS Codes must be 8-10 digits.'
+        if hs_code.isdigit() and len(hs_code) < __MIN_CODE_LENGTH:
+            message += (
+                " Codes stored as numbers lose their leading zeros, so store them as text"
+                " or format them with zeros."
+            )
+        errors.extend(
+            (row_number, f"Row {row_number}: {message}")
+            for row_number in row_numbers[hs_code]
+        )
+
+    for hs_code, rows in row_numbers.items():
+        if len(rows) > 1 and hs_code not in invalid:
+            first, *duplicates = rows
+            errors.extend(
+                (
+                    row_number,
+                    f'Row {row_number}: HS Code "{hs_code}" is already in row '
+                    f"{first}.",
+                )
+                for row_number in duplicates
+            )
+
+    return [message for _, message in sorted(errors)]
+
+
+def _read_hs_codes(path: str) -> Iterator[tuple[int, str, str]]:
+    """Stream the HS Codes and descriptions in a file.
+
+    Args:
+        path (str): Path to the file.
+
+    Yields:
+        tuple[int, str, str]: The row number, HS Code and description of each row."""
+
+    rows = _read_rows(path)
+
+    header = [_to_text(cell).lower() for cell in next(rows, [])]
+    columns = {}
+    for fieldname, labels in __HEADERS.items():
+        column = next((i for i, cell in enumerate(header) if cell in labels), None)
+        if column is None:
+            frappe.throw(
+                f'The file must have a "{labels[0].title()}" column.', title=__TITLE
+            )
+        columns[fieldname] = column
+
+    for row_number, row in enumerate(rows, start=2):
+        hs_code = _get_hs_code(row, columns["hs_code"])
+        description = _get_cell(row, columns["description"])
+
+        # Skip blank rows, which are common at the end of spreadsheets.
+        if hs_code or description:
+            yield row_number, hs_code, description
+
+
+def _read_rows(path: str) -> Iterator[list | tuple]:
+    """Stream the rows of a CSV or XLSX file.
+
+    Args:
+        path (str): Path to the file.
+
+    Yields:
+        list | tuple: The cells of each row."""
+
+    if Path(path).suffix.lower() == ".xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows():
+                yield [_get_xlsx_value(cell) for cell in row]
+        finally:
+            workbook.close()
+
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            yield from csv.reader(file)
+
+
+def _get_cell(row: list | tuple, column: int) -> str:
+    """Get a cell of a row as text.
+
+    Args:
+        row (list | tuple): The cells of the row.
+        column (int): Index of the cell.
+
+    Returns:
+        str: The cell text, or an empty string if the row is too short."""
+
+    return _to_text(row[column]) if column < len(row) else ""
+
+
+def _get_hs_code(row: list | tuple, column: int) -> str:
+    """Get the HS Code of a row as text.
+
+    Codes in chapters 01-09 lose their leading zero when a spreadsheet stores them as numbers.\
+        As an 8 digit number may be an 8 digit code or a 9 digit code without its zero, numbers\
+        are only padded when their number format gives the width, and are otherwise taken as\
+        they are, so those too short to be a code are rejected.
+
+    Args:
+        row (list | tuple): The cells of the row.
+        column (int): Index of the cell.
+
+    Returns:
+        str: The HS Code, or an empty string if the row is too short."""
+
+    hs_code = _get_cell(row, column)
+
+    # A line break would split the code when the codes are checked together.
+    return hs_code.replace("\n", " ")
+
+
+def _get_xlsx_value(cell):
+    """Get the value of an XLSX cell, as it is displayed when its number format pads it with zeros.
+
+    Args:
+        cell (Cell): The cell.
+
+    Returns:
+        The value of the cell."""
+
+    number_format = getattr(cell, "number_format", None) or ""
+    if (
+        isinstance(cell.value, (int, float))
+        and set(number_format) == {"0"}
+        and float(cell.value).is_integer()
+    ):
+        return str(int(cell.value)).zfill(len(number_format))
+
+    return cell.value
+
+
+def _to_text(value) -> str:
+    """Convert a cell value to text.
+
+    Spreadsheets often store HS Codes as numbers, so whole numbers lose their decimal point.
+
+    Args:
+        value: The cell value.
+
+    Returns:
+        str: The text of the cell."""
+
+    if value is None:
+        return ""
+
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    return str(value).strip()
+
+
+def _upsert_hs_codes(
+    hs_codes: list[tuple[str, str]], update_existing: bool
+) -> tuple[int, int]:
+    """Write a chunk of HS Codes, inserting the new ones with a single statement.
+
+    Args:
+        hs_codes (list[tuple[str, str]]): The HS Codes and their descriptions.
+        update_existing (bool): Whether to update the descriptions of existing HS Codes.
+
+    Returns:
+        tuple[int, int]: The number of HS Codes created and updated."""
+
+    existing = dict(
+        frappe.get_all(
+            "Fiscal HS Code",
+            filters={"name": ["in", [hs_code for hs_code, _ in hs_codes]]},
+            fields=["name", "description"],
+            as_list=True,
+        )
+    )
+    new = [
+        (hs_code, description)
+        for hs_code, description in hs_codes
+        if hs_code not in existing
+    ]
+    changed = (
+        [
+            (hs_code, description)
+            for hs_code, description in hs_codes
+            if hs_code in existing and existing[hs_code] != description
+        ]
+        if update_existing
+        else []
+    )
+
+    now = now_datetime()
+    user = frappe.session.user
+
+    if new:
+        # Codes inserted by another import since they were read are left as they are.
+        frappe.db.bulk_insert(
+            "Fiscal HS Code",
+            fields=[
+                "name",
+                "hs_code",
+                "description",
+                "creation",
+                "modified",
+                "owner",
+                "modified_by",
+                "docstatus",
+                "idx",
+            ],
+            values=[
+                (hs_code, hs_code, description, now, now, user, user, 0, 0)
+                for hs_code, description in new
+            ],
+            ignore_duplicates=True,
+        )
+
+    hs_code_table = DocType("Fiscal HS Code")
+    for hs_code, description in changed:
+        (
+            frappe.qb.update(hs_code_table)
+            .set(hs_code_table.description, description)
+            .set(hs_code_table.modified, now)
+            .set(hs_code_table.modified_by, user)
+            .where(hs_code_table.name == hs_code)
+        ).run()
+
+    return len(new), len(changed)
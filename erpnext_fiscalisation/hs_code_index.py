@@ -0,0 +1,445 @@
+"""This module maintains a precomputed index of the effective HS Code of every item and item group.
+
+The effective HS Code of an item group is its own HS Code, or else that of its nearest ancestor
+that has one. The effective HS Code of an item is its own HS Code, or else that of its item group.
+
+The index lives in two Redis hashes shared by all workers, with a copy of the entries used so far
+kept in process memory. Every change to the index bumps a version number, which makes each process
+drop its in-memory copy and read the changed entries from Redis again. Entries that were merely
+missing are added without a new version, as no process can hold a different copy of them. Changes to items and item
+groups are only written to the index once they are committed, so a rolled back save leaves it as
+it was. If the index is missing, entries are read from the database while a single background job
+rebuilds it."""
+
+import time
+from functools import partial
+from typing import TYPE_CHECKING
+
+import frappe
+from frappe.query_builder import DocType
+
+if TYPE_CHECKING:
+    from erpnext.setup.doctype.item_group.item_group import ItemGroup
+    from erpnext.stock.doctype.item.item import Item
+
+__ITEMS_KEY = "fh_hs_code_index:items"
+__GROUPS_KEY = "fh_hs_code_index:item_groups"
+__VERSION_KEY = "fh_hs_code_index:version"
+__VERSION_CHECK_INTERVAL = 10
+"""Seconds a long job uses its in-process index before checking the version again."""
+
+_local_indexes: dict[str, dict] = {}
+"""In-process copies of the index, by site."""
+
+
+def get_effective_hs_code(item_code: str | None, item_group: str | None = None) -> str:
+    """Look up the HS Code to use for an item, falling back to the given item group.
+
+    Args:
+        item_code (str | None): The item code, if any.
+        item_group (str | None, optional): The item group to fall back to. Defaults to None.
+
+    Returns:
+        str: The effective HS Code, or an empty string if there is none."""
+
+    index = _get_local_index()
+
+    hs_code = ""
+    if item_code:
+        hs_code = _lookup(index, "items", __ITEMS_KEY, item_code)
+
+    if not hs_code and item_group:
+        hs_code = _lookup(index, "item_groups", __GROUPS_KEY, item_group)
+
+    return hs_code
+
+
+def enqueue_rebuild_index():
+    """Queue a rebuild of the whole index, unless one is already queued."""
+
+    frappe.enqueue(
+        rebuild_index,
+        queue="long",
+        job_id="fh_hs_code_index_rebuild",
+        deduplicate=True,
+    )
+
+
+def rebuild_index():
+    """Rebuild the whole index from the database."""
+
+    redis_keys = (
+        frappe.cache.make_key(__ITEMS_KEY),
+        frappe.cache.make_key(__GROUPS_KEY),
+    )
+    pipeline = frappe.cache.pipeline()
+    pipeline.delete(*redis_keys)
+    pipeline.execute()
+
+    _index_subtree()
+
+
+def on_item_update(doc: "Item", method: str | None = None):
+    """Update the index entry of a saved item when its HS Code or item group changes.
+
+    Args:
+        doc (Item): The saved item.
+        method (str | None, optional): The calling hook. Defaults to None."""
+
+    if doc.has_value_changed("fh_hs_code") or doc.has_value_changed("item_group"):
+        frappe.db.after_commit.add(partial(_index_items, [doc.name]))
+
+
+def on_item_trash(doc: "Item", method: str | None = None):
+    """Remove the index entry of a deleted item.
+
+    Args:
+        doc (Item): The deleted item.
+        method (str | None, optional): The calling hook. Defaults to None."""
+
+    frappe.db.after_commit.add(partial(_remove, items=[doc.name]))
+
+
+def on_item_rename(
+    doc: "Item",
+    method: str | None = None,
+    old: str | None = None,
+    new: str | None = None,
+    merge: bool = False,
+):
+    """Move the index entry of a renamed item.
+
+    Args:
+        doc (Item): The renamed item.
+        method (str | None, optional): The calling hook. Defaults to None.
+        old (str | None, optional): The previous name. Defaults to None.
+        new (str | None, optional): The new name. Defaults to None.
+        merge (bool, optional): Whether it was merged. Defaults to False."""
+
+    frappe.db.after_commit.add(partial(_remove, items=[old]))
+    frappe.db.after_commit.add(partial(_index_items, [new]))
+
+
+def on_item_group_update(doc: "ItemGroup", method: str | None = None):
+    """Update the index entries of an item group's subtree when its HS Code or position changes.
+
+    Args:
+        doc (ItemGroup): The saved item group.
+        method (str | None, optional): The calling hook. Defaults to None."""
+
+    if doc.has_value_changed("fh_hs_code") or doc.has_value_changed(
+        "parent_item_group"
+    ):
+        frappe.db.after_commit.add(partial(_index_groups, [doc.name]))
+
+
+def on_item_group_trash(doc: "ItemGroup", method: str | None = None):
+    """Remove the index entry of a deleted item group.
+
+    Args:
+        doc (ItemGroup): The deleted item group.
+        method (str | None, optional): The calling hook. Defaults to None."""
+
+    frappe.db.after_commit.add(partial(_remove, item_groups=[doc.name]))
+
+
+def on_item_group_rename(
+    doc: "ItemGroup",
+    method: str | None = None,
+    old: str | None = None,
+    new: str | None = None,
+    merge: bool = False,
+):
+    """Move the index entries of a renamed item group.
+
+    Args:
+        doc (ItemGroup): The renamed item group.
+        method (str | None, optional): The calling hook. Defaults to None.
+        old (str | None, optional): The previous name. Defaults to None.
+        new (str | None, optional): The new name. Defaults to None.
+        merge (bool, optional): Whether it was merged. Defaults to False."""
+
+    frappe.db.after_commit.add(partial(_remove, item_groups=[old]))
+    frappe.db.after_commit.add(partial(_index_groups, [new]))
+
+
+def replace_hs_code(old: str, new: str | None):
+    """Replace an HS Code in every index entry that resolves to it, once the change is committed.
+
+    Args:
+        old (str): The HS Code being replaced.
+        new (str | None): The replacement, or None if the HS Code no longer exists."""
+
+    frappe.db.after_commit.add(partial(_replace_hs_code, old, new))
+
+
+def _replace_hs_code(old: str, new: str | None):
+    """Replace an HS Code in every index entry that resolves to it.
+
+    Args:
+        old (str): The HS Code being replaced.
+        new (str | None): The replacement, or None if the HS Code no longer exists."""
+
+    pipeline = frappe.cache.pipeline()
+    for key in (__ITEMS_KEY, __GROUPS_KEY):
+        pipeline.hgetall(frappe.cache.make_key(key))
+    items, groups = pipeline.execute()
+
+    _store(
+        {
+            name.decode(): new or ""
+            for name, value in items.items()
+            if value.decode() == old
+        },
+        {
+            name.decode(): new or ""
+            for name, value in groups.items()
+            if value.decode() == old
+        },
+    )
+
+
+def _lookup(index: dict, section: str, redis_key: str, name: str) -> str:
+    """Fetch one entry from the in-process index, filling it from Redis or the database.
+
+    An entry missing from Redis is read from the database and added to it on its own. If the\
+        whole index is missing, as after Redis is flushed, a rebuild is queued instead, rather\
+        than every worker rebuilding it at once.
+
+    Args:
+        index (dict): The in-process index.
+        section (str): Either "items" or "item_groups".
+        redis_key (str): The Redis hash backing the section.
+        name (str): Name of the item or item group.
+
+    Returns:
+        str: The effective HS Code, or an empty string if there is none."""
+
+    if name in index[section]:
+        return index[section][name]
+
+    redis_key = frappe.cache.make_key(redis_key)
+    pipeline = frappe.cache.pipeline()
+    pipeline.hget(redis_key, name)
+    pipeline.exists(redis_key)
+    value, indexed = pipeline.execute()
+
+    if value is not None:
+        value = value.decode()
+
+    else:
+        value = (
+            _get_item_hs_code(name) if section == "items" else _get_group_hs_code(name)
+        )
+        if not indexed:
+            enqueue_rebuild_index()
+        else:
+            # Only the missing entry is added, without a new version, so other processes keep
+            # their copies. An entry written meanwhile by a committed change is left as it is.
+            frappe.cache.hsetnx(redis_key, name, value)
+
+    index[section][name] = value
+
+    return value
+
+
+def _get_local_index() -> dict:
+    """Return this process's copy of the index, dropping it if the shared index changed.
+
+    The version is checked once per request or job, and again whenever a long job has used its\
+        copy for longer than the check interval.
+
+    Returns:
+        dict: The in-process index."""
+
+    site = frappe.local.site
+    index = _local_indexes.get(site)
+    now = time.monotonic()
+
+    if (
+        index is None
+        or not getattr(frappe.local, "fh_hs_code_index_checked", False)
+        or now - index["checked_at"] >= __VERSION_CHECK_INTERVAL
+    ):
+        version = frappe.cache.get(frappe.cache.make_key(__VERSION_KEY))
+        if index is None or index["version"] != version:
+            index = {"version": version, "items": {}, "item_groups": {}}
+            _local_indexes[site] = index
+        index["checked_at"] = now
+        frappe.local.fh_hs_code_index_checked = True
+
+    return index
+
+
+def _get_item_hs_code(name: str) -> str:
+    """Read the effective HS Code of an item from the database.
+
+    Args:
+        name (str): Name of the item.
+
+    Returns:
+        str: The effective HS Code, or an empty string if there is none."""
+
+    item = frappe.db.get_value("Item", name, ["fh_hs_code", "item_group"], as_dict=True)
+    if item is None:
+        return ""
+
+    return item.fh_hs_code or (
+        _get_group_hs_code(item.item_group) if item.item_group else ""
+    )
+
+
+def _get_group_hs_code(name: str) -> str:
+    """Read the effective HS Code of an item group from the database.
+
+    Args:
+        name (str): Name of the item group.
+
+    Returns:
+        str: The effective HS Code, or an empty string if there is none."""
+
+    bounds = frappe.db.get_value("Item Group", name, ["lft", "rgt"])
+    if not bounds:
+        return ""
+
+    item_groups = DocType("Item Group")
+    hs_code = (
+        frappe.qb.from_(item_groups)
+        .select(item_groups.fh_hs_code)
+        .where(item_groups.lft <= bounds[0])
+        .where(item_groups.rgt >= bounds[1])
+        .where(item_groups.fh_hs_code.isnotnull())
+        .where(item_groups.fh_hs_code != "")
+        .orderby(item_groups.lft, order=frappe.qb.desc)
+        .limit(1)
+    ).run(pluck=True)
+
+    return hs_code[0] if hs_code else ""
+
+
+def _index_subtree(lft: int | None = None, rgt: int | None = None):
+    """Index the item groups within the given nested set bounds, and their items.
+
+    Args:
+        lft (int | None, optional): Left bound of the subtree. Defaults to the tree.
+        rgt (int | None, optional): Right bound of the subtree. Defaults to the tree."""
+
+    bounds = "child.lft >= %(lft)s AND child.rgt <= %(rgt)s" if lft else "1 = 1"
+    groups = dict(
+        frappe.db.sql(
+            f"""
+            SELECT
+                child.name,
+                (
+                    SELECT ancestor.fh_hs_code
+                    FROM `tabItem Group` ancestor
+                    WHERE ancestor.lft <= child.lft
+                        AND ancestor.rgt >= child.rgt
+                        AND IFNULL(ancestor.fh_hs_code, '') != ''
+                    ORDER BY ancestor.lft DESC
+                    LIMIT 1
+                )
+            FROM `tabItem Group` child
+            WHERE {bounds}
+            """,
+            {"lft": lft, "rgt": rgt},
+        )
+    )
+
+    items = {
+        name: hs_code or groups.get(item_group)
+        for name, hs_code, item_group in frappe.db.sql(
+            f"""
+            SELECT item.name, item.fh_hs_code, item.item_group
+            FROM `tabItem` item
+            INNER JOIN `tabItem Group` child ON child.name = item.item_group
+            WHERE {bounds}
+            """,
+            {"lft": lft, "rgt": rgt},
+        )
+    }
+
+    _store(items, groups)
+
+
+def _index_groups(names: list[str]):
+    """Index individual item groups.
+
+    Args:
+        names (list[str]): Names of the item groups."""
+
+    for name in names:
+        bounds = frappe.db.get_value("Item Group", name, ["lft", "rgt"])
+        if bounds:
+            _index_subtree(*bounds)
+
+
+def _index_items(names: list[str]):
+    """Index individual items.
+
+    Args:
+        names (list[str]): Names of the items."""
+
+    items = {}
+    for name, hs_code, item_group in frappe.get_all(
+        "Item",
+        filters={"name": ["in", names]},
+        fields=["name", "fh_hs_code", "item_group"],
+        as_list=True,
+    ):
+        items[name] = hs_code or get_effective_hs_code(None, item_group)
+
+    # Cache misses for items that don't exist, so they aren't looked up again.
+    for name in names:
+        items.setdefault(name, "")
+
+    _store(items, {})
+
+
+def _store(items: dict[str, str | None], groups: dict[str, str | None]):
+    """Write index entries to Redis and bump the index version.
+
+    Args:
+        items (dict[str, str | None]): Effective HS Codes by item.
+        groups (dict[str, str | None]): Effective HS Codes by item group."""
+
+    pipeline = frappe.cache.pipeline()
+    if items:
+        pipeline.hset(
+            frappe.cache.make_key(__ITEMS_KEY),
+            mapping={name: code or "" for name, code in items.items()},
+        )
+    if groups:
+        pipeline.hset(
+            frappe.cache.make_key(__GROUPS_KEY),
+            mapping={name: code or "" for name, code in groups.items()},
+        )
+    pipeline.incr(frappe.cache.make_key(__VERSION_KEY))
+    pipeline.execute()
+
+    _drop_local_index()
+
+
+def _remove(items: list[str] | None = None, item_groups: list[str] | None = None):
+    """Remove index entries from Redis and bump the index version.
+
+    Args:
+        items (list[str] | None, optional): The items. Defaults to None.
+        item_groups (list[str] | None, optional): The item groups. Defaults to None."""
+
+    pipeline = frappe.cache.pipeline()
+    if items:
+        pipeline.hdel(frappe.cache.make_key(__ITEMS_KEY), *items)
+    if item_groups:
+        pipeline.hdel(frappe.cache.make_key(__GROUPS_KEY), *item_groups)
+    pipeline.incr(frappe.cache.make_key(__VERSION_KEY))
+    pipeline.execute()
+
+    _drop_local_index()
+
+
+def _drop_local_index():
+    """Drop this process's copy of the index."""
+
+    _local_indexes.pop(frappe.local.site, None)
+    frappe.local.fh_hs_code_index_checked = False
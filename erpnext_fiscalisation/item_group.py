@@ -1,36 +1,89 @@
 import frappe
 from frappe.query_builder import DocType
-from frappe.query_builder.functions import Count
 
 from erpnext.setup.doctype.item_group.item_group import ItemGroup
 
 
 @frappe.whitelist()
 def set_hs_codes_on_items(group_name: str):
-    """Set HS Codes on items linked to the given item group.
+    """Queue setting HS Codes on the items below the given item group.
 
     Args:
         group_name (str): The name of the item group."""
 
     item_group: ItemGroup = frappe.get_doc("Item Group", group_name)
-    if not item_group:
-        frappe.throw(f'Item Group "{group_name}" does not exist.')
+    if not item_group.fh_hs_code:
+        frappe.throw(f'Item Group "{group_name}" does not have an HS Code.')
 
-    items = DocType("Item")
-    count_query = (
-        frappe.qb.from_(items)
-        .select(Count("*"))
-        .where(items.item_group == group_name)
-        .where(items.fh_hs_code.isnull())
+    frappe.enqueue(
+        propagate_hs_codes,
+        queue="long",
+        job_id=f"propagate_hs_codes::{group_name}",
+        deduplicate=True,
+        group_name=group_name,
+        notify_user=frappe.session.user,
     )
-    item_count = count_query.run()[0][0]
 
-    update_query = (
-        frappe.qb.update(items)
-        .set(items.fh_hs_code, item_group.fh_hs_code)
-        .where(items.item_group == group_name)
-        .where(items.fh_hs_code.isnull())
+    frappe.msgprint(
+        "HS Code update queued. You will be notified once it completes.",
+        title="Set HS Codes on Items",
     )
-    update_query.run()
 
-    frappe.msgprint(f"HS Codes updated on {item_count} items.")
+
+def propagate_hs_codes(group_name: str, notify_user: str | None = None) -> dict:
+    """Set HS Codes on all items below the given item group that don't have one.
+
+    Each item takes the effective HS Code of its item group: the group's own HS Code, or else that
+    of its nearest ancestor that has one, found through the nested set of the Item Group tree.
+    Item groups are left untouched, so subgroups keep inheriting later changes to their parents.
+
+    Args:
+        group_name (str): The name of the item group.
+        notify_user (str | None, optional): User to notify with the result. Defaults to None.
+
+    Returns:
+        dict: The number of items updated."""
+
+    item_groups = DocType("Item Group")
+    lft, rgt = frappe.db.get_value("Item Group", group_name, ["lft", "rgt"])
+    subtree = (
+        frappe.qb.from_(item_groups)
+        .select(item_groups.name, item_groups.rgt, item_groups.fh_hs_code)
+        .where(item_groups.lft >= lft)
+        .where(item_groups.rgt <= rgt)
+        .orderby(item_groups.lft)
+    ).run(as_dict=True)
+
+    # Walking the groups in order of lft visits each ancestor before its descendants.
+    groups_by_code: dict[str, list[str]] = {}
+    ancestors: list[tuple[int, str]] = []
+    for group in subtree:
+        while ancestors and ancestors[-1][0] < group.rgt:
+            ancestors.pop()
+        hs_code = group.fh_hs_code or (ancestors[-1][1] if ancestors else "")
+        ancestors.append((group.rgt, hs_code))
+        if hs_code:
+            groups_by_code.setdefault(hs_code, []).append(group.name)
+
+    items = DocType("Item")
+    items_updated = 0
+    for hs_code, group_names in groups_by_code.items():
+        condition = items.item_group.isin(group_names) & (
+            items.fh_hs_code.isnull() | (items.fh_hs_code == "")
+        )
+        frappe.qb.update(items).set(items.fh_hs_code, hs_code).where(condition).run()
+        items_updated += frappe.db._cursor.rowcount
+
+    frappe.db.commit()
+
+    if notify_user:
+        frappe.publish_realtime(
+            "msgprint",
+            {
+                "message": f"HS Codes updated on {items_updated} items.",
+                "title": "Set HS Codes on Items",
+            },
+            user=notify_user,
+        )
+
+    return {"items": items_updated}
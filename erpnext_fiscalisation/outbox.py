@@ -0,0 +1,185 @@
+"""This module keeps transactions in a durable outbox while Fiscal Harmony is unreachable.
+
+A transaction is queued by setting the queued flag on its Fiscal Signature, which gives it the
+Queued state, so the outbox survives restarts. Queued signatures are found by that state, which
+the (state, creation) index covers, so checking the outbox doesn't scan the table, and they are
+sent in order of submission. New transactions join the back of the outbox while it isn't empty,
+rather than overtaking it. Credit notes still waiting for their invoice leave the outbox to wait
+for it, without holding up the transactions behind them. Each Fiscal Harmony account has its own
+outbox and drain job, so companies don't hold each other up."""
+
+import time
+from typing import TYPE_CHECKING
+
+import frappe
+from frappe.query_builder import DocType
+
+from erpnext_fiscalisation.circuit_breaker import CircuitBreaker
+from erpnext_fiscalisation.profiles import (
+    get_profile,
+    get_profile_key,
+    get_profiles,
+    get_signature_filter,
+)
+from erpnext_fiscalisation.unit_of_work import unit_of_work
+
+if TYPE_CHECKING:
+    from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+        FiscalHarmonySettings,
+    )
+    from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.fiscal_signature import (
+        FiscalSignature,
+    )
+
+__DRAIN_LOCK_KEY = "fiscal_harmony_outbox_drain"
+__DRAIN_SECONDS = 50
+"""How long a drain keeps sending, so it finishes before the next scheduled run."""
+
+
+def should_queue(signature: "FiscalSignature") -> bool:
+    """Check whether a new transaction must go into the outbox instead of being sent now.
+
+    Args:
+        signature (FiscalSignature): The signature of the transaction.
+
+    Returns:
+        bool: Whether to queue the transaction."""
+
+    if CircuitBreaker(signature.fiscal_profile).is_open():
+        return True
+
+    return bool(
+        frappe.db.exists(
+            "Fiscal Signature",
+            {
+                "state": "Queued",
+                "name": ["!=", signature.name],
+                "fiscal_profile": get_signature_filter(signature.fiscal_profile),
+            },
+        )
+    )
+
+
+def drain_outboxes():
+    """Start a drain of every account's outbox that isn't empty, each in its own job."""
+
+    fiscal_settings: FiscalHarmonySettings = frappe.get_cached_doc(
+        "Fiscal Harmony Settings"
+    )
+    if fiscal_settings.disabled or not fiscal_settings.use_outbox:
+        return
+
+    for profile in get_profiles(cached=True):
+        profile_name = profile.get_profile_name()
+        if profile.api_key and frappe.db.exists(
+            "Fiscal Signature",
+            {"state": "Queued", "fiscal_profile": get_signature_filter(profile_name)},
+        ):
+            enqueue_drain(profile_name, enqueue_after_commit=False)
+
+
+def enqueue_drain(profile_name: str | None, enqueue_after_commit: bool = True):
+    """Start a drain of an account's outbox, unless one is already waiting to start.
+
+    Args:
+        profile_name (str | None): The Fiscal Harmony Profile, or None for the default account.
+        enqueue_after_commit (bool, optional): Whether to wait for the current transaction to be\
+            committed. Defaults to True."""
+
+    frappe.enqueue(
+        "erpnext_fiscalisation.outbox.drain_outbox",
+        queue="short",
+        job_id=get_profile_key(__DRAIN_LOCK_KEY, profile_name),
+        deduplicate=True,
+        enqueue_after_commit=enqueue_after_commit,
+        profile_name=profile_name,
+    )
+
+
+def drain_outbox(profile_name: str | None = None):
+    """Send an account's queued transactions in order of submission.
+
+    Draining stops as soon as Fiscal Harmony can't be reached again, leaving the rest queued in\
+        order. Credit notes still waiting for their invoice leave the outbox to wait for it.
+
+    Args:
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None."""
+
+    fiscal_settings: FiscalHarmonySettings = frappe.get_cached_doc(
+        "Fiscal Harmony Settings"
+    )
+    if (
+        fiscal_settings.disabled
+        or not fiscal_settings.use_outbox
+        or not get_profile(profile_name, cached=True).api_key
+    ):
+        return
+
+    if CircuitBreaker(profile_name).is_open():
+        return
+
+    # Only one worker may drain an outbox at a time, or transactions could be sent out of order.
+    lock_key = frappe.cache.make_key(get_profile_key(__DRAIN_LOCK_KEY, profile_name))
+    if not frappe.cache.set(lock_key, 1, nx=True, ex=__DRAIN_SECONDS * 2):
+        return
+
+    try:
+        _drain(
+            profile_name,
+            fiscal_settings.outbox_batch_size or 50,
+            time.monotonic() + __DRAIN_SECONDS,
+        )
+    finally:
+        frappe.cache.delete(lock_key)
+
+
+def _drain(profile_name: str | None, batch_size: int, deadline: float):
+    """Send an account's queued transactions in batches until its outbox is empty or the\
+        deadline passes. Each transaction is sent in a unit of work of its own.
+
+    Args:
+        profile_name (str | None): The Fiscal Harmony Profile, or None for the default account.
+        batch_size (int): Transactions read from the outbox at a time.
+        deadline (float): The monotonic time to stop at."""
+
+    signatures = DocType("Fiscal Signature")
+    cursor = None
+
+    while time.monotonic() < deadline:
+        query = (
+            frappe.qb.from_(signatures)
+            .select(signatures.name, signatures.creation)
+            .where(signatures.state == "Queued")
+            .where(
+                signatures.fiscal_profile == profile_name
+                if profile_name
+                else signatures.fiscal_profile.isnull()
+            )
+            .orderby(signatures.creation)
+            .orderby(signatures.name)
+            .limit(batch_size)
+        )
+        if cursor:
+            query = query.where(
+                (signatures.creation > cursor[0])
+                | ((signatures.creation == cursor[0]) & (signatures.name > cursor[1]))
+            )
+
+        rows = query.run(as_dict=True)
+        if not rows:
+            return
+
+        for row in rows:
+            cursor = (row.creation, row.name)
+
+            # Each transaction is committed as soon as it is sent, so a failure later in the
+            # batch can't roll back what Fiscal Harmony has already fiscalised.
+            with unit_of_work():
+                signature: FiscalSignature = frappe.get_doc(
+                    "Fiscal Signature", row.name
+                )
+                sent = signature.send_from_outbox()
+
+            if not sent:
+                return
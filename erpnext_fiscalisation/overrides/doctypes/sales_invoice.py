@@ -4,15 +4,24 @@ import frappe
 
 from erpnext.accounts.doctype.sales_invoice.sales_invoice import SalesInvoice
 
+from erpnext_fiscalisation.preflight import validate_transaction
+from erpnext_fiscalisation.profiles import is_fiscalisation_enabled
+
 
 class FiscalSalesInvoice(SalesInvoice):
     """This subclass of SalesInvoice implements fiscalisation processes."""
 
+    def validate(self):
+        super().validate()
+
+        # Check the fiscal payload can be built before submitting, rather than failing after.
+        if self.docstatus == 1 and is_fiscalisation_enabled(self.company):
+            validate_transaction(self)
+
     def on_submit(self):
         super().on_submit()
 
-        fiscal_settings = frappe.get_single("Fiscal Harmony Settings")
-        if not fiscal_settings.disabled:
+        if is_fiscalisation_enabled(self.company):
             signature = frappe.new_doc("Fiscal Signature")
             signature.sales_invoice = self.name
             signature.insert(ignore_permissions=True)
@@ -0,0 +1,126 @@
+"""This module defines helpers for patches that touch large tables."""
+
+import time
+from typing import Any
+
+import frappe
+from frappe.query_builder import DocType
+from pypika.terms import Criterion, Field
+
+
+def update_in_chunks(
+    doctype: str,
+    values: dict[str, Any],
+    condition: Criterion | None = None,
+    chunk_size: int = 5000,
+    checkpoint_key: str | None = None,
+) -> dict[str, float]:
+    """Update the rows of a doctype in primary key ordered chunks, committing after each chunk.
+
+    Only one chunk is locked at a time, so the table stays usable while the patch runs. Progress is\
+        checkpointed with every commit, so a patch interrupted part way resumes after the last\
+        completed chunk when it runs again. Rows that already have the new values are skipped. The\
+        rows changed and their rate are printed after each chunk.
+
+    Args:
+        doctype (str): The doctype whose table is updated.
+        values (dict[str, Any]): Field names mapped to their new value. Values may be query\
+            builder terms on `DocType(doctype)`.
+        condition (Criterion | None, optional): Only rows matching this are updated.\
+            Defaults to None.
+        chunk_size (int, optional): Rows updated per commit. Defaults to 5000.
+        checkpoint_key (str | None, optional): Key the progress is stored under. Defaults to one\
+            derived from the doctype and fields.
+
+    Returns:
+        dict[str, float]: The number of rows changed, the seconds taken and the rows changed per\
+            second."""
+
+    table = DocType(doctype)
+    condition = Criterion.all(
+        ([condition] if condition is not None else [])
+        + [
+            Criterion.any(
+                _differs(table[field], value) for field, value in values.items()
+            )
+        ]
+    )
+    checkpoint_key = checkpoint_key or f"patch_checkpoint:{doctype}:{','.join(values)}"
+    last_name = frappe.db.get_global(checkpoint_key) or ""
+
+    updated = 0
+    start = time.monotonic()
+
+    while True:
+        chunk_start = time.monotonic()
+        select_query = (
+            frappe.qb.from_(table)
+            .select(table.name)
+            .where(table.name > last_name)
+            .where(condition)
+            .orderby(table.name)
+            .limit(chunk_size)
+        )
+        names = select_query.run(pluck=True)
+        if not names:
+            break
+
+        update_query = (
+            frappe.qb.update(table)
+            .where(table.name > last_name)
+            .where(table.name <= names[-1])
+            .where(condition)
+        )
+        for fieldname, value in values.items():
+            update_query = update_query.set(table[fieldname], value)
+        update_query.run()
+
+        last_name = names[-1]
+        updated += len(names)
+        frappe.db.set_global(checkpoint_key, last_name)
+        frappe.db.commit()
+
+        chunk_elapsed = time.monotonic() - chunk_start
+        print(
+            f"{doctype}: {updated} rows updated "
+            f"({_rate(len(names), chunk_elapsed):.0f} rows/s)"
+        )
+
+    frappe.db.set_global(checkpoint_key, None)
+    frappe.db.commit()
+
+    elapsed = time.monotonic() - start
+    return {
+        "rows": updated,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(_rate(updated, elapsed), 2),
+    }
+
+
+def _rate(rows: int, elapsed: float) -> float:
+    """Get the rows changed per second.
+
+    Args:
+        rows (int): The rows changed.
+        elapsed (float): The seconds taken.
+
+    Returns:
+        float: The rate, or the rows themselves if no time was measured."""
+
+    return rows / elapsed if elapsed else rows
+
+
+def _differs(field: Field, value: Any) -> Criterion:
+    """Build the condition that a field doesn't already have a value.
+
+    Args:
+        field (Field): The field.
+        value (Any): The new value, or a query builder term.
+
+    Returns:
+        Criterion: The condition."""
+
+    if value is None:
+        return field.isnotnull()
+
+    return (field != value) | field.isnull()
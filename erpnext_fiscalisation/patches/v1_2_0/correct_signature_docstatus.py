@@ -1,15 +1,16 @@
 """This patch corrects the docstatus of Fiscal Signatures to correctly reflect 0."""
 
-import frappe
 from frappe.query_builder import DocType
 
+from erpnext_fiscalisation.patches.utils import update_in_chunks
+
 
 def execute():
     """This patch corrects the docstatus of Fiscal Signatures to correctly reflect 0."""
 
     fiscal_signatures = DocType("Fiscal Signature")
-    (
-        frappe.qb.update(fiscal_signatures)
-        .set(fiscal_signatures.docstatus, 0)
-        .where(fiscal_signatures.docstatus != 0)
-    ).run()
+    update_in_chunks(
+        "Fiscal Signature",
+        {"docstatus": 0},
+        fiscal_signatures.docstatus != 0,
+    )
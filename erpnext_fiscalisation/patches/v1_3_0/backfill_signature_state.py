@@ -0,0 +1,31 @@
+"""This patch populates the state of existing Fiscal Signatures."""
+
+from frappe.query_builder import Case, DocType
+
+from erpnext_fiscalisation.patches.utils import update_in_chunks
+
+
+def execute():
+    """This patch populates the state of existing Fiscal Signatures."""
+
+    fiscal_signatures = DocType("Fiscal Signature")
+    state = (
+        Case()
+        .when(fiscal_signatures.dead_letter == 1, "Dead Letter")
+        .when(fiscal_signatures.is_retry == 1, "Needs Retry")
+        .when(
+            fiscal_signatures.fdms_url.isnotnull() & (fiscal_signatures.fdms_url != ""),
+            "Fiscalised",
+        )
+        .when(
+            fiscal_signatures.error.isnotnull() & (fiscal_signatures.error != ""),
+            "Error",
+        )
+        .else_("Pending FH Response")
+    )
+
+    totals = update_in_chunks("Fiscal Signature", {"state": state})
+    print(
+        f"Fiscal Signature: state set on {totals['rows']} rows in {totals['seconds']}s "
+        f"({totals['rows_per_second']:.0f} rows/s)"
+    )
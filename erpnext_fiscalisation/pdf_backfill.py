@@ -0,0 +1,227 @@
+"""This module backfills fiscal PDFs that were never archived against their invoices."""
+
+import time
+from typing import Iterator
+
+import frappe
+from frappe.query_builder import DocType
+from frappe.query_builder.functions import Concat
+from frappe.utils import getdate
+
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+    FiscalHarmonySettings,
+)
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.fiscal_signature import (
+    FiscalSignature,
+)
+from erpnext_fiscalisation.profiles import get_profile
+from erpnext_fiscalisation.unit_of_work import unit_of_work
+
+__CHECKPOINT_KEY = "fiscal_pdf_backfill:{}:{}"
+
+
+@frappe.whitelist()
+def enqueue_fiscal_pdf_backfill(from_date: str, to_date: str):
+    """Queue a backfill of missing fiscal PDFs for invoices posted in the given date range.
+
+    Args:
+        from_date (str): The first posting date to include.
+        to_date (str): The last posting date to include."""
+
+    frappe.only_for("System Manager")
+
+    frappe.enqueue(
+        backfill_fiscal_pdfs,
+        queue="long",
+        timeout=6 * 60 * 60,
+        job_id=f"fiscal_pdf_backfill::{from_date}::{to_date}",
+        deduplicate=True,
+        from_date=from_date,
+        to_date=to_date,
+        notify_user=frappe.session.user,
+    )
+
+    frappe.msgprint(
+        "The fiscal PDF backfill has been queued. You will be notified once it completes.",
+        title="Fiscal PDF Backfill",
+    )
+
+
+def backfill_fiscal_pdfs(
+    from_date: str,
+    to_date: str,
+    batch_size: int = 100,
+    max_workers: int = 4,
+    requests_per_second: float = 5.0,
+    restart: bool = False,
+    notify_user: str | None = None,
+) -> dict:
+    """Download and archive the fiscal PDFs of signatures that have a Fiscal Harmony filename but\
+        no archived File.
+
+    Progress is checkpointed after every batch, so an interrupted run resumes where it stopped.
+
+    Args:
+        from_date (str): The first posting date to include.
+        to_date (str): The last posting date to include.
+        batch_size (int, optional): Signatures processed per batch. Defaults to 100.
+        max_workers (int, optional): Number of concurrent downloads. Defaults to 4.
+        requests_per_second (float, optional): Maximum rate at which downloads are started.\
+            Defaults to 5.0.
+        restart (bool, optional): Whether to ignore a previous checkpoint. Defaults to False.
+        notify_user (str | None, optional): User to notify with the summary. Defaults to None.
+
+    Returns:
+        dict: Summary of the run."""
+
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    checkpoint_key = __CHECKPOINT_KEY.format(from_date, to_date)
+    checkpoint = "" if restart else (frappe.db.get_global(checkpoint_key) or "")
+
+    fiscal_settings: FiscalHarmonySettings = frappe.get_doc("Fiscal Harmony Settings")
+    summary = {
+        "processed": 0,
+        "attached": 0,
+        "failed": 0,
+        "bytes": 0,
+        "seconds": 0.0,
+    }
+    start = time.monotonic()
+
+    while names := _get_missing_pdf_signatures(
+        from_date, to_date, checkpoint, batch_size
+    ):
+        signatures: list[FiscalSignature] = [
+            frappe.get_doc("Fiscal Signature", name) for name in names
+        ]
+
+        if fiscal_settings.attach_local_print:
+            results = (
+                (
+                    signature,
+                    frappe.get_print(
+                        "Sales Invoice", signature.sales_invoice, as_pdf=True
+                    ),
+                )
+                for signature in signatures
+            )
+        else:
+            results = _download_fiscal_pdfs(
+                signatures, max_workers, requests_per_second
+            )
+
+        for signature, pdf in results:
+            summary["processed"] += 1
+
+            # Each PDF is committed with its File, so a failure doesn't orphan the files
+            # already written for the rest of the batch.
+            with unit_of_work():
+                attached = bool(pdf) and signature.attach_pdf(pdf)
+
+            if attached:
+                summary["attached"] += 1
+                summary["bytes"] += len(pdf)
+            else:
+                summary["failed"] += 1
+
+        checkpoint = names[-1]
+        with unit_of_work():
+            frappe.db.set_global(checkpoint_key, checkpoint)
+
+    with unit_of_work():
+        frappe.db.set_global(checkpoint_key, None)
+
+    summary["seconds"] = round(time.monotonic() - start, 2)
+    if notify_user:
+        frappe.publish_realtime(
+            "msgprint",
+            {"message": format_summary(summary), "title": "Fiscal PDF Backfill"},
+            user=notify_user,
+        )
+
+    return summary
+
+
+def _download_fiscal_pdfs(
+    signatures: list[FiscalSignature], max_workers: int, requests_per_second: float
+) -> Iterator[tuple[FiscalSignature, bytes | None]]:
+    """Download the fiscal PDFs of several signatures, each with the account that fiscalised it.
+
+    Args:
+        signatures (list[FiscalSignature]): Signatures with a Fiscal Harmony filename.
+        max_workers (int): Number of concurrent downloads for each account.
+        requests_per_second (float): Maximum rate at which each account's downloads are started.
+
+    Yields:
+        tuple[FiscalSignature, bytes | None]: Each signature with its PDF content, or None if\
+            the download failed."""
+
+    by_profile: dict[str | None, list[FiscalSignature]] = {}
+    for signature in signatures:
+        by_profile.setdefault(signature.fiscal_profile, []).append(signature)
+
+    for profile_name, profile_signatures in by_profile.items():
+        yield from get_profile(profile_name).download_fiscal_pdfs(
+            profile_signatures,
+            max_workers=max_workers,
+            requests_per_second=requests_per_second,
+        )
+
+
+def _get_missing_pdf_signatures(
+    from_date, to_date, checkpoint: str, batch_size: int
+) -> list[str]:
+    """Fetch the next batch of signatures with a fiscal PDF that was never archived.
+
+    Args:
+        from_date (date): The first posting date to include.
+        to_date (date): The last posting date to include.
+        checkpoint (str): Only signatures named after this are returned.
+        batch_size (int): Maximum number of signatures to return.
+
+    Returns:
+        list[str]: Names of the signatures in primary key order."""
+
+    signatures = DocType("Fiscal Signature")
+    invoices = DocType("Sales Invoice")
+    files = DocType("File")
+
+    query = (
+        frappe.qb.from_(signatures)
+        .join(invoices)
+        .on(invoices.name == signatures.sales_invoice)
+        .left_join(files)
+        .on(
+            (files.attached_to_doctype == "Sales Invoice")
+            & (files.attached_to_name == signatures.sales_invoice)
+            & (files.file_name == Concat(signatures.sales_invoice, ".pdf"))
+        )
+        .select(signatures.name)
+        .where(signatures.name > checkpoint)
+        .where(signatures.fiscal_harmony_filename.isnotnull())
+        .where(signatures.fiscal_harmony_filename != "")
+        .where(invoices.posting_date[from_date:to_date])
+        .where(files.name.isnull())
+        .orderby(signatures.name)
+        .limit(batch_size)
+    )
+
+    return [row[0] for row in query.run()]
+
+
+def format_summary(summary: dict) -> str:
+    """Describe the result of a backfill run, including its throughput.
+
+    Args:
+        summary (dict): Summary of the run.
+
+    Returns:
+        str: The human readable summary."""
+
+    seconds = summary["seconds"] or 1
+    return (
+        f"Processed {summary['processed']} signatures in {summary['seconds']}s: "
+        f"{summary['attached']} PDFs attached, {summary['failed']} failed. "
+        f"Throughput {summary['processed'] / seconds:.2f} signatures/s, "
+        f"{summary['bytes'] / seconds / 1024:.1f} KiB/s."
+    )
@@ -0,0 +1,174 @@
+"""This module checks that a transaction can be fiscalised before it is submitted.
+
+The checks mirror what the fiscal payload needs, using only the cached settings, supported
+currencies and HS Code index, so a transaction that would fail fiscalisation is rejected without a
+request to Fiscal Harmony, a log entry or a retry."""
+
+from typing import TYPE_CHECKING
+
+import frappe
+
+from erpnext_fiscalisation.currencies import (
+    get_fiscal_currency,
+    get_supported_currencies,
+)
+from erpnext_fiscalisation.hs_code_index import get_effective_hs_code
+from erpnext_fiscalisation.profiles import get_profile, get_profile_name
+
+if TYPE_CHECKING:
+    from erpnext.accounts.doctype.sales_invoice.sales_invoice import SalesInvoice
+    from erpnext.accounts.doctype.sales_invoice_item.sales_invoice_item import (
+        SalesInvoiceItem,
+    )
+
+    from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+        FiscalHarmonySettings,
+    )
+
+
+def validate_transaction(transaction: "SalesInvoice"):
+    """Reject the transaction if it can't be fiscalised, listing every problem found.
+
+    Args:
+        transaction (SalesInvoice): The invoice or credit note being submitted."""
+
+    errors = get_transaction_errors(transaction)
+    if errors:
+        frappe.throw(
+            f"{transaction.name} can't be fiscalised:<ul>"
+            + "".join(f"<li>{error}</li>" for error in errors)
+            + "</ul>",
+            title="Fiscalisation Error",
+        )
+
+
+def get_transaction_errors(transaction: "SalesInvoice") -> list[str]:
+    """Check the transaction against everything its fiscal payload needs.
+
+    Args:
+        transaction (SalesInvoice): The invoice or credit note being submitted.
+
+    Returns:
+        list[str]: A message for each problem, empty if there are none."""
+
+    fiscal_settings: FiscalHarmonySettings = frappe.get_cached_doc(
+        "Fiscal Harmony Settings"
+    )
+    profile_name = get_profile_name(transaction.company)
+    errors = []
+
+    if transaction.is_return and not transaction.return_against:
+        errors.append("Credit notes must be made against an invoice.")
+
+    fiscal_currency = get_fiscal_currency(transaction.currency, profile_name)
+    supported_currencies = get_supported_currencies(profile_name)
+    if not fiscal_currency:
+        errors.append(f"The currency {transaction.currency} has not been mapped.")
+    elif supported_currencies and fiscal_currency not in supported_currencies:
+        errors.append(
+            f"The currency {fiscal_currency} is not supported by Fiscal Harmony."
+        )
+
+    errors.extend(_get_buyer_errors(transaction))
+
+    tax_codes, default_tax_code = get_tax_codes(get_profile(profile_name, cached=True))
+    for item in transaction.items:
+        if not resolve_tax_code(item, transaction, tax_codes, default_tax_code):
+            errors.append(
+                f'Row {item.idx}: No mapped tax template for item "{item.item_name}".'
+            )
+
+        if fiscal_settings.include_hs_codes and not get_effective_hs_code(
+            item.item_code, item.item_group
+        ):
+            errors.append(f'Row {item.idx}: No HS Code for item "{item.item_name}".')
+
+    return errors
+
+
+def get_tax_codes(
+    fiscal_settings: "FiscalHarmonySettings",
+) -> tuple[set[str], str | None]:
+    """Collect the mapped tax codes.
+
+    Args:
+        fiscal_settings (FiscalHarmonySettings): The Fiscal Harmony settings or profile.
+
+    Returns:
+        tuple[set[str], str | None]: The mapped tax codes and the default tax code."""
+
+    tax_codes = set()
+    default_tax_code = None
+    for tax_mapping in fiscal_settings.tax_mappings:
+        tax_codes.add(tax_mapping.tax_code)
+        if tax_mapping.is_default:
+            default_tax_code = tax_mapping.tax_code
+
+    return tax_codes, default_tax_code
+
+
+def resolve_tax_code(
+    item: "SalesInvoiceItem",
+    transaction: "SalesInvoice",
+    tax_codes: set[str],
+    default_tax_code: str | None,
+) -> str | None:
+    """Work out the tax code of a line item.
+
+    An item-specific tax code is tried first, then the document tax code, and then the default.
+
+    Args:
+        item (SalesInvoiceItem): The line item.
+        transaction (SalesInvoice): The invoice or credit note.
+        tax_codes (set[str]): The mapped tax codes.
+        default_tax_code (str | None): The default tax code.
+
+    Returns:
+        str | None: The tax code, or None if none of them are mapped."""
+
+    if item.item_tax_template in tax_codes:
+        return item.item_tax_template
+    if transaction.taxes_and_charges in tax_codes:
+        return transaction.taxes_and_charges
+
+    return default_tax_code
+
+
+def _get_buyer_errors(transaction: "SalesInvoice") -> list[str]:
+    """Check the contact and address used for the buyer details.
+
+    Args:
+        transaction (SalesInvoice): The invoice or credit note.
+
+    Returns:
+        list[str]: A message for each problem."""
+
+    errors = []
+
+    if not transaction.contact_person:
+        errors.append("A contact person is required.")
+    elif not frappe.db.exists("Contact", transaction.contact_person):
+        errors.append(f"The contact {transaction.contact_person} does not exist.")
+
+    if not transaction.customer_address:
+        errors.append("A customer address is required.")
+    else:
+        address = frappe.db.get_value(
+            "Address",
+            transaction.customer_address,
+            ["address_line1", "city"],
+            as_dict=True,
+        )
+        if not address:
+            errors.append(f"The address {transaction.customer_address} does not exist.")
+        else:
+            if not address.address_line1:
+                errors.append(
+                    f"The address {transaction.customer_address} has no address line."
+                )
+            if not address.city:
+                errors.append(
+                    f"The address {transaction.customer_address} has no city."
+                )
+
+    return errors
@@ -3,10 +3,21 @@
 import io
 import base64
 import qrcode
+import qrcode.constants
+import qrcode.image.svg
 
 import frappe
 
-__PNG_SRC_TEMPLATE = r"data:image/png;base64,{}"
+__SRC_TEMPLATES = {
+    "PNG": r"data:image/png;base64,{}",
+    "SVG": r"data:image/svg+xml;base64,{}",
+}
+__ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
 
 
 def get_fiscal_details(invoice: str) -> dict:
@@ -29,11 +40,16 @@ def get_fiscal_details(invoice: str) -> dict:
 def get_fiscal_qr_code(invoice: str) -> str:
     """Generate the QR code to display on a fiscalised invoice/credit note.
 
+    The output format and encoding parameters are taken from Fiscal Harmony Settings.
+
     Args:
         invoice (str): Name of the document.
 
     Returns:
-        str: The QR code PNG data."""
+        str: The QR code image as a data URI."""
+
+    fiscal_settings = frappe.get_cached_doc("Fiscal Harmony Settings")
+    output_format = fiscal_settings.qr_code_format or "PNG"
 
     fdms_url = frappe.get_value(
         "Fiscal Signature",
@@ -42,12 +58,55 @@ def get_fiscal_qr_code(invoice: str) -> str:
     )
 
     if not fdms_url:
-        return __PNG_SRC_TEMPLATE.format("")
+        return __SRC_TEMPLATES[output_format].format("")
+
+    return render_qr_code(
+        fdms_url,
+        output_format=output_format,
+        box_size=fiscal_settings.qr_box_size or 10,
+        border=(
+            fiscal_settings.qr_border if fiscal_settings.qr_border is not None else 4
+        ),
+        error_correction=fiscal_settings.qr_error_correction or "M",
+    )
+
+
+def render_qr_code(
+    data: str,
+    output_format: str = "PNG",
+    box_size: int = 10,
+    border: int = 4,
+    error_correction: str = "M",
+) -> str:
+    """Encode `data` as a QR code image.
 
-    img = qrcode.make(fdms_url)
+    Args:
+        data (str): The content of the QR code.
+        output_format (str, optional): Either "PNG" or "SVG". Defaults to "PNG".
+        box_size (int, optional): Size of each module. Defaults to 10.
+        border (int, optional): Width of the quiet zone in modules. Defaults to 4.
+        error_correction (str, optional): One of "L", "M", "Q" or "H". Defaults to "M".
+
+    Returns:
+        str: The QR code image as a data URI."""
+
+    qr = qrcode.QRCode(
+        box_size=box_size,
+        border=border,
+        error_correction=__ERROR_CORRECTION_LEVELS[error_correction],
+        image_factory=(
+            qrcode.image.svg.SvgPathImage if output_format == "SVG" else None
+        ),
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image()
 
     buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
+    if output_format == "SVG":
+        img.save(buffered)
+    else:
+        img.save(buffered, format="PNG")
     img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
 
-    return __PNG_SRC_TEMPLATE.format(img_str)
+    return __SRC_TEMPLATES[output_format].format(img_str)
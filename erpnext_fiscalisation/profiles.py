@@ -0,0 +1,117 @@
+"""This module finds the Fiscal Harmony account that fiscalises each company's transactions.
+
+A company with a Fiscal Harmony Profile uses its own credentials, mappings and rate limits, and has
+its own circuit breaker, outbox, retry slots and device status, so its volume doesn't hold up other
+companies. Every other company uses the default account in Fiscal Harmony Settings, which also
+holds the settings shared by all accounts."""
+
+from typing import TYPE_CHECKING
+
+import frappe
+
+if TYPE_CHECKING:
+    from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+        FiscalHarmonySettings,
+    )
+
+
+def get_profile_name(company: str | None) -> str | None:
+    """Get the name of a company's Fiscal Harmony Profile.
+
+    Args:
+        company (str | None): The company.
+
+    Returns:
+        str | None: The name of the profile, or None if the company uses the default\
+            account."""
+
+    if not company:
+        return None
+
+    return frappe.db.get_value("Fiscal Harmony Profile", {"company": company}, "name")
+
+
+def get_profile(
+    profile_name: str | None = None, cached: bool = False
+) -> "FiscalHarmonySettings":
+    """Get a Fiscal Harmony account.
+
+    Args:
+        profile_name (str | None, optional): The name of the profile, or None for the default\
+            account. Defaults to None.
+        cached (bool, optional): Whether to use the cached document. Defaults to False.
+
+    Returns:
+        FiscalHarmonySettings: The profile, or Fiscal Harmony Settings."""
+
+    doctype = "Fiscal Harmony Profile" if profile_name else "Fiscal Harmony Settings"
+    name = profile_name or doctype
+
+    return (
+        frappe.get_cached_doc(doctype, name)
+        if cached
+        else frappe.get_doc(doctype, name)
+    )
+
+
+def get_profiles(cached: bool = False) -> list["FiscalHarmonySettings"]:
+    """Get the default account and every enabled profile.
+
+    Args:
+        cached (bool, optional): Whether to use the cached documents. Defaults to False.
+
+    Returns:
+        list[FiscalHarmonySettings]: The settings, followed by the profiles."""
+
+    return [get_profile(cached=cached)] + [
+        get_profile(name, cached)
+        for name in frappe.get_all(
+            "Fiscal Harmony Profile", filters={"disabled": 0}, pluck="name"
+        )
+    ]
+
+
+def is_fiscalisation_enabled(company: str | None) -> bool:
+    """Check whether a company's transactions are fiscalised.
+
+    Args:
+        company (str | None): The company.
+
+    Returns:
+        bool: False if fiscalisation is disabled in Fiscal Harmony Settings, or in the company's\
+            profile."""
+
+    if frappe.get_cached_doc("Fiscal Harmony Settings").disabled:
+        return False
+
+    profile_name = get_profile_name(company)
+
+    return not (
+        profile_name
+        and frappe.db.get_value("Fiscal Harmony Profile", profile_name, "disabled")
+    )
+
+
+def get_profile_key(key: str, profile_name: str | None) -> str:
+    """Get the cache key of some state kept for each account.
+
+    Args:
+        key (str): The cache key of the default account.
+        profile_name (str | None): The name of the profile, or None for the default account.
+
+    Returns:
+        str: The cache key of the account."""
+
+    return f"{key}:{profile_name}" if profile_name else key
+
+
+def get_signature_filter(profile_name: str | None) -> str | list:
+    """Get the filter matching the `fiscal_profile` of an account's signatures.
+
+    Args:
+        profile_name (str | None): The name of the profile, or None for the default account.
+
+    Returns:
+        str | list: The filter value."""
+
+    return profile_name or ["is", "not set"]
@@ -5,7 +5,7 @@ frappe.ui.form.on("Item Group", {
         frappe.throw("Please save pending changes before proceeding.");
       } else {
         frappe.confirm(
-          "Are you sure that you want to update the HS Code on linked items that do not yet have an HS Code set?",
+          "Are you sure that you want to set the HS Code on all items below this group that do not yet have an HS Code set?",
           () => {
             frappe.call({
               method: "erpnext_fiscalisation.item_group.set_hs_codes_on_items",
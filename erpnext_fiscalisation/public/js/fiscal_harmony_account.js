@@ -0,0 +1,130 @@
+// Copyright (c) 2026, Eskill Trading (Pvt) Ltd and contributors
+// For license information, please see license.txt
+
+// Shared by the forms of Fiscal Harmony Settings and Fiscal Harmony Profile, which hold the
+// details of a Fiscal Harmony account and have the same API methods.
+frappe.provide("erpnext_fiscalisation.fiscal_harmony_account");
+
+/**
+ * Calls a method of the account that sends requests with its API details.
+ * @param frm A reference to the form body.
+ * @param method The name of the method.
+ */
+erpnext_fiscalisation.fiscal_harmony_account.callAccountMethod = (
+  frm,
+  method
+) => {
+  if (!(frm.doc.api_key && frm.doc.api_secret) || frm.is_dirty()) return;
+
+  frappe.call({
+    doc: frm.doc,
+    method: method,
+    callback: (_) => frm.reload_doc(),
+  });
+};
+
+/**
+ * Prompt the user for API authentication details, and update them if they are valid.
+ * @param frm A reference to the form body.
+ */
+erpnext_fiscalisation.fiscal_harmony_account.updateApiToken = (frm) => {
+  if (frm.is_dirty()) frm.save();
+  frappe.prompt(
+    [
+      {
+        label: "API Key",
+        fieldname: "api_key",
+        fieldtype: "Data",
+        reqd: true,
+        default: frm.doc.api_key,
+      },
+      {
+        label: "API Secret",
+        fieldname: "api_secret",
+        fieldtype: "Password",
+        reqd: true,
+      },
+    ],
+    (values) => {
+      const apiKey = values.api_key;
+      const apiSecret = values.api_secret;
+
+      const keyRegex = /^[A-Z\d]{32}$/gm;
+      if (keyRegex.exec(apiKey) == null) {
+        frappe.throw("Please provide a valid API key.");
+      }
+      const secretRegex = /^[a-zA-Z\d\/\+]{86}==$/gm;
+      if (secretRegex.exec(apiSecret) == null) {
+        frappe.throw("Please provide a valid API secret.");
+      }
+
+      frappe.call({
+        doc: frm.doc,
+        method: "validate_api_details",
+        args: {
+          api_key: apiKey,
+          api_secret: apiSecret,
+        },
+        callback: (_) => frm.reload_doc(),
+      });
+    },
+    "Update API Key & Secret",
+    "Submit"
+  );
+};
+
+/**
+ * Shows how often requests sent with the account waited on its rate limits, and for how long.
+ * @param frm A reference to the form body.
+ */
+erpnext_fiscalisation.fiscal_harmony_account.showRateLimitMetrics = (frm) => {
+  const args =
+    frm.doctype === "Fiscal Harmony Profile"
+      ? { profile_name: frm.doc.name }
+      : {};
+
+  frappe.call({
+    method: "erpnext_fiscalisation.rate_limiter.get_rate_limit_metrics",
+    args: args,
+    callback: (r) => {
+      const rows = Object.entries(r.message)
+        .map(
+          ([routeClass, m]) =>
+            `<tr><td>${routeClass}</td>` +
+            `<td>${m.requests_per_second || __("None")} / ${m.burst}</td>` +
+            `<td>${m.requests}</td><td>${m.throttled}</td>` +
+            `<td>${m.average_wait}</td><td>${m.max_wait}</td></tr>`
+        )
+        .join("");
+
+      const headers = [
+        "Route Class",
+        "Limit (Rate / Burst)",
+        "Requests",
+        "Waited",
+        "Average Wait (s)",
+        "Longest Wait (s)",
+      ]
+        .map((header) => `<th>${__(header)}</th>`)
+        .join("");
+
+      const dialog = frappe.msgprint({
+        title: __("Rate Limit Metrics"),
+        message:
+          '<table class="table table-bordered">' +
+          `<thead><tr>${headers}</tr></thead><tbody>${rows}</tbody></table>`,
+        wide: true,
+        primary_action: {
+          label: __("Reset"),
+          action: () => {
+            frappe.call({
+              method: "erpnext_fiscalisation.rate_limiter.reset_rate_limit_metrics",
+              args: args,
+              callback: () => dialog.hide(),
+            });
+          },
+        },
+      });
+    },
+  });
+};
@@ -0,0 +1,211 @@
+"""This module limits the rate of requests to Fiscal Harmony across all workers.
+
+Each route class has a token bucket in Redis, updated atomically by a Lua script. A request that
+finds the bucket empty reserves the next token and sleeps until it is due, instead of polling, so
+waiting requests are served in order. Every acquisition is counted, along with the time spent
+waiting, to show whether the limits are holding requests back."""
+
+import time
+from typing import TYPE_CHECKING
+
+import frappe
+
+from erpnext_fiscalisation.profiles import get_profile_key
+
+if TYPE_CHECKING:
+    from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+        FiscalHarmonySettings,
+    )
+
+ROUTE_CLASSES = ("Fiscalise", "Status", "Download", "Mapping", "Device", "Other")
+
+DEFAULT_LIMITS = {
+    "Fiscalise": (5.0, 10),
+    "Status": (2.0, 5),
+    "Download": (5.0, 10),
+    "Mapping": (5.0, 10),
+    "Device": (1.0, 2),
+    "Other": (2.0, 5),
+}
+"""Requests per second and burst size of each route class, unless set in the settings or profile."""
+
+
+class RateLimiter:
+    """A token bucket shared by all workers, limiting the requests of one route class of an\
+        account.
+
+    The Redis keys and client are resolved when it is created, so it must be created on a thread\
+        with a site context, but can then be used from worker threads."""
+
+    __BUCKET_KEY = "fiscal_harmony_rate_limit:{}"
+    __METRICS_KEY = "fiscal_harmony_rate_limit_metrics:{}"
+    __SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local time = redis.call("TIME")
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+        local bucket = redis.call("HMGET", KEYS[1], "tokens", "timestamp")
+        local tokens = tonumber(bucket[1]) or burst
+        local timestamp = tonumber(bucket[2]) or now
+
+        -- Refill for the time elapsed, then take a token. A negative balance is a reservation.
+        tokens = math.min(burst, tokens + math.max(0, now - timestamp) * rate) - 1
+        local wait = 0
+        if tokens < 0 then
+            wait = -tokens / rate
+        end
+
+        redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "timestamp", tostring(now))
+        redis.call("EXPIRE", KEYS[1], math.ceil((burst - tokens) / rate) + 60)
+
+        redis.call("HINCRBY", KEYS[2], "requests", 1)
+        if wait > 0 then
+            redis.call("HINCRBY", KEYS[2], "throttled", 1)
+            redis.call("HINCRBYFLOAT", KEYS[2], "total_wait", wait)
+            if wait > (tonumber(redis.call("HGET", KEYS[2], "max_wait")) or 0) then
+                redis.call("HSET", KEYS[2], "max_wait", tostring(wait))
+            end
+        end
+
+        return tostring(wait)
+    """
+
+    def __init__(self, route_class: str, profile_name: str | None = None):
+        """Create a limiter for a route class.
+
+        Args:
+            route_class (str): One of `ROUTE_CLASSES`.
+            profile_name (str | None, optional): The Fiscal Harmony Profile sending the requests,\
+                or None for the default account. Defaults to None."""
+
+        self.route_class = route_class
+        self.requests_per_second, self.burst = get_limit(route_class, profile_name)
+        self.__keys = [
+            frappe.cache.make_key(
+                get_profile_key(
+                    RateLimiter.__BUCKET_KEY.format(route_class), profile_name
+                )
+            ),
+            RateLimiter.get_metrics_key(route_class, profile_name),
+        ]
+        self.__script = frappe.cache.register_script(RateLimiter.__SCRIPT)
+
+    def acquire(self) -> float:
+        """Wait until a request is allowed.
+
+        Returns:
+            float: The number of seconds waited."""
+
+        if not self.requests_per_second:
+            return 0.0
+
+        wait = float(
+            self.__script(
+                keys=self.__keys,
+                args=[self.requests_per_second, max(self.burst, 1)],
+            )
+        )
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+    @staticmethod
+    def get_metrics_key(route_class: str, profile_name: str | None = None) -> str:
+        """Get the Redis key of a route class's metrics.
+
+        Args:
+            route_class (str): One of `ROUTE_CLASSES`.
+            profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+                default account. Defaults to None.
+
+        Returns:
+            str: The Redis key."""
+
+        return frappe.cache.make_key(
+            get_profile_key(RateLimiter.__METRICS_KEY.format(route_class), profile_name)
+        )
+
+
+def get_limit(route_class: str, profile_name: str | None = None) -> tuple[float, int]:
+    """Get the rate limit of a route class.
+
+    A profile without a limit for the route class uses the one in the settings.
+
+    Args:
+        route_class (str): One of `ROUTE_CLASSES`.
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None.
+
+    Returns:
+        tuple[float, int]: Requests per second (0 for no limit) and the burst size."""
+
+    accounts: list[FiscalHarmonySettings] = [
+        frappe.get_cached_doc("Fiscal Harmony Settings")
+    ]
+    if profile_name:
+        accounts.insert(
+            0, frappe.get_cached_doc("Fiscal Harmony Profile", profile_name)
+        )
+
+    for account in accounts:
+        for rate_limit in account.rate_limits:
+            if rate_limit.route_class == route_class:
+                return rate_limit.requests_per_second, rate_limit.burst
+
+    return DEFAULT_LIMITS.get(route_class, DEFAULT_LIMITS["Other"])
+
+
+@frappe.whitelist()
+def get_rate_limit_metrics(profile_name: str | None = None) -> dict[str, dict]:
+    """Get the request and wait time counters of every route class.
+
+    Args:
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None.
+
+    Returns:
+        dict[str, dict]: The limit, number of requests, number that had to wait, and the total,\
+            average and longest waits in seconds, by route class."""
+
+    frappe.only_for("System Manager")
+
+    pipeline = frappe.cache.pipeline()
+    for route_class in ROUTE_CLASSES:
+        pipeline.hgetall(RateLimiter.get_metrics_key(route_class, profile_name))
+
+    metrics = {}
+    for route_class, counters in zip(ROUTE_CLASSES, pipeline.execute()):
+        counters = {key.decode(): float(value) for key, value in counters.items()}
+        requests_per_second, burst = get_limit(route_class, profile_name)
+        throttled = int(counters.get("throttled", 0))
+        total_wait = counters.get("total_wait", 0.0)
+
+        metrics[route_class] = {
+            "requests_per_second": requests_per_second,
+            "burst": burst,
+            "requests": int(counters.get("requests", 0)),
+            "throttled": throttled,
+            "total_wait": round(total_wait, 3),
+            "average_wait": round(total_wait / throttled, 3) if throttled else 0.0,
+            "max_wait": round(counters.get("max_wait", 0.0), 3),
+        }
+
+    return metrics
+
+
+@frappe.whitelist()
+def reset_rate_limit_metrics(profile_name: str | None = None):
+    """Clear the request and wait time counters of every route class.
+
+    Args:
+        profile_name (str | None, optional): The Fiscal Harmony Profile, or None for the\
+            default account. Defaults to None."""
+
+    frappe.only_for("System Manager")
+
+    pipeline = frappe.cache.pipeline()
+    for route_class in ROUTE_CLASSES:
+        pipeline.delete(RateLimiter.get_metrics_key(route_class, profile_name))
+    pipeline.execute()
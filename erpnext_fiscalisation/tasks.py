@@ -0,0 +1,220 @@
+"""This module defines the scheduled jobs of the Fiscal Harmony integration."""
+
+import frappe
+from frappe.query_builder import DocType
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+from erpnext_fiscalisation.circuit_breaker import CircuitBreaker
+from erpnext_fiscalisation.profiles import get_profile, get_profile_key, get_profiles
+from erpnext_fiscalisation.unit_of_work import unit_of_work
+
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_harmony_settings.fiscal_harmony_settings import (
+    FiscalHarmonySettings,
+)
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.fiscal_signature import (
+    FiscalSignature,
+)
+
+__RECONCILE_CURSOR_KEY = "fiscal_harmony_reconcile_cursor"
+__RETRY_SLOTS_KEY = "fiscal_harmony_retry_slots"
+__RETRY_SLOTS_TTL = 15 * 60
+"""Lifetime of the in-flight retry counter, so slots leaked by killed workers are recovered."""
+
+
+def reconcile_pending_signatures():
+    """Fetch the fiscal data of signatures whose webhook never arrived.
+
+    Each run checks one batch of pending signatures older than the configured threshold, continuing
+    from a cursor over (creation, name) left by the previous run. Once the cursor catches up with
+    the threshold it starts again from the oldest pending signature. The status of each signature
+    is fetched with the account that fiscalised it."""
+
+    fiscal_settings: FiscalHarmonySettings = frappe.get_doc("Fiscal Harmony Settings")
+    if fiscal_settings.disabled:
+        return
+
+    batch_size = fiscal_settings.reconcile_batch_size or 50
+    threshold = add_to_date(
+        now_datetime(),
+        minutes=-(fiscal_settings.reconcile_pending_after or 30),
+    )
+
+    cursor = frappe.db.get_global(__RECONCILE_CURSOR_KEY)
+    cursor_creation, cursor_name = cursor.split("|", 1) if cursor else (None, "")
+
+    signatures = DocType("Fiscal Signature")
+    query = (
+        frappe.qb.from_(signatures)
+        .select(signatures.name, signatures.creation, signatures.fiscal_profile)
+        .where(signatures.state == "Pending FH Response")
+        .where(signatures.creation < threshold)
+        .where(signatures.fiscal_harmony_id.isnotnull())
+        .orderby(signatures.creation)
+        .orderby(signatures.name)
+        .limit(batch_size)
+    )
+    if cursor_creation:
+        cursor_creation = get_datetime(cursor_creation)
+        query = query.where(
+            (signatures.creation > cursor_creation)
+            | (
+                (signatures.creation == cursor_creation)
+                & (signatures.name > cursor_name)
+            )
+        )
+
+    rows = query.run(as_dict=True)
+
+    pending: dict[str | None, list[FiscalSignature]] = {}
+    for row in rows:
+        pending.setdefault(row.fiscal_profile, []).append(
+            frappe.get_doc("Fiscal Signature", row.name)
+        )
+    for profile_name, profile_signatures in pending.items():
+        # Accounts that aren't configured can't be polled.
+        profile = get_profile(profile_name)
+        if profile.api_key:
+            # Each request is committed on its own, so a failure polling one account doesn't roll
+            # back the results already fetched for the others.
+            with unit_of_work():
+                profile.fetch_signatures_data(profile_signatures)
+
+    with unit_of_work():
+        # Wrap around once the cursor has caught up with the threshold.
+        if len(rows) < batch_size:
+            frappe.db.set_global(__RECONCILE_CURSOR_KEY, None)
+        else:
+            last = rows[-1]
+            frappe.db.set_global(__RECONCILE_CURSOR_KEY, f"{last.creation}|{last.name}")
+
+
+def retry_failed_signatures():
+    """Queue automatic retries for signatures that are due, within the concurrency limit.
+
+    Only transport failures are retried automatically. Errors reported by Fiscal Harmony need
+    the user to act on them first, so those signatures are left for a manual retry. Each account
+    has its own concurrency slots, so a backlog in one doesn't hold up the others."""
+
+    fiscal_settings: FiscalHarmonySettings = frappe.get_doc("Fiscal Harmony Settings")
+    if fiscal_settings.disabled or not fiscal_settings.auto_retry:
+        return
+
+    for profile in get_profiles():
+        if profile.api_key:
+            _retry_failed_signatures(
+                profile.get_profile_name(), fiscal_settings.retry_concurrency or 4
+            )
+
+
+def _retry_failed_signatures(profile_name: str | None, concurrency: int):
+    """Queue automatic retries for an account's signatures that are due.
+
+    Args:
+        profile_name (str | None): The Fiscal Harmony Profile, or None for the default account.
+        concurrency (int): Maximum number of retries in flight for the account."""
+
+    # Retries would only fail straight away while Fiscal Harmony is known to be down.
+    if CircuitBreaker(profile_name).is_open():
+        return
+
+    available = concurrency - _get_retry_slots_in_use(profile_name)
+    if available <= 0:
+        return
+
+    signatures = DocType("Fiscal Signature")
+    now = now_datetime()
+    names = (
+        frappe.qb.from_(signatures)
+        .select(signatures.name)
+        .where(signatures.state == "Needs Retry")
+        .where(signatures.next_retry_at.isnull() | (signatures.next_retry_at <= now))
+        .where(signatures.error.isnull() | (signatures.error == ""))
+        .where(
+            signatures.fiscal_profile == profile_name
+            if profile_name
+            else signatures.fiscal_profile.isnull()
+        )
+        .orderby(signatures.next_retry_at)
+        .orderby(signatures.creation)
+        .limit(available)
+    ).run(pluck=True)
+
+    for name in names:
+        if not _acquire_retry_slot(concurrency, profile_name):
+            break
+
+        job = frappe.enqueue(
+            retry_signature,
+            queue="short",
+            job_id=f"fiscal_harmony_retry::{name}",
+            deduplicate=True,
+            name=name,
+            profile_name=profile_name,
+        )
+        if not job:
+            _release_retry_slot(profile_name)
+
+
+def retry_signature(name: str, profile_name: str | None = None):
+    """Retry a single signature, releasing its concurrency slot when done.
+
+    Args:
+        name (str): Name of the Fiscal Signature.
+        profile_name (str | None, optional): The Fiscal Harmony Profile whose slot it holds, or\
+            None for the default account. Defaults to None."""
+
+    try:
+        signature: FiscalSignature = frappe.get_doc("Fiscal Signature", name)
+        if signature.is_retry and not signature.dead_letter:
+            with unit_of_work():
+                signature.retry_automatically()
+
+    finally:
+        _release_retry_slot(profile_name)
+
+
+def _get_retry_slots_in_use(profile_name: str | None) -> int:
+    """Count the automatic retries of an account currently in flight across all workers.
+
+    Args:
+        profile_name (str | None): The Fiscal Harmony Profile, or None for the default account.
+
+    Returns:
+        int: Number of slots in use."""
+
+    return int(
+        frappe.cache.get(
+            frappe.cache.make_key(get_profile_key(__RETRY_SLOTS_KEY, profile_name))
+        )
+        or 0
+    )
+
+
+def _acquire_retry_slot(concurrency: int, profile_name: str | None) -> bool:
+    """Take one of an account's shared retry slots.
+
+    Args:
+        concurrency (int): Maximum number of slots.
+        profile_name (str | None): The Fiscal Harmony Profile, or None for the default account.
+
+    Returns:
+        bool: Whether a slot was acquired."""
+
+    key = frappe.cache.make_key(get_profile_key(__RETRY_SLOTS_KEY, profile_name))
+    if frappe.cache.incr(key) > concurrency:
+        frappe.cache.decr(key)
+        return False
+
+    frappe.cache.expire(key, __RETRY_SLOTS_TTL)
+    return True
+
+
+def _release_retry_slot(profile_name: str | None):
+    """Return one of an account's shared retry slots.
+
+    Args:
+        profile_name (str | None): The profile, or None for the default account."""
+
+    key = frappe.cache.make_key(get_profile_key(__RETRY_SLOTS_KEY, profile_name))
+    if frappe.cache.decr(key) < 0:
+        frappe.cache.set(key, 0)
@@ -0,0 +1 @@
+"""Tools for testing the Fiscal Harmony integration without the real platform."""
@@ -0,0 +1,489 @@
+"""A local stand-in for the Fiscal Harmony platform, for integration and load testing.
+
+It implements the routes used by the integration, checks the API key and request signatures the
+same way Fiscal Harmony does, and posts signed fiscal results back to `capture_signatures`. Latency
+and errors can be injected to see how the integration behaves under load or during an outage.
+
+Run with:
+    bench run-fiscal-harmony-stand-in --api-key test --api-secret secret \
+        --webhook-url http://localhost:8000/api/method/erpnext_fiscalisation.api.capture_signatures
+
+Then set the endpoint in Fiscal Harmony Settings to `http://localhost:8010/api`, which is only
+allowed in developer mode. The server doesn't need a site, and keeps its state in memory."""
+
+import base64
+from dataclasses import dataclass, field
+from datetime import datetime
+import hashlib
+import hmac
+import itertools
+import json
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+
+import requests
+from werkzeug.exceptions import HTTPException, NotFound
+from werkzeug.routing import Map, Rule
+from werkzeug.serving import BaseWSGIServer, make_server, run_simple
+from werkzeug.wrappers import Request, Response
+
+SUPPORTED_CURRENCIES = ["USD", "ZWG", "ZAR"]
+"""Currencies reported as supported, padded like Fiscal Harmony pads them."""
+
+SAMPLE_PDF = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+"""A blank one page PDF returned for every download."""
+
+
+def sign_payload(payload: str, api_secret: str) -> str:
+    """Sign a payload the same way as Fiscal Harmony and Fiscal Harmony Settings.
+
+    Args:
+        payload (str): The payload to sign.
+        api_secret (str): The API secret.
+
+    Returns:
+        str: The base64 encoded HMAC-SHA256 signature."""
+
+    hasher = hmac.new(
+        api_secret.encode("utf-8"),
+        msg=payload.encode("utf-8"),
+        digestmod=hashlib.sha256,
+    )
+
+    return base64.b64encode(hasher.digest()).decode("utf-8")
+
+
+@dataclass
+class StandInConfig:
+    """Settings of the stand-in server."""
+
+    api_key: str
+    api_secret: str
+    webhook_url: str | None = None
+    prefix: str = "/api"
+    latency: float = 0.0
+    """Seconds added to every response."""
+    jitter: float = 0.0
+    """Random extra seconds, up to this much, added to every response."""
+    error_rate: float = 0.0
+    """Fraction of requests answered with `error_status` instead of being processed."""
+    error_status: int = 503
+    webhook_delay: float = 0.5
+    """Seconds between accepting a transaction and posting its result."""
+    webhook_batch_size: int = 20
+    webhook_drop_rate: float = 0.0
+    """Fraction of results that are never posted, to exercise reconciliation."""
+    fail_rate: float = 0.0
+    """Fraction of transactions that are rejected by the fiscal device."""
+    device_id: int = 12345
+    fiscal_day: int = 1
+    fiscal_day_status: str = "FiscalDayOpened"
+
+
+@dataclass
+class _Transaction:
+    """A transaction received by the stand-in and its fiscal result."""
+
+    request_id: str
+    document_id: str
+    result: dict = field(default_factory=dict)
+
+
+class FiscalHarmonyStandIn:
+    """A WSGI application standing in for the Fiscal Harmony API.
+
+    All state is kept in memory behind a lock, so a threaded server can serve it."""
+
+    def __init__(self, config: StandInConfig):
+        """Create the stand-in.
+
+        Args:
+            config (StandInConfig): The server settings."""
+
+        self.config = config
+        self.__lock = threading.Lock()
+        self.__ids = itertools.count(1)
+        self.__invoice_numbers = itertools.count(1)
+        self.__transactions: dict[str, _Transaction] = {}
+        self.__by_document: dict[str, str] = {}
+        self.__mappings: dict[str, dict[int, dict]] = {"currency": {}, "tax": {}}
+        self.__stats: dict[str, int] = {}
+        self.__webhooks: queue.Queue[tuple[float, dict]] = queue.Queue()
+
+        prefix = config.prefix.rstrip("/")
+        self.__urls = Map(
+            [
+                Rule(f"{prefix}/invoice", endpoint="invoice", methods=["POST"]),
+                Rule(f"{prefix}/creditnote", endpoint="credit_note", methods=["POST"]),
+                Rule(f"{prefix}/status", endpoint="status", methods=["POST"]),
+                Rule(f"{prefix}/download/<filename>", endpoint="download"),
+                Rule(f"{prefix}/profile", endpoint="profile"),
+                Rule(f"{prefix}/fiscaldevice", endpoint="fiscal_device"),
+                Rule(
+                    f"{prefix}/currencymapping/supported-currencies",
+                    endpoint="supported_currencies",
+                ),
+                Rule(
+                    f"{prefix}/<any(currency, tax):kind>mapping",
+                    endpoint="mappings",
+                    methods=["GET", "POST"],
+                ),
+                Rule(
+                    f"{prefix}/<any(currency, tax):kind>mapping/<int:mapping_id>",
+                    endpoint="mapping",
+                    methods=["GET", "PUT", "DELETE"],
+                ),
+                Rule("/_stand-in/stats", endpoint="stats"),
+            ]
+        )
+
+        if config.webhook_url:
+            threading.Thread(target=self.__post_webhooks, daemon=True).start()
+
+    def __call__(self, environ, start_response):
+        return self.__dispatch(Request(environ))(environ, start_response)
+
+    def get_stats(self) -> dict[str, int]:
+        """Get the request, error and webhook counters.
+
+        Returns:
+            dict[str, int]: The counters by name."""
+
+        with self.__lock:
+            return dict(self.__stats)
+
+    def get_results(self, request_ids: list[str]) -> list[dict]:
+        """Get the fiscal results of transactions, skipping unknown request IDs.
+
+        Args:
+            request_ids (list[str]): The request IDs returned when the transactions were sent.
+
+        Returns:
+            list[dict]: The results, as posted to the webhook."""
+
+        with self.__lock:
+            return [
+                self.__transactions[str(request_id)].result
+                for request_id in request_ids
+                if str(request_id) in self.__transactions
+            ]
+
+    def build_webhook(self, results: list[dict]) -> tuple[str, dict[str, str]]:
+        """Build the body and signed headers of a webhook request posting results.
+
+        Args:
+            results (list[dict]): The fiscal results.
+
+        Returns:
+            tuple[str, dict[str, str]]: The body and the headers."""
+
+        body = json.dumps(results, separators=(",", ":"))
+        headers = {
+            "Content-Type": "application/json",
+            "X-Api-Signature": self.sign(body),
+        }
+
+        return body, headers
+
+    def sign(self, payload: str) -> str:
+        """Sign a payload the same way as Fiscal Harmony Settings.
+
+        Args:
+            payload (str): The payload to sign.
+
+        Returns:
+            str: The base64 encoded HMAC-SHA256 signature."""
+
+        return sign_payload(payload, self.config.api_secret)
+
+    def __dispatch(self, request: Request) -> Response:
+        """Check, delay and route a request.
+
+        Args:
+            request (Request): The incoming request.
+
+        Returns:
+            Response: The response to send."""
+
+        try:
+            endpoint, values = self.__urls.bind_to_environ(request.environ).match()
+        except HTTPException as exc:
+            return exc
+
+        if endpoint == "stats":
+            return self.__json(self.get_stats())
+
+        self.__count(f"requests.{endpoint}")
+        delay = self.config.latency + random.uniform(0, self.config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < self.config.error_rate:
+            self.__count("errors.injected")
+            return self.__json(
+                {"error": "Injected error"}, status=self.config.error_status
+            )
+
+        if request.headers.get("X-Api-Key") != self.config.api_key:
+            self.__count("errors.unauthorised")
+            return self.__json({"error": "Invalid API key"}, status=401)
+
+        body = request.get_data(as_text=True)
+        if body and request.headers.get("X-Api-Signature") != self.sign(body):
+            self.__count("errors.signature")
+            return self.__json({"error": "Invalid signature"}, status=401)
+
+        try:
+            data = json.loads(body) if body else None
+            return getattr(self, f"_route_{endpoint}")(request.method, data, **values)
+
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as exc:
+            self.__count("errors.invalid")
+            return self.__json({"error": f"Invalid request: {exc}"}, status=400)
+
+        except HTTPException as exc:
+            return exc
+
+    def _route_invoice(self, method: str, data: dict) -> Response:
+        return self.__accept(data, data["InvoiceId"])
+
+    def _route_credit_note(self, method: str, data: dict) -> Response:
+        return self.__accept(data, data["CreditNoteId"])
+
+    def _route_status(self, method: str, data: list[str]) -> Response:
+        return self.__json(self.get_results(data))
+
+    def _route_download(self, method: str, data: None, filename: str) -> Response:
+        return Response(SAMPLE_PDF, mimetype="application/pdf")
+
+    def _route_profile(self, method: str, data: None) -> Response:
+        return self.__json({"Id": 1, "Name": "Stand-in Profile"})
+
+    def _route_fiscal_device(self, method: str, data: None) -> Response:
+        return self.__json(
+            {
+                "DeviceId": self.config.device_id,
+                "Status": json.dumps(
+                    {
+                        "FiscalDayStatus": self.config.fiscal_day_status,
+                        "LastFiscalDayNo": self.config.fiscal_day,
+                    }
+                ),
+            }
+        )
+
+    def _route_supported_currencies(self, method: str, data: None) -> Response:
+        return self.__json([f"{currency} " for currency in SUPPORTED_CURRENCIES])
+
+    def _route_mappings(self, method: str, data: dict | None, kind: str) -> Response:
+        with self.__lock:
+            if method == "GET":
+                return self.__json(list(self.__mappings[kind].values()))
+
+            mapping_id = next(self.__ids)
+            self.__mappings[kind][mapping_id] = {**data, "Id": mapping_id}
+
+            return self.__json(self.__mappings[kind][mapping_id], status=201)
+
+    def _route_mapping(
+        self, method: str, data: dict | None, kind: str, mapping_id: int
+    ) -> Response:
+        with self.__lock:
+            if mapping_id not in self.__mappings[kind]:
+                raise NotFound()
+
+            if method == "PUT":
+                self.__mappings[kind][mapping_id] = {**data, "Id": mapping_id}
+            elif method == "DELETE":
+                del self.__mappings[kind][mapping_id]
+                return Response(status=204)
+
+            return self.__json(self.__mappings[kind][mapping_id])
+
+    def __accept(self, data: dict, document_id: str) -> Response:
+        """Accept an invoice or credit note and queue its result for the webhook.
+
+        Sending the same document again returns the request ID it was first given.
+
+        Args:
+            data (dict): The transaction payload.
+            document_id (str): The invoice or credit note ID.
+
+        Returns:
+            Response: The request ID, as Fiscal Harmony returns it."""
+
+        missing = [
+            key
+            for key in ("LineItems", "CurrencyCode", "Total", "BuyerContact")
+            if key not in data
+        ]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+
+        with self.__lock:
+            if document_id in self.__by_document:
+                return Response(self.__by_document[document_id])
+
+            request_id = str(next(self.__ids))
+            transaction = _Transaction(request_id, document_id)
+            original_id = data.get("OriginalInvoiceId")
+            if original_id and original_id not in self.__by_document:
+                transaction.result = self.__get_result(
+                    request_id, f"Original invoice {original_id} was not fiscalised."
+                )
+            elif random.random() < self.config.fail_rate:
+                transaction.result = self.__get_result(
+                    request_id, "Injected fiscal device error."
+                )
+            else:
+                transaction.result = self.__get_result(request_id)
+
+            self.__transactions[request_id] = transaction
+            self.__by_document[document_id] = request_id
+
+        self.__count("transactions")
+        if self.config.webhook_url:
+            if random.random() < self.config.webhook_drop_rate:
+                self.__count("webhooks.dropped")
+            else:
+                self.__webhooks.put(
+                    (time.monotonic() + self.config.webhook_delay, transaction.result)
+                )
+
+        return Response(request_id)
+
+    def __get_result(self, request_id: str, error: str | None = None) -> dict:
+        """Build the fiscal result of a transaction.
+
+        Args:
+            request_id (str): The request ID.
+            error (str | None, optional): The error, if the transaction was rejected.\
+                Defaults to None.
+
+        Returns:
+            dict: The result, as posted to the webhook and returned by the status route."""
+
+        if error:
+            return {
+                "RequestId": request_id,
+                "Success": False,
+                "IsActionable": True,
+                "Error": error,
+                "QrData": None,
+                "FiscalInvoicePdf": None,
+            }
+
+        invoice_number = next(self.__invoice_numbers)
+        code = secrets.token_hex(8).upper()
+        date = datetime.now().strftime("%d%m%Y")
+
+        return {
+            "RequestId": request_id,
+            "Success": True,
+            "IsActionable": False,
+            "Error": None,
+            "QrData": {
+                "QrCodeUrl": (
+                    f"https://fdmstest.zimra.co.zw/{self.config.device_id:010d}/{date}"
+                    f"/{invoice_number:010d}/{code}"
+                ),
+                "VerificationCode": "-".join(re.findall("....", code)),
+                "FiscalDay": self.config.fiscal_day,
+                "DeviceId": self.config.device_id,
+                "InvoiceNumber": invoice_number,
+            },
+            "FiscalInvoicePdf": f"{request_id}.pdf",
+        }
+
+    def __post_webhooks(self):
+        """Post queued results to the webhook in batches, once their delay has passed."""
+
+        while True:
+            due_at, result = self.__webhooks.get()
+            if (delay := due_at - time.monotonic()) > 0:
+                time.sleep(delay)
+
+            batch = [result]
+            while len(batch) < self.config.webhook_batch_size:
+                try:
+                    due_at, result = self.__webhooks.get_nowait()
+                except queue.Empty:
+                    break
+
+                if due_at > time.monotonic():
+                    self.__webhooks.put((due_at, result))
+                    break
+                batch.append(result)
+
+            self.__post_webhook(batch)
+
+    def __post_webhook(self, results: list[dict], attempts: int = 3):
+        """Post a batch of results to the webhook, signed with the API secret.
+
+        Args:
+            results (list[dict]): The fiscal results.
+            attempts (int, optional): Number of tries. Defaults to 3."""
+
+        body, headers = self.build_webhook(results)
+        for attempt in range(attempts):
+            try:
+                response = requests.post(
+                    self.config.webhook_url, data=body, headers=headers, timeout=30
+                )
+                if response.ok:
+                    self.__count("webhooks.sent")
+                    return
+
+            except requests.exceptions.RequestException:
+                pass
+
+            time.sleep(2**attempt)
+
+        self.__count("webhooks.failed")
+
+    def __count(self, name: str):
+        with self.__lock:
+            self.__stats[name] = self.__stats.get(name, 0) + 1
+
+    def __json(self, data, status: int = 200) -> Response:
+        return Response(json.dumps(data), status=status, mimetype="application/json")
+
+
+def serve(config: StandInConfig, host: str = "localhost", port: int = 8010):
+    """Serve the stand-in until interrupted.
+
+    Args:
+        config (StandInConfig): The server settings.
+        host (str, optional): The interface to listen on. Defaults to "localhost".
+        port (int, optional): The port to listen on. Defaults to 8010."""
+
+    run_simple(host, port, FiscalHarmonyStandIn(config), threaded=True)
+
+
+def start_in_background(
+    config: StandInConfig, host: str = "localhost"
+) -> tuple[FiscalHarmonyStandIn, BaseWSGIServer]:
+    """Serve the stand-in from a daemon thread, on a free port.
+
+    Args:
+        config (StandInConfig): The server settings.
+        host (str, optional): The interface to listen on. Defaults to "localhost".
+
+    Returns:
+        tuple[FiscalHarmonyStandIn, BaseWSGIServer]: The stand-in and its server, which should\
+            be shut down when done."""
+
+    stand_in = FiscalHarmonyStandIn(config)
+    server = make_server(host, 0, stand_in, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return stand_in, server
@@ -0,0 +1,387 @@
+"""Record real Fiscal Harmony traffic from the logs and replay it against the local stand-in.
+
+`export_trace` writes the requests logged in a time window to a gzipped JSON lines trace, with
+the buyer details anonymised by default. `replay_trace` sends them to the stand-in with their
+original spacing, optionally sped up, and compares each response with the one that was logged.
+
+Run with:
+    bench --site <site> export-fiscal-harmony-trace --from "2025-10-01 08:00" \
+        --to "2025-10-01 17:00" --output traffic.jsonl.gz
+    bench replay-fiscal-harmony-trace traffic.jsonl.gz --rate 10 --output replay.json
+
+The log doesn't record the HTTP method, so it is inferred from the route and payload. Request and
+mapping IDs in the trace are replaced by the IDs the stand-in gives out as the replay goes."""
+
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from erpnext_fiscalisation.testing.fiscal_harmony_server import (
+    StandInConfig,
+    sign_payload,
+    start_in_background,
+)
+
+TRACE_VERSION = 1
+
+REPLAY_API_KEY = "replay"
+REPLAY_API_SECRET = "replay"
+
+ANONYMISED_FIELDS = ("Name", "TradeName", "Phone", "Email", "Tin", "VatNumber")
+"""Buyer contact fields replaced by a stable token when anonymising."""
+
+MAPPING_ROUTE = re.compile(r"^(/(?:currency|tax)mapping/)(\d+)$")
+"""Routes of a single mapping, whose ID is given out by Fiscal Harmony."""
+
+
+def export_trace(
+    from_datetime: str, to_datetime: str, path: str, anonymise: bool = True
+) -> int:
+    """Export the requests logged in a time window to a trace file.
+
+    Args:
+        from_datetime (str): Start of the window.
+        to_datetime (str): End of the window.
+        path (str): The trace file to write, gzipped JSON lines.
+        anonymise (bool, optional): Whether to replace the buyer details in payloads.\
+            Defaults to True.
+
+    Returns:
+        int: The number of requests exported."""
+
+    import frappe
+
+    logs = frappe.get_all(
+        "Fiscal Harmony Log",
+        filters={"creation": ["between", [from_datetime, to_datetime]]},
+        fields=[
+            "creation",
+            "request_url",
+            "payload",
+            "response",
+            "response_status_code",
+            "status",
+        ],
+        order_by="creation asc",
+    )
+
+    count = 0
+    start = None
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(
+            json.dumps(
+                {
+                    "version": TRACE_VERSION,
+                    "site": frappe.local.site,
+                    "from": str(from_datetime),
+                    "to": str(to_datetime),
+                    "anonymised": anonymise,
+                }
+            )
+            + "\n"
+        )
+
+        for log in logs:
+            request = _to_request(log, anonymise)
+            if request is None:
+                continue
+
+            start = start or log.creation
+            request["at"] = round((log.creation - start).total_seconds(), 3)
+            f.write(json.dumps(request, separators=(",", ":")) + "\n")
+            count += 1
+
+    return count
+
+
+def replay_trace(
+    path: str,
+    rate: float = 1.0,
+    workers: int = 16,
+    endpoint: str | None = None,
+    api_key: str = REPLAY_API_KEY,
+    api_secret: str = REPLAY_API_SECRET,
+    output: str | None = None,
+) -> dict:
+    """Replay a trace and compare the responses with the logged ones.
+
+    Args:
+        path (str): The trace file.
+        rate (float, optional): How many times faster than recorded to send the requests.\
+            Defaults to 1.0.
+        workers (int, optional): Maximum number of requests in flight. Defaults to 16.
+        endpoint (str | None, optional): The stand-in to replay against. One is started if\
+            not given. Defaults to None.
+        api_key (str, optional): The API key of the stand-in. Defaults to "replay".
+        api_secret (str, optional): The API secret of the stand-in. Defaults to "replay".
+        output (str | None, optional): A file to write the results to as JSON.\
+            Defaults to None.
+
+    Returns:
+        dict: The number of requests, matches and mismatches, and the latencies."""
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version {header.get('version')}.")
+
+        trace = [json.loads(line) for line in f if line.strip()]
+
+    server = None
+    if endpoint is None:
+        _, server = start_in_background(
+            StandInConfig(api_key=api_key, api_secret=api_secret)
+        )
+        endpoint = f"http://localhost:{server.server_port}/api"
+
+    replayer = _Replayer(endpoint, api_key, api_secret)
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for request in trace:
+                if (delay := start + request["at"] / rate - time.monotonic()) > 0:
+                    time.sleep(delay)
+                futures.append(
+                    executor.submit(
+                        replayer.send, request, start + request["at"] / rate
+                    )
+                )
+
+            outcomes = [future.result() for future in futures]
+
+    finally:
+        if server:
+            server.shutdown()
+
+    elapsed = time.monotonic() - start
+    results = _summarise(header, outcomes, elapsed, rate)
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return results
+
+
+class _Replayer:
+    """Sends traced requests, translating the IDs given out by Fiscal Harmony as it goes."""
+
+    def __init__(self, endpoint: str, api_key: str, api_secret: str):
+        self.endpoint = endpoint.rstrip("/")
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.__ids: dict[str, str] = {}
+        self.__lock = threading.Lock()
+        self.__session = requests.Session()
+
+    def send(self, request: dict, scheduled_at: float) -> dict:
+        """Send a traced request.
+
+        Args:
+            request (dict): The traced request.
+            scheduled_at (float): The monotonic time it was due to be sent.
+
+        Returns:
+            dict: The route, logged and new status codes, latency and lag."""
+
+        route = request["route"]
+        payload = request.get("payload")
+        if match := MAPPING_ROUTE.match(route):
+            route = match.group(1) + self.__translate(match.group(2))
+        if route == "/status" and payload:
+            payload = json.dumps(
+                [self.__translate(request_id) for request_id in json.loads(payload)],
+                separators=(",", ":"),
+                sort_keys=True,
+            )
+
+        headers = {"X-Api-Key": self.api_key}
+        if payload:
+            headers["Content-Type"] = "application/json"
+            headers["X-Api-Signature"] = sign_payload(payload, self.api_secret)
+
+        sent_at = time.monotonic()
+        try:
+            response = self.__session.request(
+                request["method"],
+                self.endpoint + route,
+                data=payload,
+                headers=headers,
+                timeout=30,
+            )
+            status_code = response.status_code
+
+        except requests.exceptions.RequestException:
+            response = None
+            status_code = None
+
+        latency = time.monotonic() - sent_at
+
+        if response is not None and response.ok and request.get("response_id"):
+            if route in ("/invoice", "/creditnote"):
+                new_id = response.text
+            else:
+                new_id = str(response.json().get("Id"))
+
+            with self.__lock:
+                self.__ids[request["response_id"]] = new_id
+
+        return {
+            "method": request["method"],
+            "route": re.sub(r"/[^/]*\d[^/]*$", "/<id>", request["route"]),
+            "expected": request.get("status_code"),
+            "actual": status_code,
+            "latency": latency,
+            "lag": max(sent_at - scheduled_at, 0.0),
+        }
+
+    def __translate(self, original_id: str) -> str:
+        with self.__lock:
+            return self.__ids.get(str(original_id), str(original_id))
+
+
+def _to_request(log: dict, anonymise: bool) -> dict | None:
+    """Convert a log entry into a traced request.
+
+    Args:
+        log (dict): The log entry.
+        anonymise (bool): Whether to replace the buyer details in the payload.
+
+    Returns:
+        dict | None: The traced request, or None if the log isn't of a request to Fiscal\
+            Harmony."""
+
+    if not log.request_url or "/api/method/" in log.request_url:
+        return None
+
+    # The endpoint has a single path segment, and everything after it is the route.
+    path = urlparse(log.request_url).path
+    route = "/" + path.lstrip("/").partition("/")[2]
+
+    payload = None
+    if log.payload:
+        try:
+            data = json.loads(log.payload)
+        except json.JSONDecodeError:
+            return None
+
+        if anonymise and isinstance(data, dict):
+            _anonymise(data)
+        payload = json.dumps(data, separators=(",", ":"), sort_keys=True)
+
+    if payload:
+        method = "PUT" if MAPPING_ROUTE.match(route) else "POST"
+    else:
+        method = "DELETE" if MAPPING_ROUTE.match(route) else "GET"
+
+    request = {
+        "method": method,
+        "route": route,
+        "status_code": log.response_status_code,
+        "outcome": log.status,
+    }
+    if payload:
+        request["payload"] = payload
+
+    # Keep the IDs Fiscal Harmony gave out, so later requests using them can be translated.
+    if method == "POST" and log.response_status_code in (200, 201) and log.response:
+        try:
+            response = json.loads(log.response)
+        except json.JSONDecodeError:
+            response = None
+
+        if isinstance(response, dict) and response.get("Id"):
+            request["response_id"] = str(response["Id"])
+        elif isinstance(response, (int, str)) and route in ("/invoice", "/creditnote"):
+            request["response_id"] = str(response)
+
+    return request
+
+
+def _anonymise(data: dict):
+    """Replace the buyer details of a payload with stable tokens, in place.
+
+    Args:
+        data (dict): The invoice or credit note payload."""
+
+    buyer = data.get("BuyerContact")
+    if not isinstance(buyer, dict):
+        return
+
+    for field in ANONYMISED_FIELDS:
+        if buyer.get(field):
+            digest = hashlib.sha256(str(buyer[field]).encode("utf-8")).hexdigest()
+            buyer[field] = f"{field}-{digest[:12]}"
+
+
+def _summarise(header: dict, outcomes: list[dict], elapsed: float, rate: float) -> dict:
+    """Summarise the outcomes of a replay.
+
+    Args:
+        header (dict): The trace header.
+        outcomes (list[dict]): The outcome of each request.
+        elapsed (float): Seconds the replay took.
+        rate (float): The rate multiplier.
+
+    Returns:
+        dict: The summary."""
+
+    def succeeded(status_code: int | None) -> bool:
+        return status_code is not None and 200 <= status_code < 300
+
+    mismatches: dict[str, int] = {}
+    by_route: dict[str, list[float]] = {}
+    for outcome in outcomes:
+        key = f"{outcome['method']} {outcome['route']}"
+        by_route.setdefault(key, []).append(outcome["latency"])
+        if succeeded(outcome["expected"]) != succeeded(outcome["actual"]):
+            mismatch = f"{key}: {outcome['expected']} -> {outcome['actual']}"
+            mismatches[mismatch] = mismatches.get(mismatch, 0) + 1
+
+    return {
+        "trace": header,
+        "rate": rate,
+        "requests": len(outcomes),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(len(outcomes) / elapsed, 2) if elapsed else 0.0,
+        "matched": len(outcomes) - sum(mismatches.values()),
+        "mismatches": mismatches,
+        "max_lag_ms": round(
+            max((outcome["lag"] for outcome in outcomes), default=0.0) * 1000, 2
+        ),
+        "latency": {
+            key: _percentiles(latencies) for key, latencies in sorted(by_route.items())
+        },
+    }
+
+
+def _percentiles(latencies: list[float]) -> dict:
+    """Summarise latencies.
+
+    Args:
+        latencies (list[float]): Latencies in seconds.
+
+    Returns:
+        dict: The count, and the p50, p90, p99 and maximum in milliseconds."""
+
+    latencies = sorted(latencies)
+
+    def percentile(pct: float) -> float:
+        index = max(math.ceil(pct / 100 * len(latencies)) - 1, 0)
+        return round(latencies[index] * 1000, 2)
+
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
@@ -0,0 +1,179 @@
+"""This module provides the test case shared by tests that talk to the Fiscal Harmony stand-in.
+
+The stand-in is served from a background thread on a free port, and Fiscal Harmony Settings is
+pointed at it for the duration of the test case. Signatures are created for draft invoices, and
+their payloads are replaced with a minimal one the stand-in accepts, so the tests don't need
+fully configured invoices, customers or tax templates. The code under test commits, so the
+records a test creates are deleted after it, rather than left to the rollback."""
+
+from unittest.mock import patch
+
+import frappe
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import (
+    create_sales_invoice,
+)
+from frappe.tests.utils import FrappeTestCase
+
+from erpnext_fiscalisation.fiscal_harmony_integration.doctype.fiscal_signature.fiscal_signature import (
+    FiscalSignature,
+)
+from erpnext_fiscalisation.testing.fiscal_harmony_server import (
+    FiscalHarmonyStandIn,
+    StandInConfig,
+    start_in_background,
+)
+
+API_KEY = "0123456789ABCDEF0123456789ABCDEF"
+API_SECRET = "c3RhbmQtaW4="
+
+
+class StandInTestCase(FrappeTestCase):
+    """A test case with Fiscal Harmony Settings pointed at a local stand-in.
+
+    Each test starts with closed breakers and a stand-in that accepts every request."""
+
+    stand_in: FiscalHarmonyStandIn
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.stand_in, cls.__server = start_in_background(
+            StandInConfig(api_key=API_KEY, api_secret=API_SECRET)
+        )
+
+        # A local endpoint is only allowed in developer mode.
+        cls.__developer_mode = patch.dict(frappe.conf, {"developer_mode": 1})
+        cls.__developer_mode.start()
+
+        settings = {
+            "disabled": 0,
+            "endpoint": f"http://localhost:{cls.__server.server_port}/api",
+            "api_key": API_KEY,
+            "user_profile_id": "1",
+            "hold_when_device_down": 0,
+            "use_outbox": 0,
+            "auto_retry": 1,
+            "max_retry_attempts": 3,
+            "retry_base_delay": 60,
+            "retry_max_delay": 3600,
+            "circuit_failure_threshold": 100,
+            "circuit_open_seconds": 60,
+        }
+        cls.__previous_settings = {
+            fieldname: frappe.db.get_single_value("Fiscal Harmony Settings", fieldname)
+            for fieldname in settings
+        }
+
+        fiscal_settings = frappe.get_doc("Fiscal Harmony Settings")
+        fiscal_settings.update(
+            {
+                **settings,
+                "api_secret": API_SECRET,
+                "rate_limits": [],
+                "currency_mappings": [],
+                "tax_mappings": [],
+            }
+        )
+        fiscal_settings.save(ignore_permissions=True)
+        frappe.db.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.__server.shutdown()
+
+        # Other apps' tests submit invoices, which mustn't be sent to a stopped stand-in.
+        _set_settings(cls.__previous_settings)
+        cls.__developer_mode.stop()
+
+        super().tearDownClass()
+
+    def setUp(self):
+        frappe.cache.delete_keys("fiscal_harmony_circuit")
+        self.addCleanup(frappe.cache.delete_keys, "fiscal_harmony_circuit")
+
+        self.stand_in.config.error_rate = 0.0
+        self.stand_in.config.error_status = 503
+
+        payload = patch.object(
+            FiscalSignature, "get_payload_data", autospec=True, side_effect=get_payload
+        )
+        payload.start()
+        self.addCleanup(payload.stop)
+
+    def update_settings(self, **values):
+        """Update Fiscal Harmony Settings for the rest of the test.
+
+        Args:
+            **values: Field names mapped to their values."""
+
+        previous = {
+            fieldname: frappe.db.get_single_value("Fiscal Harmony Settings", fieldname)
+            for fieldname in values
+        }
+        self.addCleanup(_set_settings, previous)
+        _set_settings(values)
+
+    def make_signature(self, **values) -> FiscalSignature:
+        """Create a signature for a new draft invoice, without sending it. Both are deleted\
+            after the test.
+
+        Args:
+            **values: Field names mapped to their values.
+
+        Returns:
+            FiscalSignature: The signature."""
+
+        invoice = create_sales_invoice(do_not_submit=True)
+        self.addCleanup(_delete, "Sales Invoice", invoice.name)
+
+        signature: FiscalSignature = frappe.new_doc("Fiscal Signature")
+        signature.sales_invoice = invoice.name
+        signature.update(values)
+        with patch.object(FiscalSignature, "after_insert"):
+            signature.insert(ignore_permissions=True)
+        self.addCleanup(_delete, "Fiscal Signature", signature.name)
+
+        return signature
+
+
+def _delete(doctype: str, name: str):
+    """Delete a record created by a test, even if the test committed it.
+
+    Args:
+        doctype (str): The doctype of the record.
+        name (str): The name of the record."""
+
+    frappe.delete_doc(doctype, name, force=True, ignore_permissions=True)
+    frappe.db.commit()
+
+
+def _set_settings(values: dict):
+    """Write fields of Fiscal Harmony Settings straight away, and clear its cached document.
+
+    Args:
+        values (dict): Field names mapped to their values."""
+
+    for fieldname, value in values.items():
+        frappe.db.set_single_value("Fiscal Harmony Settings", fieldname, value)
+    frappe.db.commit()
+
+    frappe.clear_document_cache("Fiscal Harmony Settings", "Fiscal Harmony Settings")
+
+
+def get_payload(signature: FiscalSignature) -> dict:
+    """Build the smallest invoice payload the stand-in accepts.
+
+    Args:
+        signature (FiscalSignature): The signature being sent.
+
+    Returns:
+        dict: The payload."""
+
+    return {
+        "InvoiceId": signature.sales_invoice,
+        "CurrencyCode": "USD",
+        "Total": 0,
+        "LineItems": [],
+        "BuyerContact": {},
+    }
@@ -0,0 +1,97 @@
+"""This module batches the writes of one logical operation into a single commit.
+
+Inside `unit_of_work`, writes that would otherwise be committed straight away, such as logs and
+archive folders, are left for one commit at the end, and updates that only need to happen once,
+such as an account's last successful request, are deferred until then. If the operation fails,
+its writes are rolled back, but the logs written during it are written again and committed, so
+they are never lost with it. Nested units join the outermost one, which commits."""
+
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import frappe
+
+
+class _UnitOfWork:
+    """The callbacks registered during a unit of work."""
+
+    def __init__(self):
+        self.before_commit: dict[str, Callable[[], None]] = {}
+        self.after_rollback: list[Callable[[], None]] = []
+
+
+@contextmanager
+def unit_of_work() -> Iterator[None]:
+    """Commit everything written inside the block once, at the end of it.
+
+    Yields:
+        None: Nothing."""
+
+    if _get_unit() is not None:
+        yield
+        return
+
+    unit = frappe.local.fiscal_unit_of_work = _UnitOfWork()
+    try:
+        yield
+        for callback in unit.before_commit.values():
+            callback()
+
+    except BaseException:
+        frappe.local.fiscal_unit_of_work = None
+        frappe.db.rollback()
+
+        # Write the logs again in a unit of their own, so they are committed together.
+        frappe.local.fiscal_unit_of_work = _UnitOfWork()
+        try:
+            for callback in unit.after_rollback:
+                callback()
+            frappe.db.commit()
+        finally:
+            frappe.local.fiscal_unit_of_work = None
+
+        raise
+
+    frappe.local.fiscal_unit_of_work = None
+    frappe.db.commit()
+
+
+def commit():
+    """Commit now, unless inside a unit of work, which commits at its end."""
+
+    if _get_unit() is None:
+        frappe.db.commit()
+
+
+def before_commit(key: str, callback: Callable[[], None]):
+    """Run a callback just before the unit of work commits, or now if outside one.
+
+    Args:
+        key (str): Identifies the update. Only the last callback registered with a key is run.
+        callback (Callable[[], None]): The update."""
+
+    if (unit := _get_unit()) is None:
+        callback()
+    else:
+        unit.before_commit[key] = callback
+
+
+def after_rollback(callback: Callable[[], None]):
+    """Run a callback if the unit of work is rolled back, to write what must outlast a failure.
+
+    Outside a unit of work it does nothing, as the write has already been committed.
+
+    Args:
+        callback (Callable[[], None]): Writes the record again, without committing."""
+
+    if (unit := _get_unit()) is not None:
+        unit.after_rollback.append(callback)
+
+
+def _get_unit() -> _UnitOfWork | None:
+    """Get the unit of work of the current site context.
+
+    Returns:
+        _UnitOfWork | None: The unit of work, or None if outside one."""
+
+    return getattr(frappe.local, "fiscal_unit_of_work", None)